@@ -10,15 +10,20 @@ from __future__ import annotations
 
 import argparse
 import glob
+import os
 import re
 import sqlite3
 import sys
+from functools import partial
 from pathlib import Path
 from statistics import median, pstdev
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Tuple
 
 sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
 
+from telemetry_parser.db import touch_sessions
+from telemetry_parser.jobs import BackfillJob, print_summary, reset_job, run_job
+from telemetry_parser.personal_bests import init_personal_best_tables, rebuild_personal_bests
 from telemetry_parser.track_config import DEFAULT_MAX_TIMES, DEFAULT_MIN_TIMES, GLOBAL_MAX_LAP_TIME, GLOBAL_MIN_LAP_TIME
 
 
@@ -95,44 +100,164 @@ def _classify_from_laps(
 
 
 def _backfill_incidents_from_ibt(
-    conn: sqlite3.Connection,
     session_id: int,
     file_path: str,
+    reread_ibt: bool = True,
 ) -> Dict[int, int]:
     """Re-read PlayerIncidents from the IBT file and compute correct
-    per-lap incident counts using rising-edge detection."""
-    from telemetry_parser.ibt import IBTReader
-    from telemetry_parser.metrics import incident_counts
-    from telemetry_parser.segments import segment_laps
+    per-lap incident counts using rising-edge detection.
 
+    A missing file or missing channels give `{}` (stored counts are kept);
+    any other error propagates so the job records the session as failed.
+    """
+    from telemetry_parser.archive import open_telemetry
+    from telemetry_parser.channel_plan import plan_channels
+    from telemetry_parser.metrics import INCIDENT_STAGE, incident_counts
+    from telemetry_parser.segments import SEGMENT_STAGE, segment_laps
+
+    if not reread_ibt:
+        return {}
     path = Path(file_path)
     if not path.exists():
         return {}
 
-    try:
-        reader = IBTReader(str(path)).read()
-        channels = ['SessionTime', 'Lap', 'LapDistPct', 'LapLastLapTime', 'LapCompleted', 'PlayerIncidents']
-        missing = [ch for ch in channels if ch not in reader.var_by_name]
-        if missing:
-            return {}
-
-        data = {name: [] for name in channels}
-        for record in reader.iter_records(channels):
-            for name in channels:
-                data[name].append(record[name])
-
-        segments = segment_laps(
-            session_time=data['SessionTime'],
-            lap=data['Lap'],
-            lap_dist_pct=data['LapDistPct'],
-            lap_last_lap_time=data['LapLastLapTime'],
-            lap_completed=data['LapCompleted'],
+    reader = open_telemetry(str(path))
+    plan = plan_channels(reader.var_by_name, [], [SEGMENT_STAGE, INCIDENT_STAGE])
+    if plan.skipped:
+        return {}
+
+    data = plan.read(reader)
+
+    segments = segment_laps(
+        session_time=data['SessionTime'],
+        lap=data['Lap'],
+        lap_dist_pct=data['LapDistPct'],
+        lap_last_lap_time=data['LapLastLapTime'],
+        lap_completed=data['LapCompleted'],
+    )
+
+    return incident_counts(data['PlayerIncidents'], segments)
+
+
+def update_session(conn: sqlite3.Connection, session_id: int, incidents_from_ibt: Dict[int, int]) -> None:
+    """Recompute lap flags and clean metrics for one session (job apply step)."""
+    cur = conn.cursor()
+    cur.row_factory = sqlite3.Row
+    cur.execute("SELECT file_path FROM sessions WHERE id = ?", (session_id,))
+    file_path = cur.fetchone()["file_path"]
+
+    track = _track_from_filename(file_path)
+    min_time = _min_time_for_track(track)
+    max_time = _max_time_for_track(track)
+
+    # Load laps for this session
+    cur.execute(
+        """
+        SELECT id, lap_number, lap_time, is_complete, is_reset, start_time, end_time, incidents
+        FROM laps WHERE session_id = ?
+        ORDER BY lap_number
+        """,
+        (session_id,),
+    )
+    laps = [dict(row) for row in cur.fetchall()]
+
+    # Count ALL events per lap (for informational event_count column)
+    cur.execute(
+        """
+        SELECT lap_number, COUNT(*) as cnt
+        FROM events
+        WHERE session_id = ?
+        GROUP BY lap_number
+        """,
+        (session_id,),
+    )
+    all_events_per_lap: Dict[int, int] = {row["lap_number"]: row["cnt"] for row in cur.fetchall()}
+
+    # Count only serious events (spin, off_track) for clean determination
+    # big_save is informational only (aggressive cornering, not an incident)
+    cur.execute(
+        """
+        SELECT lap_number, COUNT(*) as cnt
+        FROM events
+        WHERE session_id = ? AND event_type IN ('spin', 'off_track')
+        GROUP BY lap_number
+        """,
+        (session_id,),
+    )
+    serious_per_lap: Dict[int, int] = {row["lap_number"]: row["cnt"] for row in cur.fetchall()}
+
+    # Update each lap
+    for lap in laps:
+        official = _has_official_time(lap)
+        lap["has_official_time"] = official
+
+        evt_count = all_events_per_lap.get(lap["lap_number"], 0)
+        lap["event_count"] = evt_count
+        serious = serious_per_lap.get(lap["lap_number"], 0)
+
+        # Update incidents from IBT re-read if available
+        inc = lap["incidents"]
+        if incidents_from_ibt and lap["lap_number"] in incidents_from_ibt:
+            inc = incidents_from_ibt[lap["lap_number"]]
+
+        # A lap is "clean" = a real, complete lap the driver actually drove.
+        # Incidents and events are tracked but do NOT exclude —
+        # they're part of the driver's real pace and belong in variance metrics.
+        # Only structural issues exclude: incomplete, reset, untimed, AFK.
+        is_clean = 1 if (
+            lap["is_complete"]
+            and not lap["is_reset"]
+            and official
+            and lap["lap_time"] >= min_time
+            and lap["lap_time"] <= max_time
+        ) else 0
+        lap["is_clean"] = is_clean
+
+        cur.execute(
+            "UPDATE laps SET is_clean = ?, has_official_time = ?, event_count = ?, incidents = ? WHERE id = ?",
+            (is_clean, 1 if official else 0, evt_count, inc, lap["id"]),
         )
 
-        return incident_counts(data['PlayerIncidents'], segments)
-    except Exception as e:
-        print(f"  Warning: could not re-read IBT for incidents: {e}")
-        return {}
+    # Compute clean metrics
+    clean_times = sorted(
+        l["lap_time"] for l in laps if l["is_clean"]
+    )
+
+    clean_best = min(clean_times) if clean_times else None
+    clean_median = median(clean_times) if clean_times else None
+    clean_stddev = pstdev(clean_times) if len(clean_times) > 1 else (0.0 if clean_times else None)
+    clean_count = len(clean_times)
+
+    # Classify session
+    session_type = _classify_from_laps(laps, min_time, max_time)
+
+    # Display track name (capitalized)
+    track_display = track.replace("-", " ").title() if track else None
+
+    cur.execute(
+        """
+        UPDATE sessions
+        SET track_name = ?,
+            car_name = ?,
+            clean_best_lap = ?,
+            clean_median_lap = ?,
+            clean_stddev_lap = ?,
+            clean_lap_count = ?,
+            classified_session_type = ?
+        WHERE id = ?
+        """,
+        (
+            track_display,
+            "Super Formula Lights",
+            clean_best,
+            clean_median,
+            clean_stddev,
+            clean_count,
+            session_type,
+            session_id,
+        ),
+    )
+    touch_sessions(conn, [session_id])
 
 
 def main() -> None:
@@ -140,6 +265,10 @@ def main() -> None:
     parser.add_argument("--db", default="data/telemetry.db", help="SQLite database path")
     parser.add_argument("--reread-ibt", action="store_true",
                         help="Re-read IBT files to fix PlayerIncidents counts (slower)")
+    parser.add_argument("--workers", type=int,
+                        help="Worker processes for IBT re-reads (default: CPU count with --reread-ibt, else inline)")
+    parser.add_argument("--retry-failed", action="store_true", help="Retry sessions that failed on a previous run")
+    parser.add_argument("--restart", action="store_true", help="Discard checkpoints and start over")
     args = parser.parse_args()
 
     conn = sqlite3.connect(args.db)
@@ -166,134 +295,32 @@ def main() -> None:
             pass
     conn.commit()
 
-    cur.execute("SELECT id, file_path FROM sessions")
-    sessions = cur.fetchall()
-    print(f"Processing {len(sessions)} sessions...")
-
-    updated = 0
-    for session in sessions:
-        session_id = session["id"]
-        file_path = session["file_path"]
-
-        track = _track_from_filename(file_path)
-        min_time = _min_time_for_track(track)
-        max_time = _max_time_for_track(track)
-
-        # Load laps for this session
-        cur.execute(
-            """
-            SELECT id, lap_number, lap_time, is_complete, is_reset, start_time, end_time, incidents
-            FROM laps WHERE session_id = ?
-            ORDER BY lap_number
-            """,
-            (session_id,),
-        )
-        laps = [dict(row) for row in cur.fetchall()]
-
-        # Count ALL events per lap (for informational event_count column)
-        cur.execute(
-            """
-            SELECT lap_number, COUNT(*) as cnt
-            FROM events
-            WHERE session_id = ?
-            GROUP BY lap_number
-            """,
-            (session_id,),
-        )
-        all_events_per_lap: Dict[int, int] = {row["lap_number"]: row["cnt"] for row in cur.fetchall()}
-
-        # Count only serious events (spin, off_track) for clean determination
-        # big_save is informational only (aggressive cornering, not an incident)
-        cur.execute(
-            """
-            SELECT lap_number, COUNT(*) as cnt
-            FROM events
-            WHERE session_id = ? AND event_type IN ('spin', 'off_track')
-            GROUP BY lap_number
-            """,
-            (session_id,),
-        )
-        serious_per_lap: Dict[int, int] = {row["lap_number"]: row["cnt"] for row in cur.fetchall()}
-
-        # Optionally re-read IBT files for correct incident counts
-        incidents_from_ibt: Dict[int, int] = {}
-        if args.reread_ibt:
-            incidents_from_ibt = _backfill_incidents_from_ibt(conn, session_id, file_path)
-
-        # Update each lap
-        for lap in laps:
-            official = _has_official_time(lap)
-            lap["has_official_time"] = official
-
-            evt_count = all_events_per_lap.get(lap["lap_number"], 0)
-            lap["event_count"] = evt_count
-            serious = serious_per_lap.get(lap["lap_number"], 0)
-
-            # Update incidents from IBT re-read if available
-            inc = lap["incidents"]
-            if incidents_from_ibt and lap["lap_number"] in incidents_from_ibt:
-                inc = incidents_from_ibt[lap["lap_number"]]
-
-            # A lap is "clean" = a real, complete lap the driver actually drove.
-            # Incidents and events are tracked but do NOT exclude —
-            # they're part of the driver's real pace and belong in variance metrics.
-            # Only structural issues exclude: incomplete, reset, untimed, AFK.
-            is_clean = 1 if (
-                lap["is_complete"]
-                and not lap["is_reset"]
-                and official
-                and lap["lap_time"] >= min_time
-                and lap["lap_time"] <= max_time
-            ) else 0
-            lap["is_clean"] = is_clean
-
-            cur.execute(
-                "UPDATE laps SET is_clean = ?, has_official_time = ?, event_count = ?, incidents = ? WHERE id = ?",
-                (is_clean, 1 if official else 0, evt_count, inc, lap["id"]),
-            )
-
-        # Compute clean metrics
-        clean_times = sorted(
-            l["lap_time"] for l in laps if l["is_clean"]
-        )
-
-        clean_best = min(clean_times) if clean_times else None
-        clean_median = median(clean_times) if clean_times else None
-        clean_stddev = pstdev(clean_times) if len(clean_times) > 1 else (0.0 if clean_times else None)
-        clean_count = len(clean_times)
-
-        # Classify session
-        session_type = _classify_from_laps(laps, min_time, max_time)
-
-        # Display track name (capitalized)
-        track_display = track.replace("-", " ").title() if track else None
-
-        cur.execute(
-            """
-            UPDATE sessions
-            SET track_name = ?,
-                car_name = ?,
-                clean_best_lap = ?,
-                clean_median_lap = ?,
-                clean_stddev_lap = ?,
-                clean_lap_count = ?,
-                classified_session_type = ?
-            WHERE id = ?
-            """,
-            (
-                track_display,
-                "Super Formula Lights",
-                clean_best,
-                clean_median,
-                clean_stddev,
-                clean_count,
-                session_type,
-                session_id,
-            ),
-        )
-        updated += 1
-
-    conn.commit()
+    def select_sessions(conn: sqlite3.Connection) -> List[Tuple[int, str]]:
+        rows = conn.execute("SELECT id, file_path FROM sessions ORDER BY id").fetchall()
+        return [(row[0], row[1]) for row in rows]
+
+    job = BackfillJob(
+        name="backfill_clean_metrics",
+        select_sessions=select_sessions,
+        process=partial(_backfill_incidents_from_ibt, reread_ibt=args.reread_ibt),
+        apply=update_session,
+    )
+    workers = args.workers
+    if workers is None:
+        workers = (os.cpu_count() or 1) if args.reread_ibt else 0
+
+    if args.restart:
+        reset_job(conn, job.name)
+    print(f"Processing {len(select_sessions(conn))} sessions...")
+    summary = run_job(conn, job, workers=workers, retry_failed=args.retry_failed, progress_every=100)
+    print_summary(job, summary)
+    updated = summary.done
+
+    # Clean flags may have moved; replay the personal-best index from the updated laps
+    if updated:
+        init_personal_best_tables(conn)
+        rebuild_personal_bests(conn)
+        conn.commit()
 
     # Print summary
     cur.execute("SELECT COUNT(*) FROM laps WHERE is_clean = 1")
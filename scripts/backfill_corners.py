@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""Backfill corner speed profiles, derive missing corner indexes and
+measure per-corner metrics for existing sessions.
+
+Sessions ingested before corners existed (or before their track had
+enough laps for an index) are read from their `.ibt` twice: once for the
+speed profile, once more for the lap metrics after the track's index has
+been derived. Tracks whose pooled laps have doubled since their index was
+derived (`corners.INDEX_REFRESH_GROWTH`), and with --rebuild-index every
+selected track, get their corners re-derived from all stored profiles and
+all their laps measured again.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sqlite3
+import sys
+from functools import partial
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from telemetry_parser.archive import open_telemetry
+from telemetry_parser.channel_plan import plan_channels
+from telemetry_parser.corners import (
+    CORNER_PROFILE_STAGE,
+    MIN_PROFILE_LAPS,
+    Corner,
+    CornerMetrics,
+    derive_corners,
+    index_due_for_refresh,
+    load_corner_index,
+    read_corner_metrics,
+    rebuild_corner_index,
+    session_speed_profile,
+    store_corner_index,
+    store_corner_profile,
+    store_lap_corners,
+    track_profile_laps,
+    track_speed_profile,
+)
+from telemetry_parser.db import get_lap_id_map, init_db
+from telemetry_parser.jobs import BackfillJob, print_summary, reset_job, run_job
+from telemetry_parser.segments import SEGMENT_STAGE, segment_laps
+
+
+def read_profile(
+    bounds: Dict[int, Tuple[float, float]], session_id: int, file_path: str
+) -> Tuple[int, Optional[List[float]]]:
+    reader = open_telemetry(file_path)
+    plan = plan_channels(reader.var_by_name, [SEGMENT_STAGE], [CORNER_PROFILE_STAGE])
+    if not plan.runs(CORNER_PROFILE_STAGE):
+        return 0, None
+    channels = plan.read(reader)
+    segments = segment_laps(
+        session_time=channels["SessionTime"],
+        lap=channels["Lap"],
+        lap_dist_pct=channels["LapDistPct"],
+        lap_last_lap_time=channels["LapLastLapTime"],
+        lap_completed=channels["LapCompleted"],
+    )
+    min_time, max_time = bounds.get(session_id, (0.0, 0.0))
+    laps, profile = session_speed_profile(
+        session_time=channels["SessionTime"],
+        lap_dist_pct=channels["LapDistPct"],
+        speed=channels["Speed"],
+        segments=segments,
+        min_valid_lap_time=min_time,
+        max_valid_lap_time=max_time,
+    )
+    return laps, profile.tolist() if profile is not None else None
+
+
+def store_profile(conn: sqlite3.Connection, session_id: int, result: Tuple[int, Optional[List[float]]]) -> None:
+    store_corner_profile(conn, session_id, *result)
+
+
+def read_metrics(
+    corners_by_session: Dict[int, List[Corner]], session_id: int, file_path: str
+) -> Dict[int, List[CornerMetrics]]:
+    return read_corner_metrics(file_path, corners_by_session.get(session_id, []))
+
+
+def store_metrics(conn: sqlite3.Connection, session_id: int, metrics: Dict[int, List[CornerMetrics]]) -> None:
+    # Idempotent: store_lap_corners replaces the session's rows
+    store_lap_corners(conn, session_id, metrics, get_lap_id_map(conn, session_id))
+
+
+def _track_filter(tracks: Optional[List[str]]) -> Tuple[str, List[str]]:
+    if not tracks:
+        return "", []
+    return f"AND track_id IN ({', '.join('?' for _ in tracks)})", list(tracks)
+
+
+def select_profile_sessions(tracks: Optional[List[str]], conn: sqlite3.Connection) -> List[Tuple[int, str]]:
+    clause, params = _track_filter(tracks)
+    cur = conn.cursor()
+    cur.execute(
+        f"""
+        SELECT id, file_path FROM sessions
+        WHERE track_id IS NOT NULL {clause}
+          AND id NOT IN (SELECT session_id FROM corner_profiles)
+        ORDER BY id
+        """,
+        params,
+    )
+    return [(int(sid), file_path) for sid, file_path in cur.fetchall() if Path(file_path).exists()]
+
+
+def select_metric_sessions(tracks: Optional[List[str]], conn: sqlite3.Connection) -> List[Tuple[int, str]]:
+    clause, params = _track_filter(tracks)
+    cur = conn.cursor()
+    cur.execute(
+        f"""
+        SELECT id, file_path FROM sessions
+        WHERE track_id IN (SELECT track_id FROM corner_indexes) {clause}
+          AND id IN (SELECT session_id FROM laps WHERE is_complete = 1)
+          AND id NOT IN (SELECT DISTINCT session_id FROM lap_corners)
+        ORDER BY id
+        """,
+        params,
+    )
+    return [(int(sid), file_path) for sid, file_path in cur.fetchall() if Path(file_path).exists()]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Backfill corner profiles, indexes and per-corner lap metrics")
+    parser.add_argument("--db", default="data/telemetry.db", help="SQLite database path")
+    parser.add_argument("--track", action="append", help="Only this track ID (repeatable)")
+    parser.add_argument("--rebuild-index", action="store_true",
+                        help="Re-derive existing corner indexes and re-measure every lap")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes (0 = inline)")
+    parser.add_argument("--retry-failed", action="store_true", help="Retry sessions that failed on a previous run")
+    parser.add_argument("--restart", action="store_true", help="Discard checkpoints and start over")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    init_db(conn)
+    cur = conn.cursor()
+
+    cur.execute("SELECT id, COALESCE(min_valid_lap_time, 0), COALESCE(max_valid_lap_time, 0) FROM sessions")
+    bounds = {int(sid): (float(lo), float(hi)) for sid, lo, hi in cur.fetchall()}
+    profile_job = BackfillJob(
+        name="backfill_corner_profiles",
+        select_sessions=partial(select_profile_sessions, args.track),
+        process=partial(read_profile, bounds),
+        apply=store_profile,
+    )
+    if args.restart:
+        reset_job(conn, profile_job.name)
+    summary = run_job(conn, profile_job, workers=args.workers, retry_failed=args.retry_failed)
+    print_summary(profile_job, summary)
+
+    clause, params = _track_filter(args.track)
+    cur.execute(f"SELECT DISTINCT track_id FROM sessions WHERE track_id IS NOT NULL {clause} ORDER BY 1", params)
+    refreshed = False
+    for (track_id,) in cur.fetchall():
+        if args.rebuild_index or index_due_for_refresh(conn, track_id, track_profile_laps(conn, track_id)):
+            corners = rebuild_corner_index(conn, track_id)
+            refreshed = True
+        elif load_corner_index(conn, track_id) is None:
+            laps, profile = track_speed_profile(conn, track_id)
+            if profile is None or laps < MIN_PROFILE_LAPS:
+                print(f"  {track_id}: {laps} profiled laps, need {MIN_PROFILE_LAPS} for a corner index")
+                continue
+            corners = derive_corners(profile)
+            store_corner_index(conn, track_id, corners, laps)
+        else:
+            continue
+        if corners is not None:
+            print(f"  {track_id}: {len(corners)} corners")
+    conn.commit()
+
+    cur.execute("SELECT id, track_id FROM sessions WHERE track_id IN (SELECT track_id FROM corner_indexes)")
+    corners_by_track: Dict[str, List[Corner]] = {}
+    corners_by_session: Dict[int, List[Corner]] = {}
+    for sid, track_id in cur.fetchall():
+        if track_id not in corners_by_track:
+            corners_by_track[track_id] = load_corner_index(conn, track_id) or []
+        # One shared list per track keeps each pickled task small
+        corners_by_session[int(sid)] = corners_by_track[track_id]
+
+    metric_job = BackfillJob(
+        name="backfill_corner_metrics",
+        select_sessions=partial(select_metric_sessions, args.track),
+        process=partial(read_metrics, corners_by_session),
+        apply=store_metrics,
+    )
+    if args.restart or refreshed:
+        reset_job(conn, metric_job.name)
+    summary = run_job(conn, metric_job, workers=args.workers, retry_failed=args.retry_failed)
+    print_summary(metric_job, summary)
+
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""Backfill `lap_fingerprints` for sessions ingested before lap similarity search existed."""
+from __future__ import annotations
+
+import argparse
+import os
+import sqlite3
+import sys
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from telemetry_parser.archive import open_telemetry
+from telemetry_parser.channel_plan import plan_channels
+from telemetry_parser.db import get_lap_id_map, init_db
+from telemetry_parser.fingerprints import FINGERPRINT_CHANNEL, FINGERPRINT_STAGE, compute_fingerprints, store_fingerprints
+from telemetry_parser.jobs import BackfillJob, print_summary, reset_job, run_job
+from telemetry_parser.segments import SEGMENT_STAGE, segment_laps
+
+
+def read_fingerprints(session_id: int, file_path: str) -> Dict[int, List[float]]:
+    reader = open_telemetry(file_path)
+    plan = plan_channels(reader.var_by_name, [SEGMENT_STAGE], [FINGERPRINT_STAGE])
+    if not plan.runs(FINGERPRINT_STAGE):
+        return {}
+    channels = plan.read(reader)
+    segments = segment_laps(
+        session_time=channels["SessionTime"],
+        lap=channels["Lap"],
+        lap_dist_pct=channels["LapDistPct"],
+        lap_last_lap_time=channels["LapLastLapTime"],
+        lap_completed=channels["LapCompleted"],
+    )
+    fingerprints = compute_fingerprints(
+        session_time=channels["SessionTime"],
+        lap_dist_pct=channels["LapDistPct"],
+        speed=channels[FINGERPRINT_CHANNEL],
+        segments=segments,
+    )
+    return {lap_number: values.tolist() for lap_number, values in fingerprints.items()}
+
+
+def store(conn: sqlite3.Connection, session_id: int, fingerprints: Dict[int, List[float]]) -> None:
+    # Idempotent: store_fingerprints replaces the session's rows
+    store_fingerprints(conn, session_id, fingerprints, get_lap_id_map(conn, session_id))
+
+
+def select_sessions(conn: sqlite3.Connection) -> List[Tuple[int, str]]:
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT id, file_path FROM sessions
+        WHERE id IN (SELECT session_id FROM laps WHERE is_complete = 1)
+          AND id NOT IN (SELECT DISTINCT session_id FROM lap_fingerprints)
+        ORDER BY id
+        """
+    )
+    return [(int(sid), file_path) for sid, file_path in cur.fetchall() if Path(file_path).exists()]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Backfill lap fingerprints for existing sessions")
+    parser.add_argument("--db", default="data/telemetry.db", help="SQLite database path")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes (0 = inline)")
+    parser.add_argument("--retry-failed", action="store_true", help="Retry sessions that failed on a previous run")
+    parser.add_argument("--restart", action="store_true", help="Discard checkpoints and start over")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    init_db(conn)
+
+    job = BackfillJob(
+        name="backfill_lap_fingerprints",
+        select_sessions=select_sessions,
+        process=read_fingerprints,
+        apply=store,
+    )
+    if args.restart:
+        reset_job(conn, job.name)
+    summary = run_job(conn, job, workers=args.workers, retry_failed=args.retry_failed)
+    print_summary(job, summary)
+
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
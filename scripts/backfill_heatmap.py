@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""Backfill `events.lap_dist_pct` for existing sessions and rebuild the
+per-track incident/reset heatmap and the event R*Tree from stored rows.
+
+Events stored before positions were recorded are re-detected from the
+`.ibt` to recover their LapDistPct; pass --skip-ibt to only rebuild the
+heatmap and index.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from pathlib import Path
+from typing import List, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from telemetry_parser.archive import open_telemetry
+from telemetry_parser.channel_plan import plan_channels
+from telemetry_parser.db import init_db
+from telemetry_parser.event_index import rebuild_event_index
+from telemetry_parser.heatmap import rebuild_heatmap
+from telemetry_parser.incident_detection import EVENT_STAGE, detect_events, event_position
+from telemetry_parser.jobs import BackfillJob, print_summary, reset_job, run_job
+
+
+def read_event_positions(session_id: int, file_path: str) -> List[Tuple[int, float]]:
+    reader = open_telemetry(file_path)
+    channels = plan_channels(reader.var_by_name, [EVENT_STAGE]).read(reader)
+    events = detect_events(
+        session_time=channels["SessionTime"],
+        lap=channels["Lap"],
+        speed=channels["Speed"],
+        yaw_rate=channels["YawRate"],
+        steering_angle=channels["SteeringWheelAngle"],
+        is_on_track=channels["IsOnTrack"],
+    )
+    positions = ((event.index, event_position(event, channels["LapDistPct"])) for event in events)
+    return [(index, pct) for index, pct in positions if pct is not None]
+
+
+def store_event_positions(conn: sqlite3.Connection, session_id: int, rows: List[Tuple[int, float]]) -> None:
+    conn.executemany(
+        "UPDATE events SET lap_dist_pct = ? WHERE session_id = ? AND index_in_session = ?",
+        [(pct, session_id, index) for index, pct in rows],
+    )
+
+
+def select_sessions(conn: sqlite3.Connection) -> List[Tuple[int, str]]:
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT id, file_path FROM sessions
+        WHERE id IN (SELECT DISTINCT session_id FROM events WHERE lap_dist_pct IS NULL)
+        ORDER BY id
+        """
+    )
+    return [(int(sid), file_path) for sid, file_path in cur.fetchall() if Path(file_path).exists()]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Backfill event positions and rebuild the track heatmap and event index")
+    parser.add_argument("--db", default="data/telemetry.db", help="SQLite database path")
+    parser.add_argument("--skip-ibt", action="store_true", help="Only rebuild the heatmap and index from stored rows")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes (0 = inline)")
+    parser.add_argument("--retry-failed", action="store_true", help="Retry sessions that failed on a previous run")
+    parser.add_argument("--restart", action="store_true", help="Discard checkpoints and start over")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    init_db(conn)
+
+    if not args.skip_ibt:
+        job = BackfillJob(
+            name="backfill_event_positions",
+            select_sessions=select_sessions,
+            process=read_event_positions,
+            apply=store_event_positions,
+        )
+        if args.restart:
+            reset_job(conn, job.name)
+        summary = run_job(conn, job, workers=args.workers, retry_failed=args.retry_failed)
+        print_summary(job, summary)
+
+    started = time.perf_counter()
+    rebuild_heatmap(conn)
+    rebuild_event_index(conn)
+    conn.commit()
+    print(f"Rebuilt track heatmap and event index in {time.perf_counter() - started:.2f}s.")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""Backfill `lap_features` for sessions ingested before per-lap features existed."""
+from __future__ import annotations
+
+import argparse
+import os
+import sqlite3
+import sys
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from telemetry_parser.archive import open_telemetry
+from telemetry_parser.channel_plan import plan_channels
+from telemetry_parser.db import get_lap_id_map, init_db
+from telemetry_parser.features import FEATURE_STAGE, LapFeatures, compute_lap_features, store_lap_features
+from telemetry_parser.jobs import BackfillJob, print_summary, reset_job, run_job
+from telemetry_parser.segments import SEGMENT_STAGE, segment_laps
+
+
+def read_lap_features(session_id: int, file_path: str) -> Dict[int, LapFeatures]:
+    reader = open_telemetry(file_path)
+    channels = plan_channels(reader.var_by_name, [SEGMENT_STAGE, FEATURE_STAGE]).read(reader)
+    segments = segment_laps(
+        session_time=channels["SessionTime"],
+        lap=channels["Lap"],
+        lap_dist_pct=channels["LapDistPct"],
+        lap_last_lap_time=channels["LapLastLapTime"],
+        lap_completed=channels["LapCompleted"],
+    )
+    return compute_lap_features(
+        session_time=channels["SessionTime"],
+        channels=channels.view(FEATURE_STAGE),
+        segments=segments,
+    )
+
+
+def store_features(conn: sqlite3.Connection, session_id: int, features_by_lap: Dict[int, LapFeatures]) -> None:
+    # Idempotent: store_lap_features replaces the session's rows
+    store_lap_features(conn, session_id, features_by_lap, get_lap_id_map(conn, session_id))
+
+
+def select_sessions(conn: sqlite3.Connection) -> List[Tuple[int, str]]:
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT id, file_path FROM sessions
+        WHERE id NOT IN (SELECT DISTINCT session_id FROM lap_features)
+        ORDER BY id
+        """
+    )
+    return [(int(sid), file_path) for sid, file_path in cur.fetchall() if Path(file_path).exists()]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Backfill per-lap features for existing sessions")
+    parser.add_argument("--db", default="data/telemetry.db", help="SQLite database path")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes (0 = inline)")
+    parser.add_argument("--retry-failed", action="store_true", help="Retry sessions that failed on a previous run")
+    parser.add_argument("--restart", action="store_true", help="Discard checkpoints and start over")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    init_db(conn)
+
+    job = BackfillJob(
+        name="backfill_lap_features",
+        select_sessions=select_sessions,
+        process=read_lap_features,
+        apply=store_features,
+    )
+    if args.restart:
+        reset_job(conn, job.name)
+    summary = run_job(conn, job, workers=args.workers, retry_failed=args.retry_failed)
+    print_summary(job, summary)
+
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
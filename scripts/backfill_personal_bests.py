@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""Backfill microsector splits for existing sessions and rebuild the
+personal-best index (overall, clean, sector, microsector and theoretical
+bests per track) from stored laps.
+
+Sessions ingested before microsector timing existed get their splits from a
+re-read of the `.ibt`; pass --skip-ibt to only rebuild the index from what
+is already stored.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from telemetry_parser.archive import open_telemetry
+from telemetry_parser.channel_plan import plan_channels
+from telemetry_parser.db import init_db
+from telemetry_parser.jobs import BackfillJob, print_summary, reset_job, run_job
+from telemetry_parser.personal_bests import pack_times, rebuild_personal_bests
+from telemetry_parser.sectors import MICROSECTOR_STAGE, compute_microsector_times
+from telemetry_parser.segments import SEGMENT_STAGE, segment_laps
+
+
+def read_microsectors(session_id: int, file_path: str) -> Dict[int, List[float]]:
+    reader = open_telemetry(file_path)
+    data = plan_channels(reader.var_by_name, [SEGMENT_STAGE, MICROSECTOR_STAGE]).read(reader)
+    segments = segment_laps(
+        session_time=data["SessionTime"],
+        lap=data["Lap"],
+        lap_dist_pct=data["LapDistPct"],
+        lap_last_lap_time=data["LapLastLapTime"],
+        lap_completed=data["LapCompleted"],
+    )
+    return compute_microsector_times(data["SessionTime"], data["LapDistPct"], segments)
+
+
+def store_microsectors(conn: sqlite3.Connection, session_id: int, times_by_lap: Dict[int, List[float]]) -> None:
+    cur = conn.cursor()
+    cur.execute("SELECT lap_number, id FROM laps WHERE session_id = ?", (session_id,))
+    lap_ids = {row[0]: row[1] for row in cur.fetchall()}
+    # Idempotent: a retried job replaces whatever a previous attempt wrote
+    cur.execute("DELETE FROM lap_microsectors WHERE session_id = ?", (session_id,))
+    cur.executemany(
+        "INSERT INTO lap_microsectors (lap_id, session_id, data) VALUES (?, ?, ?)",
+        [
+            (lap_ids[lap_number], session_id, pack_times(times))
+            for lap_number, times in times_by_lap.items()
+            if lap_number in lap_ids
+        ],
+    )
+
+
+def select_sessions(conn: sqlite3.Connection) -> List[Tuple[int, str]]:
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT id, file_path FROM sessions
+        WHERE id NOT IN (SELECT DISTINCT session_id FROM lap_microsectors)
+        ORDER BY id
+        """
+    )
+    return [(int(sid), file_path) for sid, file_path in cur.fetchall() if Path(file_path).exists()]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Backfill microsectors and rebuild the personal-best index")
+    parser.add_argument("--db", default="data/telemetry.db", help="SQLite database path")
+    parser.add_argument("--skip-ibt", action="store_true", help="Only rebuild the index from stored rows")
+    parser.add_argument("--track", action="append", help="Rebuild only this track ID (repeatable)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes (0 = inline)")
+    parser.add_argument("--retry-failed", action="store_true", help="Retry sessions that failed on a previous run")
+    parser.add_argument("--restart", action="store_true", help="Discard checkpoints and start over")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    init_db(conn)
+
+    if not args.skip_ibt:
+        job = BackfillJob(
+            name="backfill_microsectors",
+            select_sessions=select_sessions,
+            process=read_microsectors,
+            apply=store_microsectors,
+        )
+        if args.restart:
+            reset_job(conn, job.name)
+        summary = run_job(conn, job, workers=args.workers, retry_failed=args.retry_failed)
+        print_summary(job, summary)
+
+    started = time.perf_counter()
+    improved = rebuild_personal_bests(conn, args.track)
+    conn.commit()
+    print(f"Rebuilt personal-best index ({improved} improvements replayed) in {time.perf_counter() - started:.2f}s.")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
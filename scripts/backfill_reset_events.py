@@ -2,6 +2,7 @@
 from __future__ import annotations
 
 import argparse
+import os
 import re
 import sqlite3
 import sys
@@ -11,8 +12,13 @@ from typing import List, Tuple
 
 sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
 
-from telemetry_parser.ibt import IBTReader
-from telemetry_parser.segments import detect_reset_events
+from telemetry_parser.archive import open_telemetry
+from telemetry_parser.channel_plan import plan_channels
+from telemetry_parser.db import touch_sessions
+from telemetry_parser.event_index import index_session_events, init_event_index, unindex_session_events
+from telemetry_parser.heatmap import add_session_to_heatmap, init_heatmap_tables, remove_session_from_heatmap
+from telemetry_parser.jobs import BackfillJob, print_summary, reset_job, run_job
+from telemetry_parser.segments import RESET_STAGE, detect_reset_events
 
 
 FILENAME_RE = re.compile(
@@ -32,10 +38,74 @@ def parse_date(file_path: str) -> datetime | None:
         return None
 
 
+def read_reset_events(session_id: int, file_path: str) -> List[Tuple[int, float, int]]:
+    reader = open_telemetry(file_path)
+    channels = plan_channels(reader.var_by_name, [RESET_STAGE]).read(reader)
+    reset_events = detect_reset_events(
+        lap=channels["Lap"],
+        lap_dist_pct=channels["LapDistPct"],
+        session_time=channels["SessionTime"],
+    )
+    return [(event.lap_number, event.lap_dist_pct, event.index) for event in reset_events]
+
+
+def store_reset_events(conn: sqlite3.Connection, session_id: int, rows: List[Tuple[int, float, int]]) -> None:
+    cur = conn.cursor()
+    # Idempotent: a retried job replaces whatever a previous attempt wrote
+    remove_session_from_heatmap(conn, session_id)
+    unindex_session_events(conn, session_id)
+    cur.execute("DELETE FROM reset_events WHERE session_id = ?", (session_id,))
+    cur.executemany(
+        """
+        INSERT INTO reset_events (
+            session_id, lap_number, lap_dist_pct, index_in_session
+        ) VALUES (?, ?, ?, ?)
+        """,
+        [(session_id, lap_number, lap_dist_pct, index) for lap_number, lap_dist_pct, index in rows],
+    )
+    add_session_to_heatmap(conn, session_id)
+    index_session_events(conn, session_id)
+    touch_sessions(conn, [session_id])
+
+
+def make_job(start_dt: datetime | None) -> BackfillJob:
+    def select_sessions(conn: sqlite3.Connection) -> List[Tuple[int, str]]:
+        cur = conn.cursor()
+        cur.execute("SELECT id, file_path FROM sessions ORDER BY id")
+        sessions: List[Tuple[int, str]] = cur.fetchall()
+
+        cur.execute("SELECT DISTINCT session_id FROM reset_events")
+        existing = {row[0] for row in cur.fetchall()}
+
+        selected = []
+        for session_id, file_path in sessions:
+            if session_id in existing:
+                continue
+            dt = parse_date(file_path)
+            if start_dt and (dt is None or dt < start_dt):
+                continue
+            if not FILENAME_RE.search(Path(file_path).name):
+                continue
+            if not Path(file_path).exists():
+                continue
+            selected.append((session_id, file_path))
+        return selected
+
+    return BackfillJob(
+        name="backfill_reset_events",
+        select_sessions=select_sessions,
+        process=read_reset_events,
+        apply=store_reset_events,
+    )
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(description="Backfill reset events for existing sessions")
     parser.add_argument("--db", default="data/telemetry.db", help="SQLite database path")
     parser.add_argument("--start-date", help="Only process sessions on/after YYYY-MM-DD")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes (0 = inline)")
+    parser.add_argument("--retry-failed", action="store_true", help="Retry sessions that failed on a previous run")
+    parser.add_argument("--restart", action="store_true", help="Discard checkpoints and start over")
     args = parser.parse_args()
 
     start_dt = datetime.strptime(args.start_date, "%Y-%m-%d") if args.start_date else None
@@ -53,51 +123,15 @@ def main() -> None:
         );
         """
     )
+    init_heatmap_tables(conn)
+    init_event_index(conn)
     conn.commit()
 
-    cur.execute("SELECT id, file_path FROM sessions")
-    sessions: List[Tuple[int, str]] = cur.fetchall()
-
-    cur.execute("SELECT DISTINCT session_id FROM reset_events")
-    existing = {row[0] for row in cur.fetchall()}
-
-    for session_id, file_path in sessions:
-        if session_id in existing:
-            continue
-        dt = parse_date(file_path)
-        if start_dt and (dt is None or dt < start_dt):
-            continue
-        if not FILENAME_RE.search(Path(file_path).name):
-            continue
-        if not Path(file_path).exists():
-            continue
-
-        reader = IBTReader(file_path).read()
-        channels = {
-            "Lap": reader.read_channel("Lap"),
-            "LapDistPct": reader.read_channel("LapDistPct"),
-            "SessionTime": reader.read_channel("SessionTime"),
-        }
-        reset_events = detect_reset_events(
-            lap=channels["Lap"],
-            lap_dist_pct=channels["LapDistPct"],
-            session_time=channels["SessionTime"],
-        )
-        for event in reset_events:
-            cur.execute(
-                """
-                INSERT INTO reset_events (
-                    session_id, lap_number, lap_dist_pct, index_in_session
-                ) VALUES (?, ?, ?, ?)
-                """,
-                (
-                    session_id,
-                    event.lap_number,
-                    event.lap_dist_pct,
-                    event.index,
-                ),
-            )
-        conn.commit()
+    job = make_job(start_dt)
+    if args.restart:
+        reset_job(conn, job.name)
+    summary = run_job(conn, job, workers=args.workers, retry_failed=args.retry_failed)
+    print_summary(job, summary)
 
     conn.close()
 
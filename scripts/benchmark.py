@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""Benchmark the ingest pipeline and site build, optionally against a baseline.
+
+By default runs on synthetic sessions of --sizes laps (generated once into
+--corpus and reused); pass --ibt to benchmark fixture files instead.
+--save-baseline writes the run to compare later runs against with
+--baseline; --fail-on-regression exits non-zero when any stage is slower
+than the baseline by more than --threshold.
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from telemetry_parser.benchmark import (
+    DEFAULT_SIZES,
+    DEFAULT_TRACK,
+    REGRESSION_THRESHOLD,
+    BenchmarkRun,
+    compare_runs,
+    run_benchmarks,
+    synthetic_files,
+)
+from telemetry_parser.synthetic import TRACK_PROFILES
+
+
+def _format_rate(value: float) -> str:
+    for scale, suffix in ((1e6, "M"), (1e3, "k")):
+        if value >= scale:
+            return f"{value / scale:.1f}{suffix}"
+    return f"{value:.1f}"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark ingest stages and the site build")
+    parser.add_argument("--ibt", nargs="+", help="Benchmark these .ibt files instead of synthetic sessions")
+    parser.add_argument("--sizes", nargs="+", type=int, default=list(DEFAULT_SIZES),
+                        help="Synthetic session sizes, in timed laps")
+    parser.add_argument("--track", default=DEFAULT_TRACK, choices=sorted(TRACK_PROFILES), help="Synthetic track")
+    parser.add_argument("--corpus", default="data/benchmarks/corpus", help="Folder for the generated sessions")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per stage (best is kept)")
+    parser.add_argument("--site-repeat", type=int, default=1, help="Timed runs of the site build")
+    parser.add_argument("--output", help="Also write this run's results to this JSON file")
+    parser.add_argument("--save-baseline", help="Write this run as the baseline JSON file")
+    parser.add_argument("--baseline", help="Compare against this baseline JSON file")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                        help="Slowdown ratio above which a stage counts as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit 1 if any stage regressed")
+    args = parser.parse_args()
+
+    if args.ibt:
+        files = [(Path(path).name, path) for path in args.ibt]
+    else:
+        files = synthetic_files(args.corpus, args.sizes, args.track)
+    run = run_benchmarks(files, repeat=args.repeat, site_repeat=args.site_repeat)
+
+    print(f"{'size':<24} {'stage':<22} {'records':>12} {'wall s':>9} {'per s':>8} {'peak MB':>8}")
+    for result in run.results:
+        print(
+            f"{result.size[:24]:<24} {result.stage:<22} {result.records:>8} {result.unit[:3]:<3} "
+            f"{result.wall_time:>9.4f} {_format_rate(result.records_per_sec):>8} {result.peak_memory / 1e6:>8.1f}"
+        )
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            run.save(path)
+            print(f"Saved results to {path}")
+
+    if args.baseline:
+        baseline = BenchmarkRun.load(args.baseline)
+        comparisons = compare_runs(baseline, run)
+        regressions = [c for c in comparisons if c.is_regression(args.threshold)]
+        print(f"\nAgainst baseline {args.baseline} ({baseline.created_at}, Python {baseline.python}):")
+        for c in comparisons:
+            flag = "  REGRESSION" if c.is_regression(args.threshold) else ""
+            print(f"  {c.size[:24]:<24} {c.stage:<22} {c.baseline:>9.4f} -> {c.current:>9.4f}  x{c.ratio:.2f}{flag}")
+        print(f"{len(regressions)} of {len(comparisons)} stage(s) slower than baseline by over {args.threshold:.0%}.")
+        if regressions and args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""Build or refresh the per-track-week consistency envelope cache.
+
+Envelopes are otherwise built the first time a window covering a week is
+asked for; this brings every week with sessions (optionally only on/after
+--start-date) up to date, skipping weeks whose cache entry is current.
+"""
+from __future__ import annotations
+
+import argparse
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from telemetry_parser.db import init_db
+from telemetry_parser.envelopes import ENVELOPE_POINTS, reference_elapsed, init_envelope_table, week_sketch, week_start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build cached track-week consistency envelopes")
+    parser.add_argument("--db", default="data/telemetry.db", help="SQLite database path")
+    parser.add_argument("--track", action="append", help="Only this track ID (repeatable)")
+    parser.add_argument("--start-date", help="Only weeks containing or after YYYY-MM-DD")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    init_db(conn)
+    init_envelope_table(conn)
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT DISTINCT track_id, date(start_time, 'unixepoch', 'localtime') FROM sessions
+        WHERE track_id IS NOT NULL AND start_time IS NOT NULL
+        ORDER BY 1, 2
+        """
+    )
+    weeks_by_track = {}
+    for track_id, day in cur.fetchall():
+        if args.track and track_id not in args.track:
+            continue
+        week = week_start(day)
+        if args.start_date and week < week_start(args.start_date):
+            continue
+        weeks_by_track.setdefault(track_id, set()).add(week)
+
+    for track_id, weeks in sorted(weeks_by_track.items()):
+        reference = reference_elapsed(conn, track_id, ENVELOPE_POINTS)
+        if reference is None:
+            print(f"  {track_id}: no reference lap")
+            continue
+        started = time.perf_counter()
+        laps = sum(week_sketch(conn, track_id, week, reference).laps for week in sorted(weeks))
+        print(f"  {track_id}: {len(weeks)} week(s), {laps} clean laps ({time.perf_counter() - started:.1f}s)")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
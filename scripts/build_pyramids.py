@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""Prebuild channel pyramids for zoomable full-session trace views.
+
+Pyramids are otherwise built the first time a session is viewed; this
+builds them ahead of time for every session (or those on/after
+--start-date) that doesn't have them yet.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import re
+import sqlite3
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from telemetry_parser.db import init_db
+from telemetry_parser.jobs import BackfillJob, print_summary, reset_job, run_job
+from telemetry_parser.pyramids import compute_pyramids, store_pyramids
+
+DATE_RE = re.compile(r" (?P<date>\d{4}-\d{2}-\d{2}) \d{2}-\d{2}-\d{2}\.ibt$", re.IGNORECASE)
+
+
+def parse_date(file_path: str) -> datetime | None:
+    match = DATE_RE.search(Path(file_path).name)
+    if not match:
+        return None
+    try:
+        return datetime.strptime(match.group("date"), "%Y-%m-%d")
+    except ValueError:
+        return None
+
+
+def read_pyramids(session_id: int, file_path: str) -> Dict:
+    return compute_pyramids(file_path)
+
+
+def make_job(start_dt: datetime | None) -> BackfillJob:
+    def select_sessions(conn: sqlite3.Connection) -> List[Tuple[int, str]]:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            SELECT id, file_path FROM sessions
+            WHERE id NOT IN (SELECT DISTINCT session_id FROM channel_pyramids)
+            ORDER BY id
+            """
+        )
+        selected = []
+        for session_id, file_path in cur.fetchall():
+            dt = parse_date(file_path)
+            if start_dt and (dt is None or dt < start_dt):
+                continue
+            if not Path(file_path).exists():
+                continue
+            selected.append((int(session_id), file_path))
+        return selected
+
+    return BackfillJob(
+        name="build_pyramids",
+        select_sessions=select_sessions,
+        process=read_pyramids,
+        apply=store_pyramids,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Prebuild channel pyramids for existing sessions")
+    parser.add_argument("--db", default="data/telemetry.db", help="SQLite database path")
+    parser.add_argument("--start-date", help="Only process sessions on/after YYYY-MM-DD")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes (0 = inline)")
+    parser.add_argument("--retry-failed", action="store_true", help="Retry sessions that failed on a previous run")
+    parser.add_argument("--restart", action="store_true", help="Discard checkpoints and start over")
+    args = parser.parse_args()
+
+    start_dt = datetime.strptime(args.start_date, "%Y-%m-%d") if args.start_date else None
+
+    conn = sqlite3.connect(args.db)
+    init_db(conn)
+
+    job = make_job(start_dt)
+    if args.restart:
+        reset_job(conn, job.name)
+    summary = run_job(conn, job, workers=args.workers, retry_failed=args.retry_failed)
+    print_summary(job, summary)
+
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
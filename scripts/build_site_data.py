@@ -2,19 +2,38 @@
 from __future__ import annotations
 
 import argparse
+import gzip
+import hashlib
 import json
+import math
 import re
 import sqlite3
 import sys
 from collections import defaultdict
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta
+from itertools import groupby
+from operator import itemgetter
 from pathlib import Path
-from statistics import median, pstdev
-from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
 
 sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
 
+from telemetry_parser.sketches import (
+    LapTimeSketch,
+    init_sketch_tables,
+    load_track_day_sketches,
+    session_sketches_for,
+    store_session_sketches,
+    store_track_day_sketches,
+)
 from telemetry_parser.track_config import DEFAULT_MAX_TIMES, DEFAULT_MIN_TIMES, GLOBAL_MAX_LAP_TIME
+from telemetry_parser.traces import DEFAULT_TRACE_POINTS, TraceLap, get_lap_traces
+
+try:
+    import brotli
+except ImportError:  # optional; .br copies are skipped without it
+    brotli = None
 
 
 # Porsche 911 GT3 Cup — iRacing car ID is "porsche9922cup"
@@ -41,6 +60,17 @@ BASELINE_TRACK_MAP = {
     "BARCELONA": "barcelona gp",
 }
 
+# Build watermarks, kept next to the outputs they describe
+STATE_FILE = ".build-state.json"
+# Bump when the shape of any output changes so the next run rebuilds everything
+STATE_VERSION = 3
+
+# Index of every output file with its content hash, for lazy loading and caching
+MANIFEST_FILE = "manifest.json"
+MANIFEST_VERSION = 1
+
+RESET_BIN_SIZE = 0.05
+
 # iRacing track names from filenames → normalized experiment track IDs.
 TRACK_NAME_MAP = {
     "spa 2024 up": "spa",
@@ -51,18 +81,6 @@ TRACK_NAME_MAP = {
 }
 
 
-def _percentile(sorted_vals: Sequence[float], pct: float) -> float:
-    """Linear interpolation percentile (copied from metrics.py)."""
-    if not sorted_vals:
-        return 0.0
-    k = (len(sorted_vals) - 1) * pct
-    f = int(k)
-    c = min(f + 1, len(sorted_vals) - 1)
-    if f == c:
-        return sorted_vals[f]
-    return sorted_vals[f] + (sorted_vals[c] - sorted_vals[f]) * (k - f)
-
-
 def normalize_track(raw_track: str) -> str:
     """Map iRacing track names to experiment track IDs."""
     lower = raw_track.lower().strip()
@@ -96,14 +114,11 @@ def parse_file_metadata(file_path: str) -> Tuple[str, str, bool]:
     return "unknown", "unknown", False
 
 
-def build_bins(values: Iterable[float], bin_size: float = 0.05) -> List[Dict[str, float]]:
-    counts: Dict[int, int] = defaultdict(int)
-    for val in values:
-        if val is None:
-            continue
-        idx = int(val // bin_size)
-        counts[idx] += 1
+def _bin_index(val: float, bin_size: float = RESET_BIN_SIZE) -> int:
+    return int(val // bin_size)
+
 
+def _bins_from_counts(counts: Dict[int, int], bin_size: float = RESET_BIN_SIZE) -> List[Dict[str, float]]:
     bins = []
     for idx in sorted(counts.keys()):
         start = idx * bin_size
@@ -112,6 +127,15 @@ def build_bins(values: Iterable[float], bin_size: float = 0.05) -> List[Dict[str
     return bins
 
 
+def build_bins(values: Iterable[float], bin_size: float = RESET_BIN_SIZE) -> List[Dict[str, float]]:
+    counts: Dict[int, int] = defaultdict(int)
+    for val in values:
+        if val is None:
+            continue
+        counts[_bin_index(val, bin_size)] += 1
+    return _bins_from_counts(counts, bin_size)
+
+
 def _has_column(cur: sqlite3.Cursor, table: str, column: str) -> bool:
     cur.execute(f"PRAGMA table_info({table})")
     return any(row[1] == column for row in cur.fetchall())
@@ -122,41 +146,740 @@ def _has_table(cur: sqlite3.Cursor, table: str) -> bool:
     return cur.fetchone() is not None
 
 
-def _add_rolling_averages(series: List[Dict], window_days: int = 7) -> None:
-    """Add 7-day rolling averages to a daily timeseries in-place."""
-    if not series:
-        return
-    for i, point in enumerate(series):
-        current_date = datetime.strptime(point["date"], "%Y-%m-%d")
-        window_start = current_date - timedelta(days=window_days - 1)
+def _iso_week(date_str: str) -> str:
+    d = datetime.strptime(date_str, "%Y-%m-%d")
+    monday = d - timedelta(days=d.weekday())
+    return monday.strftime("%Y-%m-%d")
 
-        window_best: List[float] = []
-        window_median: List[float] = []
-        window_stddev: List[float] = []
 
-        for j in range(max(0, i - window_days * 2), i + 1):
-            jdate = datetime.strptime(series[j]["date"], "%Y-%m-%d")
-            if window_start <= jdate <= current_date:
-                window_best.append(series[j]["bestLap"])
-                window_median.append(series[j]["medianLap"])
-                window_stddev.append(series[j]["stdDev"])
+@dataclass
+class BuildScope:
+    """(track, day) pairs touched since the last build, plus the weeks and months holding them."""
 
-        if window_best:
-            point["bestLap7d"] = round(sum(window_best) / len(window_best), 3)
-            point["medianLap7d"] = round(sum(window_median) / len(window_median), 3)
-            point["stdDev7d"] = round(sum(window_stddev) / len(window_stddev), 3)
+    days: Set[Tuple[str, str]]
+    weeks: Set[Tuple[str, str]] = field(init=False)
+    months: Set[Tuple[str, str]] = field(init=False)
+    tracks: Set[str] = field(init=False)
 
+    def __post_init__(self) -> None:
+        self.weeks = {(track, _iso_week(date_str)) for track, date_str in self.days}
+        self.months = {(track, date_str[:7]) for track, date_str in self.days}
+        self.tracks = {track for track, _ in self.days}
+
+    def keys_for(self, track: str, kind: str) -> Set[str]:
+        return {key for t, key in getattr(self, kind) if t == track}
+
+
+def _wanted(scope: Optional[BuildScope], kind: str, key: Tuple[str, str]) -> bool:
+    return scope is None or key in getattr(scope, kind)
+
+
+def _load_state(output_root: Path) -> Optional[Dict]:
+    try:
+        state = json.loads((output_root / STATE_FILE).read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError):
+        return None
+    if not isinstance(state, dict) or state.get("version") != STATE_VERSION:
+        return None
+    return state
+
+
+def _read_watermarks(cur: sqlite3.Cursor) -> Dict:
+    cur.execute("SELECT COUNT(*), COALESCE(MAX(id), 0), COALESCE(MAX(data_version), 0) FROM sessions")
+    count, last_id, data_version = cur.fetchone()
+    return {
+        "version": STATE_VERSION,
+        "sessionCount": int(count),
+        "lastSessionId": int(last_id),
+        "dataVersion": int(data_version),
+    }
+
+
+def _changed_sessions(cur: sqlite3.Cursor, state: Dict) -> Optional[List[int]]:
+    """Sessions added or re-derived since `state`, or None if a full build is needed."""
+    cur.execute("SELECT COUNT(*) FROM sessions WHERE id <= ?", (state["lastSessionId"],))
+    if int(cur.fetchone()[0]) != state["sessionCount"]:
+        return None  # sessions were deleted; their days can't be located any more
+    cur.execute(
+        "SELECT id FROM sessions WHERE id > ? OR data_version > ?",
+        (state["lastSessionId"], state["dataVersion"]),
+    )
+    return [int(row[0]) for row in cur.fetchall()]
+
+
+def _load_series(path: Path) -> List[Dict]:
+    try:
+        series = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError):
+        return []
+    return series if isinstance(series, list) else []
+
+
+def _splice(existing: List[Dict], fresh: List[Dict], replaced: Set[str]) -> List[Dict]:
+    """Replace the points of `existing` whose "date" is in `replaced` with `fresh`."""
+    kept = [point for point in existing if point.get("date") not in replaced]
+    return sorted(kept + fresh, key=lambda point: point["date"])
+
+
+class OutputWriter:
+    """Writes JSON files only when their content changed, and remembers what it produced.
+
+    Every file gets precompressed .gz (and .br, if brotli is installed)
+    siblings that are kept in step with it.
+    """
+
+    def __init__(self, root: Path) -> None:
+        self.root = root
+        self.produced: Set[Path] = set()
+        self.written = 0
+        self.unchanged = 0
+        self.removed = 0
+
+    def write(self, path: Path, data, ignore_keys: Sequence[str] = ()) -> None:
+        self.produced.add(path)
+        text = json.dumps(data, indent=2)
+        if path.exists():
+            old_text = path.read_text(encoding="utf-8")
+            if old_text == text or (ignore_keys and _same_except(old_text, data, ignore_keys)):
+                self.unchanged += 1
+                if not all(_sibling(path, suffix).exists() for suffix in _compressed_suffixes()):
+                    _write_compressed(path, old_text)
+                return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text, encoding="utf-8")
+        _write_compressed(path, text)
+        self.written += 1
+
+    def write_or_remove(self, path: Path, data) -> None:
+        if data:
+            self.write(path, data)
+        elif path.exists():
+            self.remove(path)
+
+    def write_shards(self, directory: Path, series: Optional[List[Dict]]) -> None:
+        """Split a date-keyed series into one file per month under `directory`."""
+        months: Dict[str, List[Dict]] = defaultdict(list)
+        for point in series or []:
+            months[point["date"][:7]].append(point)
+        for month, points in months.items():
+            self.write(directory / f"{month}.json", points)
+        self.remove_stale(directory)
+
+    def remove_stale(self, directory: Path) -> None:
+        """Delete JSON files directly in `directory` that this build did not produce."""
+        if directory.exists():
+            for old_file in directory.glob("*.json"):
+                if old_file not in self.produced:
+                    self.remove(old_file)
+
+    def remove(self, path: Path) -> None:
+        path.unlink()
+        for suffix in COMPRESSED_SUFFIXES:
+            _sibling(path, suffix).unlink(missing_ok=True)
+        self.removed += 1
+
+    def prune(self, subdirs: Sequence[str]) -> None:
+        """Delete JSON files under `subdirs` that this build did not produce."""
+        for subdir in subdirs:
+            d = self.root / subdir
+            if not d.exists():
+                continue
+            for old_file in d.rglob("*.json"):
+                if old_file not in self.produced:
+                    self.remove(old_file)
+            for suffix in COMPRESSED_SUFFIXES:
+                for copy in d.rglob(f"*.json{suffix}"):
+                    if not copy.with_suffix("").exists():
+                        copy.unlink()
+
+
+COMPRESSED_SUFFIXES = (".gz", ".br")
+
+
+def _compressed_suffixes() -> Tuple[str, ...]:
+    return COMPRESSED_SUFFIXES if brotli is not None else (".gz",)
+
+
+def _sibling(path: Path, suffix: str) -> Path:
+    return path.with_name(path.name + suffix)
+
+
+def _write_compressed(path: Path, text: str) -> None:
+    raw = text.encode("utf-8")
+    # mtime=0 keeps the .gz bytes (and so their ETags) stable across rebuilds
+    _sibling(path, ".gz").write_bytes(gzip.compress(raw, compresslevel=9, mtime=0))
+    if brotli is not None:
+        _sibling(path, ".br").write_bytes(brotli.compress(raw, quality=11))
+
+
+def _build_manifest(output_root: Path) -> Dict:
+    """Hash every JSON output and index the per-track monthly shards."""
+    files: Dict[str, Dict] = {}
+    shards: Dict[str, Dict[str, List[str]]] = defaultdict(lambda: defaultdict(list))
+    for path in sorted(output_root.rglob("*.json")):
+        rel = path.relative_to(output_root).as_posix()
+        if rel == MANIFEST_FILE or path.name.startswith("."):
+            continue
+        raw = path.read_bytes()
+        files[rel] = {"hash": hashlib.sha256(raw).hexdigest()[:16], "bytes": len(raw)}
+        parts = rel.split("/")
+        if len(parts) == 4 and parts[0] == "tracks":
+            shards[parts[1]][parts[2]].append(path.stem)
+    return {
+        "version": MANIFEST_VERSION,
+        "compression": [suffix.lstrip(".") for suffix in _compressed_suffixes()],
+        "files": files,
+        "shards": shards,
+    }
+
+
+def _same_except(old_text: str, data: Dict, ignore_keys: Sequence[str]) -> bool:
+    try:
+        old = json.loads(old_text)
+    except json.JSONDecodeError:
+        return False
+    if not isinstance(old, dict):
+        return False
+    strip = lambda d: {k: v for k, v in d.items() if k not in ignore_keys}
+    return strip(old) == strip(data)
+
+
+# ── Set-based aggregation ──────────────────────────────────────────
+#
+# Every valid session is staged in temp._site_sessions with its track and
+# date buckets, and each output series is one grouped query over it. The
+# in_* flags select the buckets being rebuilt (all of them on a full build).
+
+_SITE_TABLES_SQL = (
+    """
+    CREATE TEMP TABLE IF NOT EXISTS _site_sessions (
+        session_id INTEGER PRIMARY KEY,
+        track TEXT NOT NULL,
+        date TEXT NOT NULL,
+        week TEXT NOT NULL,
+        month TEXT NOT NULL,
+        duration REAL NOT NULL,
+        min_t REAL,
+        max_t REAL,
+        in_day INTEGER NOT NULL,
+        in_week INTEGER NOT NULL,
+        in_month INTEGER NOT NULL,
+        in_track INTEGER NOT NULL
+    )
+    """,
+    """
+    CREATE TEMP TABLE IF NOT EXISTS _site_daily (
+        track TEXT NOT NULL,
+        date TEXT NOT NULL,
+        best_ms INTEGER,
+        median_ms INTEGER,
+        stddev_ms INTEGER,
+        duration REAL,
+        PRIMARY KEY (track, date)
+    )
+    """,
+)
+
+
+@dataclass
+class GroupStats:
+    count: int
+    best: float
+    worst: float
+    median: float
+    stddev: float
+    p25: float
+    p75: float
+    first_ord: int
+
+
+def _percentile(sorted_vals: Sequence[float], pct: float) -> float:
+    """Linear interpolation percentile (copied from metrics.py)."""
+    if not sorted_vals:
+        return 0.0
+    k = (len(sorted_vals) - 1) * pct
+    f = int(k)
+    c = min(f + 1, len(sorted_vals) - 1)
+    if f == c:
+        return sorted_vals[f]
+    return sorted_vals[f] + (sorted_vals[c] - sorted_vals[f]) * (k - f)
+
+
+def _stats_from_sorted(vals: List[float], first_ord: int) -> GroupStats:
+    n = len(vals)
+    mid = n // 2
+    mean = math.fsum(vals) / n
+    return GroupStats(
+        count=n,
+        best=vals[0],
+        worst=vals[-1],
+        # statistics.median: mean of the two middle values for even n
+        median=vals[mid] if n % 2 else (vals[mid - 1] + vals[mid]) / 2,
+        stddev=math.sqrt(math.fsum((x - mean) ** 2 for x in vals) / n) if n > 1 else 0.0,
+        p25=_percentile(vals, 0.25),
+        p75=_percentile(vals, 0.75),
+        first_ord=first_ord,
+    )
+
+
+def _grouped_stats(
+    cur: sqlite3.Cursor,
+    source: str,
+    keys: Sequence[str],
+) -> List[Tuple[tuple, GroupStats]]:
+    """Distribution stats of `v` per group of `keys`, ordered by the keys.
+
+    `source` is a SELECT yielding the key columns, the value `v` and an
+    ordering column `ord` (reported back as the smallest `ord` per group).
+    SQLite does the filtering, joining and a single sort; each group then
+    arrives already ordered and is read once for its percentiles.
+    """
+    k = ", ".join(keys)
+    width = len(keys)
+    cur.execute(f"SELECT {k}, v, ord FROM ({source}) ORDER BY {k}, v")
+    value, order = itemgetter(width), itemgetter(width + 1)
+    results = []
+    for key, rows in groupby(cur, key=itemgetter(*range(width))):
+        rows = list(rows)
+        results.append((
+            key if width > 1 else (key,),
+            _stats_from_sorted(list(map(value, rows)), min(map(order, rows))),
+        ))
+    return results
+
+
+def _lap_filter(has_clean: bool) -> str:
+    if has_clean:
+        return "l.is_clean = 1"
+    return (
+        "l.is_complete = 1 AND l.is_reset = 0 AND l.lap_time > 0"
+        " AND l.lap_time >= s.min_t AND l.lap_time <= s.max_t"
+    )
+
+
+def _sector_lap_filter(has_clean: bool) -> str:
+    return "l.is_clean = 1" if has_clean else "l.is_complete = 1 AND l.is_reset = 0"
+
+
+def _stage_sessions(
+    cur: sqlite3.Cursor,
+    site_sessions: Dict[int, Tuple[str, str, float]],
+    scope: Optional[BuildScope],
+) -> None:
+    rows = []
+    for sid, (track, date_str, duration_s) in site_sessions.items():
+        week = _iso_week(date_str)
+        month = date_str[:7]
+        rows.append((
+            sid, track, date_str, week, month, duration_s,
+            DEFAULT_MIN_TIMES.get(track, 30.0),
+            DEFAULT_MAX_TIMES.get(track, GLOBAL_MAX_LAP_TIME),
+            int(_wanted(scope, "days", (track, date_str))),
+            int(_wanted(scope, "weeks", (track, week))),
+            int(_wanted(scope, "months", (track, month))),
+            int(scope is None or track in scope.tracks),
+        ))
+    cur.execute("DELETE FROM temp._site_sessions")
+    cur.executemany("INSERT INTO temp._site_sessions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+
+def _lap_time_point(date_key: str, stats: GroupStats) -> Dict:
+    return {
+        "date": date_key,
+        "bestLap": round(stats.best, 3),
+        "medianLap": round(stats.median, 3),
+        "stdDev": round(stats.stddev, 3),
+        "completeLaps": stats.count,
+        "worstLap": round(stats.worst, 3),
+        "p25": round(stats.p25, 3),
+        "p75": round(stats.p75, 3),
+        "iqr": round(stats.p75 - stats.p25, 3),
+    }
+
+
+def _lap_time_series(cur: sqlite3.Cursor, has_clean: bool, bucket: str, flag: str) -> Dict[str, List[Dict]]:
+    """Clean lap time distribution per (track, `bucket`) for the flagged buckets."""
+    source = f"""
+        SELECT s.track AS track, s.{bucket} AS bucket, l.lap_time AS v, l.id AS ord
+        FROM temp._site_sessions s JOIN laps l ON l.session_id = s.session_id
+        WHERE s.{flag} = 1 AND {_lap_filter(has_clean)}
+    """
+    series: Dict[str, List[Dict]] = defaultdict(list)
+    for (track, key), stats in _grouped_stats(cur, source, ("track", "bucket")):
+        series[track].append(_lap_time_point(key, stats))
+    return series
+
+
+def _stats_from_sketch(sketch: LapTimeSketch) -> GroupStats:
+    p25, median, p75 = sketch.quantiles((0.25, 0.5, 0.75))
+    return GroupStats(
+        count=sketch.count,
+        best=sketch.minimum,
+        worst=sketch.maximum,
+        median=median,
+        stddev=sketch.stddev,
+        p25=p25,
+        p75=p75,
+        first_ord=0,
+    )
+
+
+def _day_sketches(
+    cur: sqlite3.Cursor, scope: Optional[BuildScope]
+) -> Tuple[Dict[Tuple[str, str], LapTimeSketch], Dict[Tuple[str, str], LapTimeSketch], List[int]]:
+    """Clean lap-time sketches per (track, day) covering the weeks and months being rebuilt.
+
+    Days being rebuilt, or not materialised yet, are merged from session
+    sketches; the others come from `track_day_sketches`. Returns all day
+    sketches, the freshly merged ones and the sessions whose stored sketch
+    was stale (both to be written back after the read snapshot).
+    """
+    conn = cur.connection
+    stored = load_track_day_sketches(conn, scope.tracks) if scope is not None else {}
+    cur.execute("SELECT session_id, track, date, in_day FROM temp._site_sessions WHERE in_week = 1 OR in_month = 1")
+    day_sessions: Dict[Tuple[str, str], List[int]] = defaultdict(list)
+    for sid, track, date_str, in_day in cur.fetchall():
+        if in_day or (track, date_str) not in stored:
+            day_sessions[(track, date_str)].append(int(sid))
+    session_sketches, stale = session_sketches_for(conn, [sid for ids in day_sessions.values() for sid in ids])
+    fresh = {key: LapTimeSketch.merged(session_sketches[sid] for sid in ids) for key, ids in day_sessions.items()}
+    return {**stored, **fresh}, fresh, stale
+
+
+def _sketch_series(
+    cur: sqlite3.Cursor,
+    day_sketches: Dict[Tuple[str, str], LapTimeSketch],
+    bucket: str,
+    flag: str,
+) -> Dict[str, List[Dict]]:
+    """Like `_lap_time_series`, but merged from the day sketches of each bucket."""
+    cur.execute(
+        f"SELECT DISTINCT track, {bucket}, date FROM temp._site_sessions WHERE {flag} = 1 ORDER BY track, {bucket}"
+    )
+    series: Dict[str, List[Dict]] = defaultdict(list)
+    for (track, key), rows in groupby(cur.fetchall(), key=itemgetter(0, 1)):
+        sketch = LapTimeSketch.merged(day_sketches[(track, date_str)] for _, _, date_str in rows)
+        if sketch.count:
+            series[track].append(_lap_time_point(key, _stats_from_sketch(sketch)))
+    return series
+
+
+def _add_timeseries_context(
+    track_timeseries: Dict[str, List[Dict]],
+    resets_by_track_day: Dict[Tuple[str, str], int],
+) -> None:
+    # Daily points also carry resets and the clean rate, in the published key order
+    for track, points in track_timeseries.items():
+        for i, point in enumerate(points):
+            resets = resets_by_track_day.get((track, point["date"]), 0)
+            attempts = point["completeLaps"] + resets
+            points[i] = {
+                "date": point["date"],
+                "bestLap": point["bestLap"],
+                "medianLap": point["medianLap"],
+                "stdDev": point["stdDev"],
+                "completeLaps": point["completeLaps"],
+                "resets": resets,
+                "cleanRate": round(point["completeLaps"] / attempts, 3) if attempts > 0 else 0.0,
+                "worstLap": point["worstLap"],
+                "p25": point["p25"],
+                "p75": point["p75"],
+                "iqr": point["iqr"],
+            }
+
+
+def _add_rolling_stats(
+    cur: sqlite3.Cursor,
+    track_timeseries: Dict[str, List[Dict]],
+    duration_by_track_day: Dict[Tuple[str, str], float],
+    window_days: int = 7,
+) -> None:
+    """Set cumulative hours and 7-day rolling averages on daily series in-place.
+
+    The published values are already rounded to the millisecond, so the
+    window sums run on integer milliseconds and stay exact however the
+    frame slides.
+    """
+    ms = lambda value: int(round(value * 1000))
+    cur.execute("DELETE FROM temp._site_daily")
+    cur.executemany(
+        "INSERT INTO temp._site_daily VALUES (?, ?, ?, ?, ?, ?)",
+        [
+            (track, p["date"], ms(p["bestLap"]), ms(p["medianLap"]), ms(p["stdDev"]),
+             duration_by_track_day.get((track, p["date"]), 0.0))
+            for track, points in track_timeseries.items()
+            for p in points
+        ],
+    )
+    cur.execute(
+        f"""
+        SELECT track, date,
+               COALESCE(SUM(duration) OVER (
+                   PARTITION BY track ORDER BY date
+                   ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+               ), 0.0) / 3600.0,
+               COUNT(*) OVER w, SUM(best_ms) OVER w, SUM(median_ms) OVER w, SUM(stddev_ms) OVER w
+        FROM temp._site_daily
+        WINDOW w AS (
+            PARTITION BY track ORDER BY julianday(date)
+            RANGE BETWEEN {window_days - 1} PRECEDING AND CURRENT ROW
+        )
+        """
+    )
+    rolling = {(track, date_str): rest for track, date_str, *rest in cur.fetchall()}
+    for track, points in track_timeseries.items():
+        for point in points:
+            cumulative, n, best_ms, median_ms, stddev_ms = rolling[(track, point["date"])]
+            point["cumulativeHours"] = round(cumulative, 2)
+            point["bestLap7d"] = round(best_ms / n / 1000, 3)
+            point["medianLap7d"] = round(median_ms / n / 1000, 3)
+            point["stdDev7d"] = round(stddev_ms / n / 1000, 3)
+
+
+def _incident_series(
+    cur: sqlite3.Cursor,
+    resets_by_track_day: Dict[Tuple[str, str], int],
+    scope: Optional[BuildScope],
+) -> Dict[str, List[Dict]]:
+    cur.execute(
+        """
+        SELECT s.track, s.date,
+               SUM(e.event_type = 'off_track'), SUM(e.event_type = 'spin'), SUM(e.event_type = 'big_save')
+        FROM temp._site_sessions s JOIN events e ON e.session_id = s.session_id
+        WHERE s.in_day = 1 AND e.event_type IN ('off_track', 'spin', 'big_save')
+        GROUP BY s.track, s.date
+        """
+    )
+    incidents_by_track_day = {(track, d): (int(o), int(sp), int(b)) for track, d, o, sp, b in cur.fetchall()}
+
+    # Count ALL laps (including resets) per track per day for incident rate
+    # denominator — incidents happen during reset attempts too, so dividing
+    # only by completed non-reset laps inflates the rate
+    cur.execute(
+        """
+        SELECT s.track, s.date, COUNT(*)
+        FROM temp._site_sessions s JOIN laps l ON l.session_id = s.session_id
+        WHERE s.in_day = 1 AND l.is_complete = 1
+        GROUP BY s.track, s.date
+        """
+    )
+    all_laps_by_track_day = {(track, d): int(n) for track, d, n in cur.fetchall()}
+
+    track_incidents: Dict[str, List[Dict]] = defaultdict(list)
+    all_incident_dates = (
+        set(incidents_by_track_day)
+        | set(all_laps_by_track_day)
+        | {key for key in resets_by_track_day if _wanted(scope, "days", key)}
+    )
+    for track, date_str in sorted(all_incident_dates):
+        off_tracks, spins, big_saves = incidents_by_track_day.get((track, date_str), (0, 0, 0))
+        resets = resets_by_track_day.get((track, date_str), 0)
+        completed_laps = all_laps_by_track_day.get((track, date_str), 0)
+        total_events = off_tracks + spins + big_saves + resets
+        attempts = completed_laps + resets
+        if attempts == 0 and total_events == 0:
+            continue
+        events_per_lap = round(total_events / attempts, 3) if attempts > 0 else 0.0
+        resets_per_lap = round(resets / attempts, 3) if attempts > 0 else 0.0
+        track_incidents[track].append({
+            "date": date_str,
+            "offTracks": off_tracks,
+            "spins": spins,
+            "bigSaves": big_saves,
+            "resets": resets,
+            "resetsPerLap": resets_per_lap,
+            "eventsPerLap": events_per_lap,
+            "totalLaps": attempts,
+        })
+    return track_incidents
+
+
+def _session_type_series(cur: sqlite3.Cursor) -> Dict[str, List[Dict]]:
+    cur.execute(
+        """
+        SELECT s.track, s.week, ss.classified_session_type, COUNT(*)
+        FROM temp._site_sessions s JOIN sessions ss ON ss.id = s.session_id
+        WHERE ss.classified_session_type IS NOT NULL AND ss.classified_session_type != ''
+        GROUP BY s.track, s.week, ss.classified_session_type
+        ORDER BY s.track, s.week
+        """
+    )
+    types_by_track_week: Dict[Tuple[str, str], Dict[str, int]] = {}
+    for track, week, stype, count in cur.fetchall():
+        counts = types_by_track_week.setdefault(
+            (track, week), {"corner_isolation": 0, "hot_laps": 0, "race_sim": 0, "mixed": 0}
+        )
+        if stype in counts:
+            counts[stype] += int(count)
+
+    track_session_types: Dict[str, List[Dict]] = defaultdict(list)
+    for (track, week_start), counts in types_by_track_week.items():
+        track_session_types[track].append({
+            "date": week_start,
+            "cornerIsolation": counts["corner_isolation"],
+            "hotLaps": counts["hot_laps"],
+            "raceSim": counts["race_sim"],
+            "mixed": counts["mixed"],
+        })
+    return track_session_types
 
-def _iso_week(date_str: str) -> str:
-    d = datetime.strptime(date_str, "%Y-%m-%d")
-    monday = d - timedelta(days=d.weekday())
-    return monday.strftime("%Y-%m-%d")
+
+def _sector_series(cur: sqlite3.Cursor, has_clean: bool) -> Dict[str, List[Dict]]:
+    source = f"""
+        SELECT s.track AS track, s.date AS bucket, st.sector_name AS sector, st.sector_time AS v, st.id AS ord
+        FROM temp._site_sessions s
+        JOIN sector_times st ON st.session_id = s.session_id
+        JOIN laps l ON l.id = st.lap_id
+        WHERE s.in_day = 1 AND st.sector_time IS NOT NULL AND {_sector_lap_filter(has_clean)}
+    """
+    grouped: Dict[Tuple[str, str], List[Tuple[int, str, GroupStats]]] = defaultdict(list)
+    for (track, date_str, sector_name), stats in _grouped_stats(cur, source, ("track", "bucket", "sector")):
+        grouped[(track, date_str)].append((stats.first_ord, sector_name, stats))
+
+    track_sectors: Dict[str, List[Dict]] = defaultdict(list)
+    for (track, date_str), entries in sorted(grouped.items()):
+        # Sectors in track order (first stored row), not alphabetical
+        sectors = {
+            name: {
+                "best": round(stats.best, 3),
+                "median": round(stats.median, 3),
+                "stddev": round(stats.stddev, 3),
+            }
+            for _, name, stats in sorted(entries, key=lambda e: e[0])
+        }
+        track_sectors[track].append({"date": date_str, "sectors": sectors})
+    return track_sectors
+
+
+def _baseline_entries(cur: sqlite3.Cursor, has_clean: bool, has_sector_table: bool) -> Dict[str, List[Dict]]:
+    """Baseline session exports in a fixed number of queries, however many baselines exist."""
+    lap_source = f"""
+        SELECT s.session_id AS session_id, s.track AS track, s.date AS date, l.lap_time AS v, l.lap_number AS ord
+        FROM temp._site_sessions s
+        JOIN sessions ss ON ss.id = s.session_id
+        JOIN laps l ON l.session_id = s.session_id
+        WHERE s.in_track = 1 AND ss.is_baseline = 1 AND l.lap_time > 0 AND {_sector_lap_filter(has_clean)}
+    """
+    cur.execute(f"SELECT session_id, track, date, v FROM ({lap_source}) ORDER BY session_id, ord")
+    laps_by_session: Dict[int, List[float]] = defaultdict(list)
+    session_keys: Dict[int, Tuple[str, str]] = {}
+    for sid, track, date_str, lap_time in cur.fetchall():
+        laps_by_session[int(sid)].append(float(lap_time))
+        session_keys[int(sid)] = (track, date_str)
+    if not laps_by_session:
+        return {}
+
+    stats_by_session = {
+        int(key[0]): stats for key, stats in _grouped_stats(cur, lap_source, ("session_id",))
+    }
+
+    sectors_by_session: Dict[int, List[Tuple[int, str, GroupStats]]] = defaultdict(list)
+    if has_sector_table:
+        sector_source = f"""
+            SELECT s.session_id AS session_id, st.sector_name AS sector, st.sector_time AS v, st.id AS ord
+            FROM temp._site_sessions s
+            JOIN sessions ss ON ss.id = s.session_id
+            JOIN sector_times st ON st.session_id = s.session_id
+            JOIN laps l ON l.id = st.lap_id
+            WHERE s.in_track = 1 AND ss.is_baseline = 1 AND st.sector_time IS NOT NULL
+              AND {_sector_lap_filter(has_clean)}
+        """
+        try:
+            for (sid, sector_name), stats in _grouped_stats(cur, sector_source, ("session_id", "sector")):
+                sectors_by_session[int(sid)].append((stats.first_ord, sector_name, stats))
+        except sqlite3.OperationalError:
+            pass
+
+    baselines_by_track: Dict[str, List[Dict]] = defaultdict(list)
+    for sid in sorted(laps_by_session):
+        lap_times = laps_by_session[sid]
+        stats = stats_by_session[sid]
+        btrack, bdate = session_keys[sid]
+        baseline_entry: Dict = {
+            "date": bdate,
+            "sessionId": sid,
+            "laps": [round(t, 3) for t in lap_times],
+            "median": round(stats.median, 3),
+            "best": round(stats.best, 3),
+            "worst": round(stats.worst, 3),
+            "stddev": round(stats.stddev, 3),
+            "iqr": round(stats.p75 - stats.p25, 3),
+            "p25": round(stats.p25, 3),
+            "p75": round(stats.p75, 3),
+            "cleanLapCount": len(lap_times),
+        }
+        if sectors_by_session.get(sid):
+            baseline_entry["sectors"] = {
+                name: {"best": round(s.best, 3), "median": round(s.median, 3)}
+                for _, name, s in sorted(sectors_by_session[sid], key=lambda e: e[0])
+            }
+        baselines_by_track[btrack].append(baseline_entry)
+    return baselines_by_track
+
+
+def _trace_laps(
+    cur: sqlite3.Cursor, has_clean: bool, has_baseline: bool
+) -> Tuple[Dict[str, List[Dict]], List[TraceLap]]:
+    """Laps to export traces for: each track's personal best and each baseline session's best."""
+    ranked = [f"""
+        SELECT 'pb' AS kind, l.id AS lap_id,
+               ROW_NUMBER() OVER (PARTITION BY s.track ORDER BY l.lap_time, l.id) AS rn
+        FROM temp._site_sessions s JOIN laps l ON l.session_id = s.session_id
+        WHERE s.in_track = 1 AND {_lap_filter(has_clean)}
+    """]
+    if has_baseline:
+        ranked.append(f"""
+            SELECT 'baseline', l.id, ROW_NUMBER() OVER (PARTITION BY s.session_id ORDER BY l.lap_time, l.id)
+            FROM temp._site_sessions s
+            JOIN sessions ss ON ss.id = s.session_id
+            JOIN laps l ON l.session_id = s.session_id
+            WHERE s.in_track = 1 AND ss.is_baseline = 1 AND l.lap_time > 0 AND {_sector_lap_filter(has_clean)}
+        """)
+    cur.execute(
+        f"""
+        SELECT r.kind, l.id, l.session_id, l.lap_number, l.lap_time, l.start_time, l.end_time,
+               s.track, s.date, ss.file_path
+        FROM ({" UNION ALL ".join(ranked)}) r
+        JOIN laps l ON l.id = r.lap_id
+        JOIN temp._site_sessions s ON s.session_id = l.session_id
+        JOIN sessions ss ON ss.id = l.session_id
+        WHERE r.rn = 1
+        ORDER BY s.track, l.id
+        """
+    )
+    entries: Dict[int, Dict] = {}
+    track_of: Dict[int, str] = {}
+    laps: List[TraceLap] = []
+    for kind, lap_id, sid, lap_number, lap_time, start, end, track, date_str, file_path in cur.fetchall():
+        lap_id = int(lap_id)
+        if lap_id in entries:
+            entries[lap_id]["kinds"].append(kind)
+            continue
+        entries[lap_id] = {
+            "lapId": lap_id,
+            "sessionId": int(sid),
+            "lapNumber": lap_number,
+            "date": date_str,
+            "lapTime": round(lap_time, 3),
+            "kinds": [kind],
+        }
+        track_of[lap_id] = track
+        laps.append(TraceLap(lap_id, int(sid), file_path, float(start), float(end)))
+
+    by_track: Dict[str, List[Dict]] = defaultdict(list)
+    for lap_id, entry in entries.items():
+        by_track[track_of[lap_id]].append(entry)
+    return by_track, laps
 
 
 def main() -> None:
     parser = argparse.ArgumentParser(description="Build JSON data for the website")
     parser.add_argument("--db", default="data/telemetry.db", help="SQLite database path")
     parser.add_argument("--output", default="../russelljadams/public/data", help="Output folder for JSON data")
+    parser.add_argument("--full", action="store_true",
+                        help="Rebuild everything instead of only what changed since the last build")
+    parser.add_argument("--trace-points", type=int, default=DEFAULT_TRACE_POINTS,
+                        help="Point budget per channel for exported lap traces (0 disables trace export)")
     args = parser.parse_args()
 
     db_path = Path(args.db)
@@ -167,6 +890,7 @@ def main() -> None:
     tracks_config_dir = script_dir.parent / "tracks"
 
     conn = sqlite3.connect(db_path)
+    conn.create_function("pct_bin", 1, lambda v: None if v is None else _bin_index(v), deterministic=True)
     cur = conn.cursor()
     cur.execute(
         """
@@ -179,51 +903,75 @@ def main() -> None:
         );
         """
     )
+    for sql in _SITE_TABLES_SQL:
+        cur.execute(sql)
+    init_sketch_tables(conn)
+    conn.commit()
+    # Read everything from one snapshot so a concurrent ingest (WAL) is
+    # either fully visible or not at all
+    cur.execute("BEGIN")
 
     has_clean = _has_column(cur, "laps", "is_clean")
     has_classified = _has_column(cur, "sessions", "classified_session_type")
     has_baseline = _has_column(cur, "sessions", "is_baseline")
     has_sector_table = _has_table(cur, "sector_times")
+    has_data_version = _has_column(cur, "sessions", "data_version")
+
+    # ── Change detection ───────────────────────────────────────────
+    watermarks = _read_watermarks(cur) if has_data_version else None
+    state = None if args.full or not has_data_version else _load_state(output_root)
+    changed_ids = _changed_sessions(cur, state) if state else None
+    if changed_ids is not None and not changed_ids:
+        print("Site data is up to date.")
+        conn.close()
+        return
 
     # ── Load all sessions ──────────────────────────────────────────
+    cur.execute("SELECT id, file_path, session_start_time, session_end_time FROM sessions")
+    site_sessions: Dict[int, Tuple[str, str, float]] = {}
+    for session_id, file_path, start_time, end_time in cur.fetchall():
+        track, date_str, is_valid = parse_file_metadata(file_path)
+        if not is_valid:
+            continue
+        if date_str < "2026-01-01" or date_str > "2026-12-31":
+            continue
+        site_sessions[int(session_id)] = (track, date_str, (end_time or 0) - (start_time or 0))
+
+    # Session-level totals are cheap and always complete. Lap-level series
+    # are only recomputed for the (track, day/week/month) buckets holding a
+    # changed session and spliced into the existing files.
+    scope: Optional[BuildScope] = None
+    if changed_ids is not None:
+        scope = BuildScope({site_sessions[sid][:2] for sid in changed_ids if sid in site_sessions})
+    _stage_sessions(cur, site_sessions, scope)
+
+    # ── Session-level rollups per (day, track) ─────────────────────
+    clean_expr = (
+        "CASE WHEN is_clean = 1 THEN 1 ELSE 0 END"
+        if has_clean
+        else "CASE WHEN is_complete = 1 AND is_reset = 0 THEN 1 ELSE 0 END"
+    )
     cur.execute(
-        """
-        SELECT id, file_path, session_start_time, session_end_time, session_lap_count
-        FROM sessions
+        f"""
+        SELECT s.date, s.track, COUNT(*), SUM(s.duration), SUM(COALESCE(c.clean_laps, 0))
+        FROM temp._site_sessions s
+        LEFT JOIN (
+            SELECT session_id, SUM({clean_expr}) AS clean_laps FROM laps GROUP BY session_id
+        ) c ON c.session_id = s.session_id
+        GROUP BY s.date, s.track
+        ORDER BY MIN(s.session_id)
         """
     )
-    sessions = cur.fetchall()
-
-    cur.execute("SELECT session_id, lap_dist_pct FROM reset_events")
-    reset_rows = cur.fetchall()
-
-    resets_by_session: Dict[int, List[float]] = defaultdict(list)
-    for session_id, lap_dist_pct in reset_rows:
-        resets_by_session[int(session_id)].append(float(lap_dist_pct))
+    rollups = cur.fetchall()
 
-    if has_clean:
-        cur.execute(
-            """
-            SELECT session_id,
-                   SUM(CASE WHEN is_clean = 1 THEN 1 ELSE 0 END) as clean_laps,
-                   SUM(CASE WHEN is_reset = 1 THEN 1 ELSE 0 END) as reset_count
-            FROM laps
-            GROUP BY session_id
-            """
-        )
-    else:
-        cur.execute(
-            """
-            SELECT session_id,
-                   SUM(CASE WHEN is_complete = 1 AND is_reset = 0 THEN 1 ELSE 0 END) as clean_laps,
-                   SUM(CASE WHEN is_reset = 1 THEN 1 ELSE 0 END) as reset_count
-            FROM laps
-            GROUP BY session_id
-            """
-        )
-    lap_counts_by_session: Dict[int, Tuple[int, int]] = {}
-    for sid, clean_laps, reset_count in cur.fetchall():
-        lap_counts_by_session[int(sid)] = (int(clean_laps), int(reset_count))
+    cur.execute(
+        """
+        SELECT s.date, s.track, pct_bin(r.lap_dist_pct) AS bin, COUNT(*)
+        FROM temp._site_sessions s JOIN reset_events r ON r.session_id = s.session_id
+        GROUP BY s.date, s.track, bin
+        """
+    )
+    reset_bin_rows = cur.fetchall()
 
     total_sessions = 0
     total_laps = 0
@@ -234,38 +982,18 @@ def main() -> None:
         lambda: {"sessions": 0, "duration_s": 0.0, "laps": 0}
     )
 
-    # overall_bins computed after session loop (only valid sessions)
-    valid_reset_values: List[float] = []
-
     daily_data: Dict[str, Dict] = {}
     track_data: Dict[str, Dict] = {}
 
-    session_track_date: Dict[int, Tuple[str, str]] = {}
-    session_classified_type: Dict[int, Optional[str]] = {}
-
-    if has_classified:
-        cur.execute("SELECT id, classified_session_type FROM sessions")
-        for sid, stype in cur.fetchall():
-            session_classified_type[int(sid)] = stype
-
-    for session_id, file_path, start_time, end_time, lap_count in sessions:
-        track, date_str, is_valid = parse_file_metadata(file_path)
-        if not is_valid:
-            continue
-        if date_str < "2026-01-01" or date_str > "2026-12-31":
-            continue
-        duration_s = (end_time or 0) - (start_time or 0)
-        clean_laps, reset_count = lap_counts_by_session.get(int(session_id), (0, 0))
-        resets = resets_by_session.get(int(session_id), [])
-        total_sessions += 1
+    for date_str, track, session_count, duration_s, clean_laps in rollups:
+        duration_s = float(duration_s)
+        clean_laps = int(clean_laps)
+        total_sessions += session_count
         total_laps += clean_laps
         total_duration_s += duration_s
-        total_resets += len(resets)
-
-        session_track_date[int(session_id)] = (track, date_str)
 
         month_key = date_str[:7]
-        monthly_accum[month_key]["sessions"] += 1
+        monthly_accum[month_key]["sessions"] += session_count
         monthly_accum[month_key]["duration_s"] += duration_s
         monthly_accum[month_key]["laps"] += clean_laps
 
@@ -276,25 +1004,18 @@ def main() -> None:
             "durationSeconds": 0.0,
             "resets": 0,
             "resetHotspotsBins": [],
-            "tracks": defaultdict(lambda: {
-                "sessions": 0,
-                "laps": 0,
-                "durationSeconds": 0.0,
-                "resets": 0,
-                "resetHotspotsBins": [],
-            }),
+            "tracks": {},
         })
-
-        day["sessions"] += 1
+        day["sessions"] += session_count
         day["laps"] += clean_laps
         day["durationSeconds"] += duration_s
-        day["resets"] += len(resets)
-
-        track_entry = day["tracks"][track]
-        track_entry["sessions"] += 1
-        track_entry["laps"] += clean_laps
-        track_entry["durationSeconds"] += duration_s
-        track_entry["resets"] += len(resets)
+        day["tracks"][track] = {
+            "sessions": session_count,
+            "laps": clean_laps,
+            "durationSeconds": duration_s,
+            "resets": 0,
+            "resetHotspotsBins": [],
+        }
 
         track_root = track_data.setdefault(track, {
             "track": track,
@@ -304,267 +1025,93 @@ def main() -> None:
             "resets": 0,
             "resetHotspotsBins": [],
         })
-        track_root["sessions"] += 1
+        track_root["sessions"] += session_count
         track_root["laps"] += clean_laps
         track_root["durationSeconds"] += duration_s
-        track_root["resets"] += len(resets)
 
-        track_root.setdefault("_reset_values", []).extend(resets)
-        day.setdefault("_reset_values", []).extend(resets)
-        track_entry.setdefault("_reset_values", []).extend(resets)
-        valid_reset_values.extend(resets)
+    # Reset hotspot bins: counts per (day, track, bin) merged upwards
+    overall_counts: Dict[int, int] = defaultdict(int)
+    day_counts: Dict[str, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+    day_track_counts: Dict[Tuple[str, str], Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+    track_counts: Dict[str, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+    for date_str, track, bin_idx, count in reset_bin_rows:
+        count = int(count)
+        total_resets += count
+        daily_data[date_str]["resets"] += count
+        daily_data[date_str]["tracks"][track]["resets"] += count
+        track_data[track]["resets"] += count
+        if bin_idx is None:
+            continue
+        overall_counts[bin_idx] += count
+        day_counts[date_str][bin_idx] += count
+        day_track_counts[(date_str, track)][bin_idx] += count
+        track_counts[track][bin_idx] += count
 
     for date_str, day in daily_data.items():
-        day["resetHotspotsBins"] = build_bins(day.get("_reset_values", []))
-        for track_name, track_entry in list(day["tracks"].items()):
-            track_entry["resetHotspotsBins"] = build_bins(track_entry.get("_reset_values", []))
-            track_entry.pop("_reset_values", None)
-            day["tracks"][track_name] = track_entry
-        day.pop("_reset_values", None)
-        day["tracks"] = dict(day["tracks"])
+        day["resetHotspotsBins"] = _bins_from_counts(day_counts.get(date_str, {}))
+        for track_name, track_entry in day["tracks"].items():
+            track_entry["resetHotspotsBins"] = _bins_from_counts(day_track_counts.get((date_str, track_name), {}))
 
     for track_name, track_entry in track_data.items():
-        track_entry["resetHotspotsBins"] = build_bins(track_entry.get("_reset_values", []))
-        track_entry.pop("_reset_values", None)
+        track_entry["resetHotspotsBins"] = _bins_from_counts(track_counts.get(track_name, {}))
 
-    # ── Build resets-by-(track, day) lookup from daily_data ───────
+    # ── Build (track, day) lookups from daily_data ─────────────────
     resets_by_track_day: Dict[Tuple[str, str], int] = {}
+    duration_by_track_day: Dict[Tuple[str, str], float] = {}
     for date_str, day in daily_data.items():
-        for track_name, track_entry in day.get("tracks", {}).items():
-            resets_by_track_day[(track_name, date_str)] = track_entry.get("resets", 0)
-
-    # ── Track daily time-series (enhanced with p25/p75/iqr) ────────
+        for track_name, track_entry in day["tracks"].items():
+            resets_by_track_day[(track_name, date_str)] = track_entry["resets"]
+            duration_by_track_day[(track_name, date_str)] = track_entry["durationSeconds"]
+
+    # ── Lap time series: daily (with p25/p75/iqr), weekly, monthly ─
+    track_timeseries = _lap_time_series(cur, has_clean, "date", "in_day")
+    _add_timeseries_context(track_timeseries, resets_by_track_day)
+    # Weekly and monthly merge per-day sketches rather than re-reading every lap
+    fresh_day_sketches: Dict[Tuple[str, str], LapTimeSketch] = {}
+    stale_sketch_ids: List[int] = []
     if has_clean:
-        cur.execute(
-            "SELECT session_id, lap_time FROM laps WHERE is_clean = 1"
-        )
+        day_sketches, fresh_day_sketches, stale_sketch_ids = _day_sketches(cur, scope)
+        track_weekly = _sketch_series(cur, day_sketches, "week", "in_week")
+        track_monthly = _sketch_series(cur, day_sketches, "month", "in_month")
     else:
-        cur.execute(
-            """
-            SELECT session_id, lap_time
-            FROM laps
-            WHERE is_complete = 1 AND is_reset = 0 AND lap_time > 0
-            """
-        )
-    lap_rows = cur.fetchall()
-    lap_times_by_track_day: Dict[Tuple[str, str], List[float]] = defaultdict(list)
-    for session_id, lap_time in lap_rows:
-        key = session_track_date.get(int(session_id))
-        if not key:
-            continue
-        track, date_str = key
-        t = float(lap_time)
-        if not has_clean:
-            min_time = DEFAULT_MIN_TIMES.get(track, 30.0)
-            max_time = DEFAULT_MAX_TIMES.get(track, GLOBAL_MAX_LAP_TIME)
-            if t < min_time or t > max_time:
-                continue
-        lap_times_by_track_day[(track, date_str)].append(t)
-
-    track_timeseries: Dict[str, List[Dict]] = defaultdict(list)
-    for (track, date_str), times in sorted(lap_times_by_track_day.items()):
-        if not times:
-            continue
-        sorted_times = sorted(times)
-        best = sorted_times[0]
-        worst = sorted_times[-1]
-        med = median(sorted_times)
-        stddev = pstdev(sorted_times) if len(sorted_times) > 1 else 0.0
-        p25 = _percentile(sorted_times, 0.25)
-        p75 = _percentile(sorted_times, 0.75)
-        completed = len(times)
-        resets = resets_by_track_day.get((track, date_str), 0)
-        attempts = completed + resets
-        clean_rate = round(completed / attempts, 3) if attempts > 0 else 0.0
-        track_timeseries[track].append(
-            {
-                "date": date_str,
-                "bestLap": round(best, 3),
-                "medianLap": round(med, 3),
-                "stdDev": round(stddev, 3),
-                "completeLaps": completed,
-                "resets": resets,
-                "cleanRate": clean_rate,
-                "worstLap": round(worst, 3),
-                "p25": round(p25, 3),
-                "p75": round(p75, 3),
-                "iqr": round(p75 - p25, 3),
-            }
-        )
-
-    # Add cumulative hours per track
-    # Build duration lookup: (track, date) -> seconds
-    duration_by_track_day: Dict[Tuple[str, str], float] = {}
-    for date_str, day in daily_data.items():
-        for track_name, track_entry in day.get("tracks", {}).items():
-            duration_by_track_day[(track_name, date_str)] = track_entry.get("durationSeconds", 0.0)
-
-    for track, points in track_timeseries.items():
-        cumulative = 0.0
-        for point in points:
-            day_duration = duration_by_track_day.get((track, point["date"]), 0.0)
-            point["cumulativeHours"] = round(cumulative, 2)
-            cumulative += day_duration / 3600.0
-
-    # Add 7-day rolling averages
-    for track in track_timeseries:
-        _add_rolling_averages(track_timeseries[track])
-
-    # ── Weekly and monthly aggregations (enhanced) ─────────────────
-    lap_times_by_track_week: Dict[Tuple[str, str], List[float]] = defaultdict(list)
-    lap_times_by_track_month: Dict[Tuple[str, str], List[float]] = defaultdict(list)
-    for (track, date_str), times in lap_times_by_track_day.items():
-        week_key = _iso_week(date_str)
-        month_key = date_str[:7]
-        lap_times_by_track_week[(track, week_key)].extend(times)
-        lap_times_by_track_month[(track, month_key)].extend(times)
-
-    def _build_agg_point(date_key: str, times: List[float]) -> Dict:
-        sorted_times = sorted(times)
-        p25 = _percentile(sorted_times, 0.25)
-        p75 = _percentile(sorted_times, 0.75)
-        return {
-            "date": date_key,
-            "bestLap": round(sorted_times[0], 3),
-            "medianLap": round(median(sorted_times), 3),
-            "stdDev": round(pstdev(sorted_times), 3) if len(sorted_times) > 1 else 0.0,
-            "completeLaps": len(sorted_times),
-            "worstLap": round(sorted_times[-1], 3),
-            "p25": round(p25, 3),
-            "p75": round(p75, 3),
-            "iqr": round(p75 - p25, 3),
-        }
-
-    track_weekly: Dict[str, List[Dict]] = defaultdict(list)
-    for (track, week_start), times in sorted(lap_times_by_track_week.items()):
-        if times:
-            track_weekly[track].append(_build_agg_point(week_start, times))
-
-    track_monthly: Dict[str, List[Dict]] = defaultdict(list)
-    for (track, month), times in sorted(lap_times_by_track_month.items()):
-        if times:
-            track_monthly[track].append(_build_agg_point(month, times))
+        track_weekly = _lap_time_series(cur, has_clean, "week", "in_week")
+        track_monthly = _lap_time_series(cur, has_clean, "month", "in_month")
 
     # ── Incident event trends ──────────────────────────────────────
-    cur.execute("SELECT session_id, event_type FROM events")
-    event_rows = cur.fetchall()
-    incidents_by_track_day: Dict[Tuple[str, str], Dict[str, int]] = defaultdict(
-        lambda: {"off_track": 0, "spin": 0, "big_save": 0}
-    )
-    for session_id, event_type in event_rows:
-        key = session_track_date.get(int(session_id))
-        if not key:
-            continue
-        track, date_str = key
-        if event_type in ("off_track", "spin", "big_save"):
-            incidents_by_track_day[(track, date_str)][event_type] += 1
-
-    # Count ALL laps (including resets) per track per day for incident rate
-    # denominator — incidents happen during reset attempts too, so dividing
-    # only by completed non-reset laps inflates the rate
-    cur.execute("SELECT session_id FROM laps WHERE is_complete = 1")
-    all_laps_by_track_day: Dict[Tuple[str, str], int] = defaultdict(int)
-    for (session_id,) in cur.fetchall():
-        key = session_track_date.get(int(session_id))
-        if key:
-            all_laps_by_track_day[key] += 1
-
-    track_incidents: Dict[str, List[Dict]] = defaultdict(list)
-    all_incident_dates = (
-        set(incidents_by_track_day.keys())
-        | set(all_laps_by_track_day.keys())
-        | set(resets_by_track_day.keys())
-    )
-    for track, date_str in sorted(all_incident_dates):
-        counts = incidents_by_track_day.get(
-            (track, date_str), {"off_track": 0, "spin": 0, "big_save": 0}
-        )
-        resets = resets_by_track_day.get((track, date_str), 0)
-        completed_laps = all_laps_by_track_day.get((track, date_str), 0)
-        total_events = counts["off_track"] + counts["spin"] + counts["big_save"] + resets
-        attempts = completed_laps + resets
-        if attempts == 0 and total_events == 0:
-            continue
-        events_per_lap = round(total_events / attempts, 3) if attempts > 0 else 0.0
-        resets_per_lap = round(resets / attempts, 3) if attempts > 0 else 0.0
-        track_incidents[track].append({
-            "date": date_str,
-            "offTracks": counts["off_track"],
-            "spins": counts["spin"],
-            "bigSaves": counts["big_save"],
-            "resets": resets,
-            "resetsPerLap": resets_per_lap,
-            "eventsPerLap": events_per_lap,
-            "totalLaps": attempts,
-        })
+    track_incidents = _incident_series(cur, resets_by_track_day, scope)
 
     # ── Session type distribution (by ISO week) ────────────────────
-    track_session_types: Dict[str, List[Dict]] = defaultdict(list)
-    if has_classified:
-        types_by_track_week: Dict[Tuple[str, str], Dict[str, int]] = defaultdict(
-            lambda: {"corner_isolation": 0, "hot_laps": 0, "race_sim": 0, "mixed": 0}
-        )
-        for sid, stype in session_classified_type.items():
-            key = session_track_date.get(sid)
-            if not key or not stype:
-                continue
-            track, date_str = key
-            week = _iso_week(date_str)
-            if stype in types_by_track_week[(track, week)]:
-                types_by_track_week[(track, week)][stype] += 1
-
-        for (track, week_start), counts in sorted(types_by_track_week.items()):
-            track_session_types[track].append({
-                "date": week_start,
-                "cornerIsolation": counts["corner_isolation"],
-                "hotLaps": counts["hot_laps"],
-                "raceSim": counts["race_sim"],
-                "mixed": counts["mixed"],
-            })
+    track_session_types = _session_type_series(cur) if has_classified else {}
 
     # ── Sector times ───────────────────────────────────────────────
-    track_sectors: Dict[str, List[Dict]] = defaultdict(list)
+    track_sectors: Dict[str, List[Dict]] = {}
     if has_sector_table:
-        sector_query = (
-            """
-            SELECT st.session_id, st.sector_name, st.sector_time
-            FROM sector_times st
-            JOIN laps l ON st.lap_id = l.id
-            WHERE l.is_clean = 1
-            """
-            if has_clean
-            else """
-            SELECT st.session_id, st.sector_name, st.sector_time
-            FROM sector_times st
-            JOIN laps l ON st.lap_id = l.id
-            WHERE l.is_complete = 1 AND l.is_reset = 0
-            """
-        )
         try:
-            cur.execute(sector_query)
-            sector_rows = cur.fetchall()
-            sector_times_grouped: Dict[Tuple[str, str, str], List[float]] = defaultdict(list)
-            for s_session_id, sector_name, sector_time in sector_rows:
-                key = session_track_date.get(int(s_session_id))
-                if not key or sector_time is None:
-                    continue
-                track, date_str = key
-                sector_times_grouped[(track, date_str, sector_name)].append(float(sector_time))
-
-            sector_by_track_date: Dict[Tuple[str, str], Dict[str, Dict]] = defaultdict(dict)
-            for (track, date_str, sector_name), stimes in sector_times_grouped.items():
-                sorted_st = sorted(stimes)
-                sector_by_track_date[(track, date_str)][sector_name] = {
-                    "best": round(sorted_st[0], 3),
-                    "median": round(median(sorted_st), 3),
-                    "stddev": round(pstdev(sorted_st), 3) if len(sorted_st) > 1 else 0.0,
-                }
-
-            for (track, date_str), sectors in sorted(sector_by_track_date.items()):
-                track_sectors[track].append({"date": date_str, "sectors": sectors})
+            track_sectors = _sector_series(cur, has_clean)
         except sqlite3.OperationalError:
             pass
 
+    # ── Splice scoped series into the previous build ───────────────
+    tracks_dir = output_root / "tracks"
+    if scope is not None:
+        for track in scope.tracks:
+            safe_name = track.replace(" ", "-")
+            for series_by_track, suffix, kind in (
+                (track_timeseries, "timeseries", "days"),
+                (track_weekly, "weekly", "weeks"),
+                (track_monthly, "monthly", "months"),
+                (track_incidents, "incidents", "days"),
+                (track_sectors, "sectors", "days"),
+            ):
+                series_by_track[track] = _splice(
+                    _load_series(tracks_dir / f"{safe_name}-{suffix}.json"),
+                    series_by_track.get(track, []),
+                    scope.keys_for(track, kind),
+                )
+
+    # Cumulative hours and 7-day rolling averages over the full daily series
+    _add_rolling_stats(cur, track_timeseries, duration_by_track_day)
+
     # ── Gap-to-reference ───────────────────────────────────────────
     references: Dict = {}
     refs_path = output_root / "references.json"
@@ -601,89 +1148,17 @@ def main() -> None:
                 continue
 
     # ── Baseline session exports ───────────────────────────────────
-    baselines_by_track: Dict[str, List[Dict]] = defaultdict(list)
-    if has_baseline:
-        cur.execute(
-            """
-            SELECT id, file_path, session_start_time, session_end_time
-            FROM sessions WHERE is_baseline = 1
-            """
-        )
-        baseline_sessions = cur.fetchall()
-        for bsid, bpath, bstart, bend in baseline_sessions:
-            bkey = session_track_date.get(int(bsid))
-            if not bkey:
-                continue
-            btrack, bdate = bkey
-
-            if has_clean:
-                cur.execute(
-                    "SELECT lap_time FROM laps WHERE session_id = ? AND is_clean = 1 ORDER BY lap_number",
-                    (bsid,),
-                )
-            else:
-                cur.execute(
-                    "SELECT lap_time FROM laps WHERE session_id = ? AND is_complete = 1 AND is_reset = 0 ORDER BY lap_number",
-                    (bsid,),
-                )
-            lap_times = [float(r[0]) for r in cur.fetchall() if r[0] is not None and r[0] > 0]
-            if not lap_times:
-                continue
-
-            sorted_laps = sorted(lap_times)
-            p25 = _percentile(sorted_laps, 0.25)
-            p75 = _percentile(sorted_laps, 0.75)
-
-            baseline_entry: Dict = {
-                "date": bdate,
-                "sessionId": int(bsid),
-                "laps": [round(t, 3) for t in lap_times],
-                "median": round(median(sorted_laps), 3),
-                "best": round(sorted_laps[0], 3),
-                "worst": round(sorted_laps[-1], 3),
-                "stddev": round(pstdev(sorted_laps), 3) if len(sorted_laps) > 1 else 0.0,
-                "iqr": round(p75 - p25, 3),
-                "p25": round(p25, 3),
-                "p75": round(p75, 3),
-                "cleanLapCount": len(lap_times),
-            }
+    baselines_by_track: Dict[str, List[Dict]] = (
+        _baseline_entries(cur, has_clean, has_sector_table) if has_baseline else {}
+    )
 
-            if has_sector_table:
-                try:
-                    sq = (
-                        """
-                        SELECT st.sector_name, st.sector_time
-                        FROM sector_times st JOIN laps l ON st.lap_id = l.id
-                        WHERE st.session_id = ? AND l.is_clean = 1
-                        """
-                        if has_clean
-                        else """
-                        SELECT st.sector_name, st.sector_time
-                        FROM sector_times st JOIN laps l ON st.lap_id = l.id
-                        WHERE st.session_id = ? AND l.is_complete = 1 AND l.is_reset = 0
-                        """
-                    )
-                    cur.execute(sq, (bsid,))
-                    sec_rows = cur.fetchall()
-                    sec_data: Dict[str, List[float]] = defaultdict(list)
-                    for sname, stime in sec_rows:
-                        if stime is not None:
-                            sec_data[sname].append(float(stime))
-                    if sec_data:
-                        sectors: Dict[str, Dict] = {}
-                        for sname, stimes in sec_data.items():
-                            ss = sorted(stimes)
-                            sectors[sname] = {
-                                "best": round(ss[0], 3),
-                                "median": round(median(ss), 3),
-                            }
-                        baseline_entry["sectors"] = sectors
-                except sqlite3.OperationalError:
-                    pass
-
-            baselines_by_track[btrack].append(baseline_entry)
+    # ── Lap traces (personal-best and baseline laps) ───────────────
+    trace_entries, trace_laps = (
+        _trace_laps(cur, has_clean, has_baseline) if args.trace_points > 0 else ({}, [])
+    )
 
     # ── Write outputs ──────────────────────────────────────────────
+    out = OutputWriter(output_root)
     latest_day = max(daily_data.keys()) if daily_data else None
 
     monthly_breakdown = []
@@ -696,7 +1171,7 @@ def main() -> None:
             "laps": int(acc["laps"]),
         })
 
-    overall_bins = build_bins(valid_reset_values)
+    overall_bins = _bins_from_counts(overall_counts)
 
     summary = {
         "generatedAt": datetime.utcnow().isoformat() + "Z",
@@ -714,83 +1189,88 @@ def main() -> None:
         "feb2026Hours": round(monthly_accum.get("2026-02", {}).get("duration_s", 0) / 3600, 2),
     }
 
-    (output_root / "summary.json").write_text(json.dumps(summary, indent=2), encoding="utf-8")
-
-    # Clean stale output files before writing
-    for subdir in ("daily", "tracks", "baselines"):
-        d = output_root / subdir
-        if d.exists():
-            for old_file in d.glob("*.json"):
-                old_file.unlink()
+    out.write(output_root / "summary.json", summary, ignore_keys=("generatedAt",))
 
     # Daily files
     daily_dir = output_root / "daily"
     daily_dir.mkdir(parents=True, exist_ok=True)
+    scope_dates = {date_str for _, date_str in scope.days} if scope is not None else None
     for date_str, day in daily_data.items():
+        if scope_dates is not None and date_str not in scope_dates:
+            continue
         day_out = dict(day)
         day_out["durationHours"] = round(day_out.pop("durationSeconds") / 3600, 2)
         for tn, te in day_out["tracks"].items():
             te["durationHours"] = round(te.pop("durationSeconds") / 3600, 2)
-        (daily_dir / f"{date_str}.json").write_text(json.dumps(day_out, indent=2), encoding="utf-8")
+        out.write(daily_dir / f"{date_str}.json", day_out)
 
     # Track files + all new exports
-    tracks_dir = output_root / "tracks"
     tracks_dir.mkdir(parents=True, exist_ok=True)
     for track_name, te in track_data.items():
+        if scope is not None and track_name not in scope.tracks:
+            continue
         te["durationHours"] = round(te.pop("durationSeconds") / 3600, 2)
         safe_name = track_name.replace(" ", "-")
 
-        (tracks_dir / f"{safe_name}.json").write_text(json.dumps(te, indent=2), encoding="utf-8")
-
-        series = track_timeseries.get(track_name)
-        if series:
-            (tracks_dir / f"{safe_name}-timeseries.json").write_text(
-                json.dumps(series, indent=2), encoding="utf-8"
-            )
-        weekly = track_weekly.get(track_name)
-        if weekly:
-            (tracks_dir / f"{safe_name}-weekly.json").write_text(
-                json.dumps(weekly, indent=2), encoding="utf-8"
-            )
-        monthly = track_monthly.get(track_name)
-        if monthly:
-            (tracks_dir / f"{safe_name}-monthly.json").write_text(
-                json.dumps(monthly, indent=2), encoding="utf-8"
-            )
-        incidents = track_incidents.get(track_name)
-        if incidents:
-            (tracks_dir / f"{safe_name}-incidents.json").write_text(
-                json.dumps(incidents, indent=2), encoding="utf-8"
-            )
-        stypes = track_session_types.get(track_name)
-        if stypes:
-            (tracks_dir / f"{safe_name}-session-types.json").write_text(
-                json.dumps(stypes, indent=2), encoding="utf-8"
-            )
-        sectors = track_sectors.get(track_name)
-        if sectors:
-            (tracks_dir / f"{safe_name}-sectors.json").write_text(
-                json.dumps(sectors, indent=2), encoding="utf-8"
-            )
-        gap = track_gap.get(track_name)
-        if gap:
-            (tracks_dir / f"{safe_name}-gap.json").write_text(
-                json.dumps(gap, indent=2), encoding="utf-8"
-            )
-        zones = track_zones.get(safe_name)
-        if zones:
-            (tracks_dir / f"{safe_name}-zones.json").write_text(
-                json.dumps(zones, indent=2), encoding="utf-8"
-            )
+        out.write(tracks_dir / f"{safe_name}.json", te)
+        out.write_or_remove(tracks_dir / f"{safe_name}-timeseries.json", track_timeseries.get(track_name))
+        out.write_or_remove(tracks_dir / f"{safe_name}-weekly.json", track_weekly.get(track_name))
+        out.write_or_remove(tracks_dir / f"{safe_name}-monthly.json", track_monthly.get(track_name))
+        out.write_or_remove(tracks_dir / f"{safe_name}-incidents.json", track_incidents.get(track_name))
+        out.write_or_remove(tracks_dir / f"{safe_name}-session-types.json", track_session_types.get(track_name))
+        out.write_or_remove(tracks_dir / f"{safe_name}-sectors.json", track_sectors.get(track_name))
+        out.write_or_remove(tracks_dir / f"{safe_name}-gap.json", track_gap.get(track_name))
+        out.write_or_remove(tracks_dir / f"{safe_name}-zones.json", track_zones.get(safe_name))
+        # Monthly shards of the daily series: tracks/<track>/<series>/<YYYY-MM>.json
+        for series_by_track, suffix in (
+            (track_timeseries, "timeseries"),
+            (track_incidents, "incidents"),
+            (track_sectors, "sectors"),
+            (track_gap, "gap"),
+        ):
+            out.write_shards(tracks_dir / safe_name / suffix, series_by_track.get(track_name))
 
     # Baselines
     baselines_dir = output_root / "baselines"
     baselines_dir.mkdir(parents=True, exist_ok=True)
-    for track_name, entries in baselines_by_track.items():
+    baseline_tracks = set(baselines_by_track) | (scope.tracks if scope is not None else set())
+    for track_name in baseline_tracks:
         safe_name = track_name.replace(" ", "-")
-        (baselines_dir / f"{safe_name}.json").write_text(
-            json.dumps(entries, indent=2), encoding="utf-8"
-        )
+        out.write_or_remove(baselines_dir / f"{safe_name}.json", baselines_by_track.get(track_name))
+
+    # Traces come from the lap_traces cache, or the .ibt for laps not seen
+    # before; end the read snapshot first since new ones are cached back
+    conn.commit()
+    if has_clean:
+        store_session_sketches(conn, stale_sketch_ids)
+        store_track_day_sketches(conn, fresh_day_sketches, replace_all=scope is None)
+        conn.commit()
+    traces, traces_skipped = get_lap_traces(conn, trace_laps, args.trace_points) if trace_laps else ({}, 0)
+    traces_dir = output_root / "traces"
+    trace_tracks = set(trace_entries) | (scope.tracks if scope is not None else set())
+    for track_name in trace_tracks:
+        safe_name = track_name.replace(" ", "-")
+        index = []
+        for entry in trace_entries.get(track_name, []):
+            trace = traces.get(entry["lapId"])
+            if trace is None:
+                continue
+            rel_path = f"traces/{safe_name}/{entry['lapId']}.json"
+            out.write(output_root / rel_path, {**entry, "points": args.trace_points, **trace})
+            index.append({**entry, "file": rel_path})
+        out.remove_stale(traces_dir / safe_name)
+        out.write_or_remove(tracks_dir / f"{safe_name}-traces.json", index)
+    if traces_skipped:
+        print(f"  {traces_skipped} lap traces skipped (telemetry file missing or unreadable)")
+
+    if scope is None:
+        out.prune(("daily", "tracks", "baselines", "traces"))
+    out.write(output_root / MANIFEST_FILE, _build_manifest(output_root))
+    if watermarks is not None:
+        (output_root / STATE_FILE).write_text(json.dumps(watermarks, indent=2), encoding="utf-8")
+
+    mode = f"incremental, {len(changed_ids)} changed sessions" if changed_ids is not None else "full"
+    print(f"Site data ({mode}): {out.written} files written, {out.unchanged} unchanged, {out.removed} removed")
 
     conn.close()
 
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""Build track outlines ahead of time.
+
+Maps are otherwise reconstructed the first time a track's map is asked
+for; this builds the missing ones (or, with --rebuild, all of them from
+each track's latest sessions).
+"""
+from __future__ import annotations
+
+import argparse
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from telemetry_parser.db import init_db
+from telemetry_parser.track_map import MAP_SESSIONS, build_track_map
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build cached track outlines")
+    parser.add_argument("--db", default="data/telemetry.db", help="SQLite database path")
+    parser.add_argument("--track", action="append", help="Only this track ID (repeatable)")
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild maps that already exist")
+    parser.add_argument("--sessions", type=int, default=MAP_SESSIONS, help="Latest sessions fused per track")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    init_db(conn)
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT DISTINCT track_id FROM sessions
+        WHERE track_id IS NOT NULL AND (? OR track_id NOT IN (SELECT track_id FROM track_maps))
+        ORDER BY track_id
+        """,
+        (1 if args.rebuild else 0,),
+    )
+    tracks = [row[0] for row in cur.fetchall() if not args.track or row[0] in args.track]
+
+    built = 0
+    for track_id in tracks:
+        started = time.perf_counter()
+        track_map = build_track_map(conn, track_id, max_sessions=args.sessions)
+        elapsed = time.perf_counter() - started
+        if track_map is None:
+            print(f"  {track_id}: no session with position channels on disk")
+        else:
+            built += 1
+            print(f"  {track_id}: {track_map.source}, {track_map.laps} laps ({elapsed:.1f}s)")
+    print(f"Built {built} of {len(tracks)} track map(s).")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
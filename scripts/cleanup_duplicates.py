@@ -4,6 +4,15 @@ from __future__ import annotations
 
 import argparse
 import sqlite3
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from telemetry_parser.db import delete_session_rows
+from telemetry_parser.event_index import init_event_index, unindex_session_events
+from telemetry_parser.heatmap import init_heatmap_tables, remove_session_from_heatmap
+from telemetry_parser.personal_bests import init_personal_best_tables, rebuild_personal_bests, tracks_referencing
 
 
 def main() -> None:
@@ -32,6 +41,11 @@ def main() -> None:
         print(f"Found {len(duplicates)} file paths with duplicates.")
 
     total_removed = 0
+    stale_tracks = set()
+    if not args.dry_run:
+        init_personal_best_tables(conn)
+        init_heatmap_tables(conn)
+        init_event_index(conn)
     for file_path, count, ids_str in duplicates:
         ids = sorted(int(x) for x in ids_str.split(","))
         keep_id = ids[0]
@@ -40,18 +54,15 @@ def main() -> None:
 
         if not args.dry_run:
             for remove_id in remove_ids:
-                cur.execute("DELETE FROM laps WHERE session_id = ?", (remove_id,))
-                cur.execute("DELETE FROM events WHERE session_id = ?", (remove_id,))
-                cur.execute("DELETE FROM reset_events WHERE session_id = ?", (remove_id,))
-                # Clean sector_times if table exists
-                try:
-                    cur.execute("DELETE FROM sector_times WHERE session_id = ?", (remove_id,))
-                except sqlite3.OperationalError:
-                    pass
+                stale_tracks.update(tracks_referencing(conn, remove_id))
+                remove_session_from_heatmap(conn, remove_id)
+                unindex_session_events(conn, remove_id)
+                delete_session_rows(conn, remove_id)
                 cur.execute("DELETE FROM sessions WHERE id = ?", (remove_id,))
                 total_removed += 1
 
     if not args.dry_run and total_removed > 0:
+        rebuild_personal_bests(conn, stale_tracks)
         conn.commit()
         print(f"Removed {total_removed} duplicate sessions.")
 
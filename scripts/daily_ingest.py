@@ -2,8 +2,10 @@
 from __future__ import annotations
 
 import argparse
+import os
 import re
 import sqlite3
+import subprocess
 import sys
 from collections import defaultdict
 from dataclasses import dataclass
@@ -13,6 +15,7 @@ from typing import Dict, Iterable, List, Optional, Tuple
 
 sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
 
+from telemetry_parser.db import init_db, touch_sessions
 from telemetry_parser.ingest import ingest_file
 
 
@@ -157,6 +160,126 @@ def write_daily_report(
     output_path.write_text("\n".join(lines))
 
 
+def _is_baseline_path(file_path: str) -> bool:
+    lower = file_path.lower()
+    return "/baselines/" in lower or "\\baselines\\" in lower
+
+
+def _accept_file(parsed: Optional[ParsedFile], start_dt: datetime, end_dt: Optional[datetime]) -> bool:
+    if not parsed:
+        return False
+    if "/2025/" in parsed.path:
+        return False
+    if parsed.dt < start_dt:
+        return False
+    if end_dt and parsed.dt >= end_dt:
+        return False
+    return True
+
+
+def ingest_parsed(
+    conn: sqlite3.Connection,
+    parsed: ParsedFile,
+    existing: Dict[str, int],
+    db_path: Path,
+    report_dir: Path,
+    summary_dir: Path,
+    replace: bool = False,
+) -> Tuple[str, int, str, str]:
+    file_path = parsed.path
+    timestamp = parsed.dt.strftime("%Y-%m-%d %H:%M:%S")
+
+    session_id = existing.get(file_path)
+    if session_id is None or replace:
+        session_id = ingest_file(file_path, str(db_path), str(report_dir), str(summary_dir), replace=replace)
+        existing[file_path] = session_id
+
+    # Auto-flag sessions from baselines/ subfolder
+    if _is_baseline_path(file_path):
+        cur = conn.execute("UPDATE sessions SET is_baseline = 1 WHERE id = ? AND is_baseline = 0", (session_id,))
+        if cur.rowcount:
+            touch_sessions(conn, [session_id])
+        conn.commit()
+
+    return file_path, session_id, parsed.track, timestamp
+
+
+def write_day(
+    conn: sqlite3.Connection,
+    day: date,
+    rows: List[Tuple[str, int, str, str]],
+    daily_report_dir: Path,
+) -> None:
+    totals = summarize_sessions(conn, [r[0] for r in rows])
+    daily_report_path = daily_report_dir / f"{day.isoformat()}.md"
+    write_daily_report(daily_report_path, day, rows, totals)
+
+
+def rebuild_site(db_path: Path, site_output: str) -> None:
+    script = Path(__file__).resolve().parent / "build_site_data.py"
+    subprocess.run(
+        [sys.executable, str(script), "--db", str(db_path), "--output", site_output],
+        check=True,
+    )
+
+
+def run_watch(args, start_dt: datetime, end_dt: Optional[datetime]) -> None:
+    from telemetry_parser.watch import FolderPoller, watch_folder
+
+    if args.nice:
+        try:
+            os.nice(args.nice)
+        except (AttributeError, OSError):
+            pass
+
+    db_path = Path(args.db)
+    report_dir = Path(args.reports)
+    summary_dir = Path(args.summaries)
+    daily_report_dir = Path(args.daily_reports)
+
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    init_db(conn)
+    existing = load_existing_sessions(conn)
+    rows_by_day: Dict[date, Dict[str, Tuple[str, int, str, str]]] = defaultdict(dict)
+
+    def accept(path: Path) -> bool:
+        return _accept_file(parse_filename(path), start_dt, end_dt)
+
+    def handle(file_path: str) -> None:
+        parsed = parse_filename(Path(file_path))
+        if not parsed:
+            return
+        row = ingest_parsed(conn, parsed, existing, db_path, report_dir, summary_dir, replace=args.replace)
+        day = parsed.dt.date()
+        rows_by_day[day][file_path] = row
+        day_rows = sorted(rows_by_day[day].values(), key=lambda r: r[3])
+        write_day(conn, day, day_rows, daily_report_dir)
+        print(f"Ingested session {row[1]}: {file_path}")
+
+    on_idle = None
+    if args.site_output:
+        def on_idle() -> None:
+            rebuild_site(db_path, args.site_output)
+            print(f"Rebuilt site data in {args.site_output}")
+
+    poller = FolderPoller(str(args.source), settle_seconds=args.settle, accept=accept)
+    print(f"Watching {args.source} (poll every {args.poll_interval:g}s, settle {args.settle:g}s)")
+    try:
+        watch_folder(
+            poller,
+            handle,
+            poll_interval=args.poll_interval,
+            queue_size=args.queue_size,
+            on_idle=on_idle,
+            idle_delay=args.rebuild_delay,
+        )
+    except KeyboardInterrupt:
+        pass
+    finally:
+        conn.close()
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(description="Daily ingest for Porsche 911 GT3 Cup .ibt files")
     parser.add_argument("--source", default="/media/sf_iracing", help="Root folder to scan for .ibt files")
@@ -166,11 +289,24 @@ def main() -> None:
     parser.add_argument("--reports", default="reports", help="Reports output directory")
     parser.add_argument("--summaries", default="summaries", help="Publishable summaries output directory")
     parser.add_argument("--daily-reports", default="reports/daily", help="Daily report output directory")
+    parser.add_argument("--replace", action="store_true",
+                        help="Re-ingest files that are already in the DB, keeping their session IDs")
+    parser.add_argument("--watch", action="store_true", help="Keep running and ingest files as soon as they are finalized")
+    parser.add_argument("--poll-interval", type=float, default=5.0, help="Watch mode: seconds between folder scans")
+    parser.add_argument("--settle", type=float, default=10.0, help="Watch mode: seconds a file must stop growing before ingest")
+    parser.add_argument("--queue-size", type=int, default=4, help="Watch mode: max files waiting to be ingested")
+    parser.add_argument("--site-output", help="Watch mode: rebuild site data into this folder after ingesting")
+    parser.add_argument("--rebuild-delay", type=float, default=30.0, help="Watch mode: idle seconds before a site rebuild")
+    parser.add_argument("--nice", type=int, default=10, help="Watch mode: niceness increment for the daemon (0 to disable)")
     args = parser.parse_args()
 
     start_dt = datetime.strptime(args.start_date, "%Y-%m-%d")
     end_dt = datetime.strptime(args.end_date, "%Y-%m-%d") if args.end_date else None
 
+    if args.watch:
+        run_watch(args, start_dt, end_dt)
+        return
+
     source = Path(args.source)
     db_path = Path(args.db)
     report_dir = Path(args.reports)
@@ -182,14 +318,8 @@ def main() -> None:
 
     parsed_files: List[ParsedFile] = []
     for path in source.rglob("*.ibt"):
-        if "/2025/" in str(path):
-            continue
         parsed = parse_filename(path)
-        if not parsed:
-            continue
-        if parsed.dt < start_dt:
-            continue
-        if end_dt and parsed.dt >= end_dt:
+        if not _accept_file(parsed, start_dt, end_dt):
             continue
         parsed_files.append(parsed)
 
@@ -202,25 +332,8 @@ def main() -> None:
     for day in sorted(by_day.keys()):
         rows: List[Tuple[str, int, str, str]] = []
         for parsed in by_day[day]:
-            file_path = parsed.path
-            track = parsed.track
-            timestamp = parsed.dt.strftime("%Y-%m-%d %H:%M:%S")
-
-            session_id = existing.get(file_path)
-            if session_id is None:
-                session_id = ingest_file(file_path, str(db_path), str(report_dir), str(summary_dir))
-                existing[file_path] = session_id
-
-            # Auto-flag sessions from baselines/ subfolder
-            if "/baselines/" in file_path.lower() or "\\baselines\\" in file_path.lower():
-                conn.execute("UPDATE sessions SET is_baseline = 1 WHERE id = ? AND is_baseline = 0", (session_id,))
-                conn.commit()
-
-            rows.append((file_path, session_id, track, timestamp))
-
-        totals = summarize_sessions(conn, [r[0] for r in rows])
-        daily_report_path = daily_report_dir / f"{day.isoformat()}.md"
-        write_daily_report(daily_report_path, day, rows, totals)
+            rows.append(ingest_parsed(conn, parsed, existing, db_path, report_dir, summary_dir, replace=args.replace))
+        write_day(conn, day, rows, daily_report_dir)
 
     conn.close()
 
@@ -9,6 +9,8 @@ from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
 
+from telemetry_parser.db import touch_sessions
+
 
 def _ensure_column(conn: sqlite3.Connection) -> None:
     cur = conn.cursor()
@@ -26,6 +28,7 @@ def flag_by_id(conn: sqlite3.Connection, session_id: int, value: int = 1) -> boo
         print(f"No session with id {session_id}")
         return False
     cur.execute("UPDATE sessions SET is_baseline = ? WHERE id = ?", (value, session_id))
+    touch_sessions(conn, [session_id])
     conn.commit()
     action = "Flagged" if value else "Unflagged"
     print(f"{action} session {session_id}: {row[1]}")
@@ -46,6 +49,7 @@ def flag_by_date_track(conn: sqlite3.Connection, date: str, track: str, value: i
     for sid, fpath in rows:
         cur.execute("UPDATE sessions SET is_baseline = ? WHERE id = ?", (value, sid))
         print(f"{action} session {sid}: {fpath}")
+    touch_sessions(conn, [sid for sid, _ in rows])
     conn.commit()
     return True
 
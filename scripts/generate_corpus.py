@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""Generate a synthetic `.ibt` corpus for scale testing.
+
+Sessions are spread over --days starting at --start-date, cycle through
+the synthetic tracks and are sized by --sessions or by --hours of driving.
+Files are named like iRacing's, so the usual ingest picks up track and
+date; ingest the output folder to load a test database of any size.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from telemetry_parser.synthetic import (
+    TRACK_PROFILES,
+    SessionSpec,
+    SessionSummary,
+    generate_session,
+    session_file_name,
+)
+
+
+def _generate(job: Tuple[str, SessionSpec]) -> SessionSummary:
+    path, spec = job
+    return generate_session(path, spec)
+
+
+def plan_sessions(args: argparse.Namespace) -> List[Tuple[str, SessionSpec]]:
+    rnd = random.Random(args.seed)
+    start = datetime.strptime(args.start_date, "%Y-%m-%d")
+    jobs: List[Tuple[str, SessionSpec]] = []
+    names = set()
+    hours = 0.0
+    while True:
+        if args.sessions is not None and len(jobs) >= args.sessions:
+            break
+        if args.hours is not None and hours >= args.hours:
+            break
+        track_id = args.tracks[len(jobs) % len(args.tracks)]
+        when = start + timedelta(days=rnd.randrange(args.days), hours=rnd.randint(8, 22), minutes=rnd.randrange(60))
+        name = session_file_name(track_id, when)
+        if name in names:
+            continue
+        names.add(name)
+        spec = SessionSpec(
+            track_id=track_id,
+            laps=rnd.randint(args.min_laps, args.max_laps),
+            start_time=int(when.timestamp()),
+            tick_rate=args.tick_rate,
+            seed=rnd.getrandbits(32),
+            reset_rate=args.reset_rate,
+            spin_rate=args.spin_rate,
+            off_track_rate=args.off_track_rate,
+            big_save_rate=args.big_save_rate,
+        )
+        jobs.append((str(Path(args.out) / name), spec))
+        hours += (spec.laps + 1) * TRACK_PROFILES[track_id].lap_time / 3600
+    return jobs
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generate synthetic .ibt sessions")
+    parser.add_argument("--out", required=True, help="Output folder")
+    size = parser.add_mutually_exclusive_group()
+    size.add_argument("--sessions", type=int, help="Number of sessions (default 20)")
+    size.add_argument("--hours", type=float, help="Approximate hours of driving instead of a session count")
+    parser.add_argument("--tracks", nargs="+", default=sorted(TRACK_PROFILES), choices=sorted(TRACK_PROFILES),
+                        help="Tracks to cycle through")
+    parser.add_argument("--start-date", default=datetime.now().strftime("%Y-%m-%d"), help="First day (YYYY-MM-DD)")
+    parser.add_argument("--days", type=int, default=30, help="Days the sessions are spread over")
+    parser.add_argument("--min-laps", type=int, default=8, help="Fewest timed laps per session")
+    parser.add_argument("--max-laps", type=int, default=25, help="Most timed laps per session")
+    parser.add_argument("--tick-rate", type=int, default=60, help="Samples per second")
+    parser.add_argument("--reset-rate", type=float, default=SessionSpec.reset_rate, help="Resets per lap")
+    parser.add_argument("--spin-rate", type=float, default=SessionSpec.spin_rate, help="Spins per lap")
+    parser.add_argument("--off-track-rate", type=float, default=SessionSpec.off_track_rate, help="Off-tracks per lap")
+    parser.add_argument("--big-save-rate", type=float, default=SessionSpec.big_save_rate, help="Big saves per lap")
+    parser.add_argument("--seed", type=int, default=0, help="Corpus seed (same seed, same files)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes (0 = inline)")
+    args = parser.parse_args()
+    if args.sessions is None and args.hours is None:
+        args.sessions = 20
+    if args.min_laps > args.max_laps:
+        parser.error("--min-laps is above --max-laps")
+
+    Path(args.out).mkdir(parents=True, exist_ok=True)
+    jobs = plan_sessions(args)
+    started = time.perf_counter()
+    if args.workers > 0:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            summaries = list(pool.map(_generate, jobs, chunksize=1))
+    else:
+        summaries = [_generate(job) for job in jobs]
+    elapsed = time.perf_counter() - started
+
+    records = sum(s.records for s in summaries)
+    size = sum(os.path.getsize(s.path) for s in summaries)
+    print(f"Generated {len(summaries)} session(s) in {args.out} ({elapsed:.1f}s)")
+    print(f"  {sum(s.duration for s in summaries) / 3600:.1f} h driving, {records} records, {size / 1e6:.1f} MB")
+    print(
+        f"  {sum(s.laps for s in summaries)} timed laps, {sum(s.resets for s in summaries)} resets, "
+        f"{sum(s.spins for s in summaries)} spins, {sum(s.off_tracks for s in summaries)} off-tracks, "
+        f"{sum(s.big_saves for s in summaries)} big saves, {sum(s.incidents for s in summaries)} incident points"
+    )
+
+
+if __name__ == "__main__":
+    main()
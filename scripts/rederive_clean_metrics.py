@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""Re-derive is_clean, clean session metrics and session classification after
+lap-time bound changes in track_config, using SQL over stored lap rows only.
+
+By default only tracks whose sessions were stored with bounds that differ from
+the current DEFAULT_MIN_TIMES / DEFAULT_MAX_TIMES are touched.
+"""
+from __future__ import annotations
+
+import argparse
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from telemetry_parser.db import init_db
+from telemetry_parser.rederive import (
+    backfill_track_ids,
+    changed_tracks,
+    current_bounds,
+    describe_changes,
+    rederive_clean_metrics,
+)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Re-derive clean flags and metrics from stored laps")
+    parser.add_argument("--db", default="data/telemetry.db", help="SQLite database path")
+    parser.add_argument("--track", action="append", help="Force a track ID (repeatable); default: tracks whose bounds changed")
+    parser.add_argument("--dry-run", action="store_true", help="List the tracks that would be re-derived")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    init_db(conn)
+    filled = backfill_track_ids(conn)
+    if filled:
+        print(f"Filled track_id on {filled} older sessions.")
+
+    if args.track:
+        bounds = {track: current_bounds(track) for track in args.track}
+    else:
+        bounds = changed_tracks(conn)
+
+    if not bounds:
+        print("Lap-time bounds unchanged for every track; nothing to do.")
+        conn.close()
+        return
+
+    for line in describe_changes(bounds):
+        print(f"  {line}")
+    if args.dry_run:
+        conn.close()
+        return
+
+    started = time.perf_counter()
+    updated = rederive_clean_metrics(conn, list(bounds))
+    elapsed = time.perf_counter() - started
+    print(f"Re-derived {updated} sessions in {elapsed:.2f}s.")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""Repack `.ibt` files into compressed columnar `.ibtz` archives.
+
+Archives are written next to each file (or into --out) and skipped if they
+already exist. With --replace, which needs --db, each archive (new or left
+by an earlier run) is verified against its original, sessions pointing at
+the original under any spelling of its path are repointed at the archive,
+and only then is the original deleted; an original no session references
+is deleted too, while one that could not be repointed is kept. Ingest,
+backfills, track maps, pyramids and traces read archives transparently.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from telemetry_parser.archive import CHUNK_RECORDS, CODECS, ArchiveReader, RepackStats, archive_path, repack, verify_archive
+
+
+def _repack_one(
+    source: str,
+    out_dir: Optional[str],
+    codec: str,
+    level: Optional[int],
+    chunk_records: int,
+    verify: bool,
+) -> Tuple[Optional[RepackStats], Optional[str]]:
+    """(stats, None) on success, (None, error) otherwise.
+
+    An archive left by an earlier run whose original was kept is reused
+    (and verified) rather than written again.
+    """
+    destination = archive_path(source, out_dir)
+    try:
+        if Path(destination).exists():
+            packed = ArchiveReader(destination).read()
+            stats = RepackStats(
+                source, destination, packed.record_count, Path(source).stat().st_size, Path(destination).stat().st_size
+            )
+        else:
+            stats = repack(source, destination, codec=codec, level=level, chunk_records=chunk_records)
+        if verify and not verify_archive(source, destination):
+            os.remove(destination)
+            return None, "archive does not match the original"
+        return stats, None
+    except (OSError, ValueError) as exc:
+        return None, str(exc)
+
+
+def sessions_by_path(conn: sqlite3.Connection) -> Dict[Path, List[int]]:
+    """Session IDs by resolved file path, so relative and absolute spellings match."""
+    by_path: Dict[Path, List[int]] = {}
+    for session_id, file_path in conn.execute("SELECT id, file_path FROM sessions"):
+        by_path.setdefault(Path(file_path).resolve(), []).append(session_id)
+    return by_path
+
+
+def repoint_sessions(conn: sqlite3.Connection, session_ids: List[int], archive: str) -> int:
+    updated = 0
+    for session_id in session_ids:
+        cur = conn.execute("UPDATE sessions SET file_path = ? WHERE id = ?", (archive, session_id))
+        updated += cur.rowcount
+    conn.commit()
+    return updated
+
+
+def find_sources(paths: List[str]) -> List[str]:
+    sources = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            sources.extend(str(p) for p in sorted(path.rglob("*.ibt")))
+        elif path.suffix.lower() == ".ibt":
+            sources.append(str(path))
+    return sources
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Repack .ibt files into .ibtz archives")
+    parser.add_argument("paths", nargs="+", help=".ibt files or folders to scan")
+    parser.add_argument("--out", help="Write archives here instead of next to each file")
+    parser.add_argument("--codec", choices=CODECS, default="zlib", help="Stream compression")
+    parser.add_argument("--level", type=int, help="Compression level / lzma preset (default 6)")
+    parser.add_argument("--chunk-records", type=int, default=CHUNK_RECORDS, help="Records per chunk")
+    parser.add_argument("--verify", action="store_true", help="Check every archive reads back identical values")
+    parser.add_argument("--replace", action="store_true",
+                        help="Verify, repoint the original's sessions in --db, then delete the original")
+    parser.add_argument("--db", help="SQLite database whose sessions to repoint (required with --replace)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes (0 = inline)")
+    args = parser.parse_args()
+    if args.db and not args.replace:
+        parser.error("--db only applies with --replace")
+    if args.replace and not args.db:
+        parser.error("--replace needs --db so sessions can be repointed before originals are deleted")
+
+    # With --replace an existing archive may belong to an original kept by an earlier run
+    sources = [
+        path for path in find_sources(args.paths)
+        if args.replace or not Path(archive_path(path, args.out)).exists()
+    ]
+    if args.out:
+        Path(args.out).mkdir(parents=True, exist_ok=True)
+    work = partial(
+        _repack_one,
+        out_dir=args.out,
+        codec=args.codec,
+        level=args.level,
+        chunk_records=args.chunk_records,
+        verify=args.verify or args.replace,
+    )
+    started = time.perf_counter()
+    if args.workers > 0 and len(sources) > 1:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            outcomes = list(pool.map(work, sources, chunksize=1))
+    else:
+        outcomes = [work(source) for source in sources]
+
+    conn = sqlite3.connect(args.db) if args.db else None
+    referenced = sessions_by_path(conn) if conn is not None else {}
+    # Relative paths resolve against this run's working directory, which may not be ingest's
+    referenced_names = {path.name for path in referenced}
+    repacked: List[RepackStats] = []
+    kept = 0
+    for source, (stats, error) in zip(sources, outcomes):
+        if stats is None:
+            print(f"  FAILED {source}: {error}")
+            continue
+        repacked.append(stats)
+        if args.replace:
+            session_ids = referenced.get(Path(source).resolve(), [])
+            if session_ids:
+                if repoint_sessions(conn, session_ids, stats.archive) == 0:
+                    print(f"  KEPT {source}: referenced by session(s) {session_ids} but none were repointed")
+                    kept += 1
+                    continue
+            elif Path(source).name in referenced_names:
+                print(f"  KEPT {source}: a session references this file name under a path that does not resolve here")
+                kept += 1
+                continue
+            os.remove(source)
+    if conn is not None:
+        conn.close()
+
+    source_bytes = sum(s.source_bytes for s in repacked)
+    archive_bytes = sum(s.archive_bytes for s in repacked)
+    print(f"Repacked {len(repacked)} of {len(sources)} file(s) in {time.perf_counter() - started:.1f}s")
+    if kept:
+        print(f"  {kept} original(s) kept because their sessions could not be repointed; archives were still written")
+    if archive_bytes:
+        print(f"  {source_bytes / 1e6:.1f} MB -> {archive_bytes / 1e6:.1f} MB (x{source_bytes / archive_bytes:.1f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,408 @@
+"""Compressed columnar archive of `.ibt` files (`.ibtz`).
+
+An archive stores each channel separately, in chunks of `CHUNK_RECORDS`
+records, so reading a few channels or a stretch of a session touches only
+those bytes. Within a chunk every value slot of a channel is one stream:
+the values' bit patterns delta-encoded (XOR of consecutive values for
+floats and bools, difference modulo 2**32 for ints and bitfields; char
+channels are stored raw), byte-shuffled so the mostly-zero high bytes of
+the deltas sit together, then compressed with zlib or lzma. Decoding is
+exact: an archive reads back the same values as the `.ibt` it came from.
+
+Layout: `MAGIC`, then the offset and length of the index (two
+little-endian uint64), then the compressed chunk streams, then the index
+itself, zlib-compressed JSON holding the telemetry, disk and variable
+headers, the session info, each chunk's record range and SessionTime span
+and every stream's offset and length.
+
+`ArchiveReader` offers `IBTReader`'s interface (`read`, `var_by_name`,
+`read_columns`, `read_channel`, `iter_records`, ...) and `read_columns`
+also takes a SessionTime range. `open_telemetry` picks the right reader
+by file suffix; `scripts/repack_archive.py` converts files.
+"""
+from __future__ import annotations
+
+import json
+import lzma
+import operator
+import struct
+import sys
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right
+from dataclasses import asdict, dataclass
+from itertools import accumulate, repeat
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+from .ibt import (
+    VAR_TYPE_ARRAYS,
+    VAR_TYPE_BITFIELD,
+    VAR_TYPE_BOOL,
+    VAR_TYPE_CHAR,
+    VAR_TYPE_DOUBLE,
+    VAR_TYPE_FORMATS,
+    VAR_TYPE_INT,
+    DiskHeader,
+    IBTReader,
+    TelemetryHeader,
+    VarBuf,
+    VarHeader,
+)
+
+ARCHIVE_SUFFIX = ".ibtz"
+MAGIC = b"IBTZ\x00\x00\x00\x01"
+PREAMBLE = struct.Struct("<8sQQ")
+CHUNK_RECORDS = 16384  # About 4.5 minutes at 60 Hz
+CODECS = ("zlib", "lzma")
+TIME_CHANNEL = "SessionTime"
+
+_UNSIGNED = {1: "B", 4: "I", 8: "Q"}
+_MASKS = {1: 0xFF, 4: 0xFFFFFFFF, 8: 0xFFFFFFFFFFFFFFFF}
+
+
+@dataclass(frozen=True)
+class RepackStats:
+    source: str
+    archive: str
+    records: int
+    source_bytes: int
+    archive_bytes: int
+
+    @property
+    def ratio(self) -> float:
+        return self.source_bytes / self.archive_bytes if self.archive_bytes else 0.0
+
+
+# ── Streams ─────────────────────────────────────────────────────────
+
+def _unsigned(data: bytes, size: int) -> array:
+    """Little-endian values of `size` bytes as unsigned ints."""
+    values = array(_UNSIGNED[size])
+    values.frombytes(data)
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values
+
+
+def _to_bytes(values: array) -> bytes:
+    if sys.byteorder != "little":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _shuffle(data: bytes, size: int) -> bytes:
+    """Group byte `k` of every value together, for each `k`."""
+    if size == 1:
+        return data
+    n = len(data) // size
+    out = bytearray(len(data))
+    for k in range(size):
+        out[k * n:(k + 1) * n] = data[k::size]
+    return bytes(out)
+
+
+def _unshuffle(data: bytes, size: int) -> bytes:
+    if size == 1:
+        return data
+    n = len(data) // size
+    out = bytearray(len(data))
+    for k in range(size):
+        out[k::size] = data[k * n:(k + 1) * n]
+    return bytes(out)
+
+
+def _uses_xor(var_type: int) -> bool:
+    return var_type not in (VAR_TYPE_INT, VAR_TYPE_BITFIELD)
+
+
+def encode_stream(data: bytes, size: int, var_type: int, codec: str = "zlib", level: Optional[int] = None) -> bytes:
+    """Delta-encode, shuffle and compress one stream of little-endian `size`-byte values."""
+    if var_type != VAR_TYPE_CHAR and data:
+        values = _unsigned(data, size)
+        if _uses_xor(var_type):
+            deltas = map(operator.xor, values[1:], values[:-1])
+        else:
+            deltas = map(operator.and_, map(operator.sub, values[1:], values[:-1]), repeat(_MASKS[size]))
+        encoded = values[:1]
+        encoded.extend(deltas)
+        data = _shuffle(_to_bytes(encoded), size)
+    if codec == "lzma":
+        return lzma.compress(data, preset=6 if level is None else level)
+    return zlib.compress(data, 6 if level is None else level)
+
+
+def decode_stream(blob: bytes, size: int, var_type: int, codec: str = "zlib") -> bytes:
+    """Inverse of `encode_stream`: the stream's little-endian values."""
+    data = lzma.decompress(blob) if codec == "lzma" else zlib.decompress(blob)
+    if var_type == VAR_TYPE_CHAR or not data:
+        return data
+    deltas = _unsigned(_unshuffle(data, size), size)
+    if _uses_xor(var_type):
+        values = array(deltas.typecode, accumulate(deltas, operator.xor))
+    else:
+        mask = _MASKS[size]
+        values = array(deltas.typecode, map(operator.and_, accumulate(deltas), repeat(mask)))
+    return _to_bytes(values)
+
+
+def _slots(vh: VarHeader) -> Tuple[int, int]:
+    """(streams, bytes per value) of a variable; a char variable is one stream of whole strings."""
+    size = VAR_TYPE_FORMATS[vh.var_type][1]
+    if vh.var_type == VAR_TYPE_CHAR:
+        return 1, vh.count * size
+    return vh.count, size
+
+
+def _gather(block: bytes, buf_len: int, offset: int, size: int) -> bytes:
+    """The `size`-byte value at `offset` of every record in `block`, contiguous."""
+    n = len(block) // buf_len
+    out = bytearray(n * size)
+    for k in range(size):
+        out[k::size] = block[offset + k::buf_len]
+    return bytes(out)
+
+
+# ── Writing ─────────────────────────────────────────────────────────
+
+def archive_path(ibt_path: str, out_dir: Optional[str] = None) -> str:
+    path = Path(ibt_path)
+    folder = Path(out_dir) if out_dir else path.parent
+    return str(folder / (path.stem + ARCHIVE_SUFFIX))
+
+
+def repack(
+    source: str,
+    destination: Optional[str] = None,
+    codec: str = "zlib",
+    level: Optional[int] = None,
+    chunk_records: int = CHUNK_RECORDS,
+) -> RepackStats:
+    """Write an archive of the `.ibt` at `source` (default: next to it, `.ibtz` suffix)."""
+    if codec not in CODECS:
+        raise ValueError(f"Unknown codec: {codec}")
+    reader = IBTReader(source).read()
+    destination = destination or archive_path(source)
+    header, disk_header = reader.header, reader.disk_header
+    buf_len = header.buf_len
+    time_var = reader.var_by_name.get(TIME_CHANNEL)
+
+    streams: Dict[str, List[List[int]]] = {vh.name: [] for vh in reader.var_headers}
+    chunks: List[Dict] = []
+    tmp = Path(destination).with_name(Path(destination).name + ".tmp")
+    with open(source, "rb") as src, open(tmp, "wb") as out:
+        out.write(PREAMBLE.pack(MAGIC, 0, 0))
+        src.seek(header.var_bufs[0].buf_offset)
+        start = 0
+        while start < disk_header.record_count:
+            wanted = min(chunk_records, disk_header.record_count - start)
+            block = src.read(buf_len * wanted)
+            records = len(block) // buf_len
+            if records == 0:
+                break
+            block = block[:records * buf_len]
+            span = None
+            if time_var is not None and time_var.var_type == VAR_TYPE_DOUBLE:
+                times = struct.unpack_from(f"<{records}d", _gather(block, buf_len, time_var.offset, 8))
+                span = [times[0], times[-1]]
+            chunks.append({"start": start, "records": records, "time": span})
+            for vh in reader.var_headers:
+                count, size = _slots(vh)
+                for slot in range(count):
+                    blob = encode_stream(_gather(block, buf_len, vh.offset + slot * size, size), size, vh.var_type, codec, level)
+                    streams[vh.name].append([out.tell(), len(blob)])
+                    out.write(blob)
+            start += records
+            if records < wanted:
+                break  # Truncated file
+
+        index = {
+            "codec": codec,
+            "record_count": start,
+            "header": asdict(header),
+            "disk_header": asdict(disk_header),
+            "session_info": reader.session_info,
+            "vars": [asdict(vh) for vh in reader.var_headers],
+            "chunks": chunks,
+            "streams": streams,
+        }
+        index_blob = zlib.compress(json.dumps(index, separators=(",", ":")).encode("utf-8"), 9)
+        index_offset = out.tell()
+        out.write(index_blob)
+        out.seek(0)
+        out.write(PREAMBLE.pack(MAGIC, index_offset, len(index_blob)))
+    tmp.replace(destination)
+    return RepackStats(source, destination, start, Path(source).stat().st_size, Path(destination).stat().st_size)
+
+
+def verify_archive(source: str, archive: str, group: int = 32) -> bool:
+    """True if the archive holds the same headers, session info and values as the `.ibt`.
+
+    Channels are compared `group` at a time to bound memory.
+    """
+    original, packed = IBTReader(source).read(), ArchiveReader(archive).read()
+    if (
+        original.header != packed.header
+        or original.disk_header != packed.disk_header
+        or original.var_headers != packed.var_headers
+        or original.session_info != packed.session_info
+    ):
+        return False
+    for i in range(0, len(original.var_headers), group):
+        channel_vars = original.var_headers[i:i + group]
+        names = [vh.name for vh in channel_vars]
+        expected, actual = original.read_columns(names), packed.read_columns(names)
+        if any(_comparable(vh, expected[vh.name]) != _comparable(vh, actual[vh.name]) for vh in channel_vars):
+            return False
+    return True
+
+
+def _comparable(vh: VarHeader, values: Sequence):
+    """Numeric values as bytes, so NaNs compare equal to themselves."""
+    if vh.var_type not in VAR_TYPE_ARRAYS:
+        return list(values)
+    if vh.count > 1:
+        values = [value for row in values for value in row]
+    return array(VAR_TYPE_ARRAYS[vh.var_type], values).tobytes()
+
+
+# ── Reading ─────────────────────────────────────────────────────────
+
+class ArchiveReader:
+    """Reads an `.ibtz` archive through the same interface as `IBTReader`."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.header: Optional[TelemetryHeader] = None
+        self.disk_header: Optional[DiskHeader] = None
+        self.var_headers: List[VarHeader] = []
+        self.var_by_name: Dict[str, VarHeader] = {}
+        self.session_info: Optional[str] = None
+        self.bytes_read = 0
+        self.codec = "zlib"
+        self.record_count = 0
+        self._chunks: List[Dict] = []
+        self._streams: Dict[str, List[List[int]]] = {}
+
+    def read(self) -> "ArchiveReader":
+        with open(self.path, "rb") as f:
+            raw = f.read(PREAMBLE.size)
+            if len(raw) != PREAMBLE.size:
+                raise ValueError("File too small to be an archive")
+            magic, index_offset, index_length = PREAMBLE.unpack(raw)
+            if magic != MAGIC:
+                raise ValueError(f"Not an .ibtz archive: {self.path}")
+            f.seek(index_offset)
+            index = json.loads(zlib.decompress(f.read(index_length)).decode("utf-8"))
+            self.bytes_read += PREAMBLE.size + index_length
+        header = dict(index["header"])
+        header["var_bufs"] = tuple(VarBuf(**buf) for buf in header["var_bufs"])
+        self.header = TelemetryHeader(**header)
+        self.disk_header = DiskHeader(**index["disk_header"])
+        self.var_headers = [VarHeader(**vh) for vh in index["vars"]]
+        self.var_by_name = {vh.name: vh for vh in self.var_headers}
+        self.session_info = index["session_info"]
+        self.codec = index["codec"]
+        self.record_count = index["record_count"]
+        self._chunks = index["chunks"]
+        self._streams = index["streams"]
+        return self
+
+    def get_var(self, name: str) -> VarHeader:
+        if not self.var_by_name:
+            raise ValueError("ArchiveReader.read() must be called before accessing variables")
+        try:
+            return self.var_by_name[name]
+        except KeyError as exc:
+            raise KeyError(f"Unknown variable: {name}") from exc
+
+    def _chunk_range(self, start_time: Optional[float], end_time: Optional[float]) -> Tuple[int, int]:
+        lo, hi = 0, len(self._chunks)
+        if start_time is not None:
+            while lo < hi and self._chunks[lo]["time"] and self._chunks[lo]["time"][1] < start_time:
+                lo += 1
+        if end_time is not None:
+            while hi > lo and self._chunks[hi - 1]["time"] and self._chunks[hi - 1]["time"][0] > end_time:
+                hi -= 1
+        return lo, hi
+
+    def _decode(self, f, vh: VarHeader, lo: int, hi: int) -> Sequence:
+        count, size = _slots(vh)
+        slots = []
+        for slot in range(count):
+            data = bytearray()
+            for chunk in range(lo, hi):
+                offset, length = self._streams[vh.name][chunk * count + slot]
+                f.seek(offset)
+                blob = f.read(length)
+                self.bytes_read += length
+                data += decode_stream(blob, size, vh.var_type, self.codec)
+            slots.append(bytes(data))
+
+        if vh.var_type == VAR_TYPE_CHAR:
+            return [slots[0][i:i + size].split(b"\x00", 1)[0].decode("ascii", "ignore") for i in range(0, len(slots[0]), size)]
+        if vh.var_type == VAR_TYPE_BOOL:
+            columns = [[value != 0 for value in slot] for slot in slots]
+        else:
+            columns = []
+            for slot in slots:
+                column = array(VAR_TYPE_ARRAYS[vh.var_type])
+                column.frombytes(slot)
+                if sys.byteorder != "little":
+                    column.byteswap()
+                columns.append(column)
+        if count == 1:
+            return columns[0]
+        return [list(values) for values in zip(*columns)]
+
+    def read_columns(
+        self,
+        channels: Optional[Sequence[str]] = None,
+        start_time: Optional[float] = None,
+        end_time: Optional[float] = None,
+    ) -> Dict[str, Sequence]:
+        """Like `IBTReader.read_columns`, optionally only the records with SessionTime in `start_time..end_time`.
+
+        Only the chunks overlapping the range are decompressed.
+        """
+        if not self.var_by_name:
+            raise ValueError("ArchiveReader.read() must be called before reading columns")
+        channel_vars = self.var_headers if channels is None else [self.get_var(name) for name in dict.fromkeys(channels)]
+        ranged = (start_time is not None or end_time is not None) and TIME_CHANNEL in self.var_by_name
+        lo, hi = self._chunk_range(start_time, end_time) if ranged else (0, len(self._chunks))
+        with open(self.path, "rb") as f:
+            columns = {vh.name: self._decode(f, vh, lo, hi) for vh in channel_vars}
+            if not ranged:
+                return columns
+            times = columns[TIME_CHANNEL] if TIME_CHANNEL in columns else self._decode(f, self.var_by_name[TIME_CHANNEL], lo, hi)
+        first = bisect_left(times, start_time) if start_time is not None else 0
+        last = bisect_right(times, end_time) if end_time is not None else len(times)
+        return {name: values[first:last] for name, values in columns.items()}
+
+    def read_channel(self, name: str) -> Sequence:
+        return self.read_columns([name])[name]
+
+    def iter_records(self, channels: Optional[Sequence[str]] = None) -> Iterator[Dict[str, object]]:
+        """Records one at a time, decoded a chunk at a time."""
+        names = [vh.name for vh in self.var_headers] if channels is None else [self.get_var(name).name for name in channels]
+        channel_vars = [self.var_by_name[name] for name in dict.fromkeys(names)]
+        with open(self.path, "rb") as f:
+            for chunk in range(len(self._chunks)):
+                columns = [(vh.name, self._decode(f, vh, chunk, chunk + 1)) for vh in channel_vars]
+                for i in range(self._chunks[chunk]["records"]):
+                    yield {name: values[i] for name, values in columns}
+
+
+def is_archive(path: str) -> bool:
+    return Path(path).suffix.lower() == ARCHIVE_SUFFIX
+
+
+TelemetryReader = Union[IBTReader, ArchiveReader]
+
+
+def open_telemetry(path: str) -> TelemetryReader:
+    """A read reader for an `.ibt` file or an `.ibtz` archive."""
+    if is_archive(path):
+        return ArchiveReader(path).read()
+    return IBTReader(path).read()
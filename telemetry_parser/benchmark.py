@@ -0,0 +1,282 @@
+"""Benchmarks for the ingest pipeline and the site build.
+
+Each benchmark file, either a synthetic session of a given number of laps
+(`telemetry_parser.synthetic`) or an existing `.ibt` fixture, goes through
+the stages ingest runs: `IBTReader` decode, `segment_laps`,
+`detect_reset_events`, `detect_events`, `incident_counts`,
+`compute_sector_times`, then the whole of `ingest.analyze_session` (the
+same code ingest runs, so what gets inserted matches ingest) and
+`insert_session` into a scratch database, then `build_site_data` runs over
+everything inserted so far. Wall and CPU time
+are the best of `repeat` untraced runs; peak memory comes from one extra
+run under tracemalloc, so tracing does not skew the timings.
+
+Results serialise to JSON so a run can be saved as a baseline and later
+runs compared against it; `scripts/benchmark.py` is the CLI.
+"""
+from __future__ import annotations
+
+import contextlib
+import io
+import json
+import platform
+import runpy
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List, Sequence, Tuple
+
+from .db import init_db, insert_session
+from .ibt import IBTReader
+from .incident_detection import EVENT_STAGE, detect_events
+from .ingest import _extract_track_id, analyze_session, ingest_plan
+from .metrics import incident_counts
+from .sectors import SECTOR_STAGE, compute_sector_times
+from .segments import detect_reset_events, segment_laps
+from .synthetic import SessionSpec, generate_session, session_file_name
+from .track_config import load_track_config
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+SITE_BUILD_SCRIPT = REPO_ROOT / "scripts" / "build_site_data.py"
+
+BENCHMARK_STAGES = [
+    "decode",
+    "segment_laps",
+    "detect_reset_events",
+    "detect_events",
+    "incident_counts",
+    "compute_sector_times",
+    "analyze_session",
+    "insert_session",
+    "build_site_data",
+]
+DEFAULT_SIZES = (5, 30, 120)  # Synthetic session sizes, in timed laps
+DEFAULT_TRACK = "spa 2024 up"
+REGRESSION_THRESHOLD = 0.10  # Slower than baseline by more than this is a regression
+
+
+@dataclass
+class BenchmarkResult:
+    size: str  # e.g. "30 laps" or a fixture's file name
+    stage: str
+    records: int
+    unit: str  # what `records` counts: samples, laps or sessions
+    wall_time: float
+    cpu_time: float
+    peak_memory: int
+    bytes_read: int = 0
+
+    @property
+    def records_per_sec(self) -> float:
+        return self.records / self.wall_time if self.wall_time > 0 else 0.0
+
+    @property
+    def key(self) -> Tuple[str, str]:
+        return self.size, self.stage
+
+
+@dataclass
+class BenchmarkRun:
+    results: List[BenchmarkResult] = field(default_factory=list)
+    python: str = platform.python_version()
+    machine: str = f"{platform.system()} {platform.machine()}"
+    created_at: str = field(default_factory=lambda: datetime.now().isoformat(timespec="seconds"))
+
+    def save(self, path: str) -> None:
+        output = Path(path)
+        output.parent.mkdir(parents=True, exist_ok=True)
+        data = asdict(self)
+        output.write_text(json.dumps(data, indent=2) + "\n", encoding="utf-8")
+
+    @classmethod
+    def load(cls, path: str) -> "BenchmarkRun":
+        data = json.loads(Path(path).read_text(encoding="utf-8"))
+        results = [BenchmarkResult(**result) for result in data.pop("results")]
+        return cls(results=results, **data)
+
+
+@dataclass(frozen=True)
+class Comparison:
+    size: str
+    stage: str
+    baseline: float  # wall time, s
+    current: float
+
+    @property
+    def ratio(self) -> float:
+        return self.current / self.baseline if self.baseline > 0 else 0.0
+
+    def is_regression(self, threshold: float = REGRESSION_THRESHOLD) -> bool:
+        return self.ratio > 1.0 + threshold
+
+
+def _measure(fn: Callable[[], object], repeat: int) -> Tuple[float, float, int]:
+    """(best wall time, its CPU time, peak traced bytes) of `fn`."""
+    best_wall, best_cpu = float("inf"), 0.0
+    for _ in range(max(1, repeat)):
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        fn()
+        wall = time.perf_counter() - wall_start
+        if wall < best_wall:
+            best_wall, best_cpu = wall, time.process_time() - cpu_start
+
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    fn()
+    peak = max(0, tracemalloc.get_traced_memory()[1] - base)
+    if started_tracing:
+        tracemalloc.stop()
+    return best_wall, best_cpu, peak
+
+
+def synthetic_files(out_dir: str, sizes: Sequence[int] = DEFAULT_SIZES, track_id: str = DEFAULT_TRACK) -> List[Tuple[str, str]]:
+    """`[(size label, path)]` of one synthetic session per size, reused if already generated.
+
+    Generation is deterministic, so a file on disk is the same session a
+    fresh run would write.
+    """
+    files = []
+    for n, laps in enumerate(sizes):
+        when = datetime(2026, 1, 5, 10) + timedelta(hours=n)
+        path = Path(out_dir) / f"{track_id} {laps} laps" / session_file_name(track_id, when)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            generate_session(str(path), SessionSpec(track_id, laps=laps, start_time=int(when.timestamp()), seed=laps))
+        files.append((f"{laps} laps", str(path)))
+    return files
+
+
+def benchmark_file(
+    conn: sqlite3.Connection,
+    size: str,
+    file_path: str,
+    repeat: int = 3,
+) -> List[BenchmarkResult]:
+    """Time every pipeline stage on one file and insert it into `conn` (the site build is separate)."""
+    results: List[BenchmarkResult] = []
+
+    def record(stage: str, records: int, unit: str, measured: Tuple[float, float, int], bytes_read: int = 0) -> None:
+        wall, cpu, peak = measured
+        results.append(BenchmarkResult(size, stage, records, unit, wall, cpu, peak, bytes_read))
+
+    def decode():
+        reader = IBTReader(file_path).read()
+        plan = ingest_plan(reader.var_by_name)
+        return reader, plan, plan.read(reader)
+
+    measured = _measure(decode, repeat)
+    reader, plan, channels = decode()
+    samples = len(channels["SessionTime"])
+    record("decode", samples, "samples", measured, reader.bytes_read)
+
+    def segment():
+        return segment_laps(
+            session_time=channels["SessionTime"],
+            lap=channels["Lap"],
+            lap_dist_pct=channels["LapDistPct"],
+            lap_last_lap_time=channels["LapLastLapTime"],
+            lap_completed=channels["LapCompleted"],
+        )
+
+    record("segment_laps", samples, "samples", _measure(segment, repeat))
+    segments = segment()
+
+    def resets():
+        return detect_reset_events(channels["Lap"], channels["LapDistPct"], channels["SessionTime"])
+
+    record("detect_reset_events", samples, "samples", _measure(resets, repeat))
+
+    if plan.runs(EVENT_STAGE):
+        def incidents():
+            return detect_events(
+                session_time=channels["SessionTime"],
+                lap=channels["Lap"],
+                speed=channels["Speed"],
+                yaw_rate=channels["YawRate"],
+                steering_angle=channels["SteeringWheelAngle"],
+                is_on_track=channels["IsOnTrack"],
+            )
+
+        record("detect_events", samples, "samples", _measure(incidents, repeat))
+
+    record(
+        "incident_counts", samples, "samples",
+        _measure(lambda: incident_counts(channels["PlayerIncidents"], segments), repeat),
+    )
+
+    track_id = _extract_track_id(file_path, reader.session_info)
+    track_config = load_track_config(track_id, str(REPO_ROOT / "tracks"))
+    if plan.runs(SECTOR_STAGE) and track_config and track_config.zones:
+        def sectors():
+            return compute_sector_times(channels["SessionTime"], channels["LapDistPct"], segments, track_config.zones)
+
+        record("compute_sector_times", samples, "samples", _measure(sectors, repeat))
+
+    # The whole analysis exactly as ingest runs it, which also supplies what insert_session stores
+    def analyze():
+        return analyze_session(file_path, reader, plan, channels, conn, tracks_dir=str(REPO_ROOT / "tracks"))
+
+    record("analyze_session", samples, "samples", _measure(analyze, repeat))
+    insert_kwargs = dict(
+        file_path=file_path,
+        disk_header=reader.disk_header,
+        replace=True,
+        **analyze().insert_kwargs(),
+    )
+    # The first insert is a plain insert; repeats replace the same session
+    record(
+        "insert_session", len(segments), "laps",
+        _measure(lambda: insert_session(conn, **insert_kwargs), repeat),
+    )
+    return results
+
+
+def benchmark_site_build(db_path: str, size: str, repeat: int = 1) -> BenchmarkResult:
+    """Full `build_site_data` run over the database, into a scratch output folder."""
+    conn = sqlite3.connect(db_path)
+    sessions = conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+    conn.close()
+
+    def build():
+        with tempfile.TemporaryDirectory() as output, contextlib.redirect_stdout(io.StringIO()):
+            argv = sys.argv
+            sys.argv = [str(SITE_BUILD_SCRIPT), "--db", db_path, "--output", output, "--full"]
+            try:
+                runpy.run_path(str(SITE_BUILD_SCRIPT), run_name="__main__")
+            finally:
+                sys.argv = argv
+
+    wall, cpu, peak = _measure(build, repeat)
+    return BenchmarkResult(size, "build_site_data", sessions, "sessions", wall, cpu, peak)
+
+
+def run_benchmarks(files: Sequence[Tuple[str, str]], repeat: int = 3, site_repeat: int = 1) -> BenchmarkRun:
+    """Benchmark each `(size label, path)` in turn; the site build runs after each insert, over all sessions so far."""
+    run = BenchmarkRun()
+    with tempfile.TemporaryDirectory() as scratch:
+        db_path = str(Path(scratch) / "benchmark.db")
+        conn = sqlite3.connect(db_path)
+        init_db(conn)
+        for size, file_path in files:
+            run.results.extend(benchmark_file(conn, size, file_path, repeat))
+            run.results.append(benchmark_site_build(db_path, size, site_repeat))
+        conn.close()
+    return run
+
+
+def compare_runs(baseline: BenchmarkRun, current: BenchmarkRun) -> List[Comparison]:
+    """Wall-time comparison of every (size, stage) present in both runs, in the current run's order."""
+    previous: Dict[Tuple[str, str], BenchmarkResult] = {result.key: result for result in baseline.results}
+    return [
+        Comparison(result.size, result.stage, previous[result.key].wall_time, result.wall_time)
+        for result in current.results
+        if result.key in previous
+    ]
@@ -0,0 +1,78 @@
+"""Channel requirements of the analysis stages, decoded once per file.
+
+Each analysis module declares the channels its stage reads as a `Stage`:
+`required` channels it cannot run without and `optional` ones it uses when
+the file has them. `plan_channels` takes the stages a caller runs and the
+channels a file offers, and returns the stages that can run with the union
+of their channels; `ChannelPlan.read` decodes that union in a single
+`read_columns` pass, and `ChannelColumns.view(stage)` hands a stage just
+its own columns (the same arrays, not copies). Leaving a stage out of the
+plan drops its channels from the decode; adding one never adds a read.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Container, Dict, Iterable, List, Sequence, Tuple
+
+
+@dataclass(frozen=True)
+class Stage:
+    name: str
+    required: Tuple[str, ...]
+    optional: Tuple[str, ...] = ()
+
+    @property
+    def channels(self) -> Tuple[str, ...]:
+        return tuple(dict.fromkeys(self.required + self.optional))
+
+    def missing(self, available: Container[str]) -> List[str]:
+        return [name for name in self.required if name not in available]
+
+
+class ChannelColumns(Dict[str, Sequence]):
+    """Decoded columns by channel name."""
+
+    def view(self, stage: Stage) -> Dict[str, Sequence]:
+        """The columns `stage` declared that were decoded."""
+        return {name: self[name] for name in stage.channels if name in self}
+
+
+@dataclass(frozen=True)
+class ChannelPlan:
+    stages: Tuple[Stage, ...]  # Stages that run, in the order given
+    skipped: Tuple[Stage, ...]  # Optional stages the file lacks required channels for
+    channels: Tuple[str, ...]  # Union of the running stages' available channels
+
+    def runs(self, stage: Stage) -> bool:
+        return stage in self.stages
+
+    def read(self, reader) -> ChannelColumns:
+        """Decode every planned channel from a `TelemetryReader` in one pass."""
+        return ChannelColumns(reader.read_columns(list(self.channels)))
+
+
+def required_channels(stages: Iterable[Stage]) -> List[str]:
+    return list(dict.fromkeys(name for stage in stages for name in stage.required))
+
+
+def plan_channels(
+    available: Container[str],
+    stages: Sequence[Stage],
+    optional: Sequence[Stage] = (),
+) -> ChannelPlan:
+    """Plan `stages`, which must all run, plus whichever `optional` stages
+    `available` has the required channels for.
+
+    Raises ValueError naming the channels a mandatory stage is missing.
+    """
+    missing = [name for name in required_channels(stages) if name not in available]
+    if missing:
+        raise ValueError(f"Missing required channels: {', '.join(missing)}")
+    running = list(stages)
+    skipped = []
+    for stage in optional:
+        (skipped if stage.missing(available) else running).append(stage)
+    channels = dict.fromkeys(
+        name for stage in running for name in stage.channels if name in available
+    )
+    return ChannelPlan(tuple(running), tuple(skipped), tuple(channels))
@@ -0,0 +1,571 @@
+"""Corner detection and per-corner lap metrics.
+
+Each track's corners are derived from the mean speed profile of many laps
+rather than entered by hand: every session stores the mean Speed of its
+valid laps on the `LapDistPct` grid (`corner_profiles`), and once a track
+has `MIN_PROFILE_LAPS` of them the pooled profile is smoothed and its
+speed troughs become corners. A corner spans from the speed peak before
+its apex (where braking starts) to the peak after it. The index is cached
+in `track_corners` so every lap of the track is measured against the same
+corner numbers. Once the track's pooled laps reach `INDEX_REFRESH_GROWTH`
+times the laps the index was derived from, the next insert re-derives it,
+clears the track's other `lap_corners` in the same transaction and ingest
+measures those sessions again from their files (as it does for sessions
+ingested before the track's first index); refreshing on doubling
+keeps the index close to the aggregate of all laps while re-reading each
+session only a bounded number of times overall.
+`scripts/backfill_corners.py --rebuild-index` re-derives it from every
+stored profile on demand.
+
+For every complete lap, one pass over each corner's samples records the
+braking point and release, entry speed, apex position and minimum speed,
+throttle pickup, exit speed and the time spent in the corner
+(`lap_corners`). A corner whose samples are missing from a lap (an
+outlap starting past it, a reset inside it) is left out for that lap.
+
+Corners are not carried across the start/finish line: a trough that
+straddles it is split into the lap's first and last corner.
+"""
+from __future__ import annotations
+
+import sqlite3
+import sys
+import time
+import zlib
+from array import array
+from dataclasses import astuple, dataclass, fields
+from pathlib import Path
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+from .archive import open_telemetry
+from .channel_plan import Stage, plan_channels
+from .distance import DEFAULT_GRID_SIZE, monotonic_indices, pct_grid, resample_lap
+from .features import PEDAL_ON
+from .metrics import is_valid_lap
+from .segments import SEGMENT_STAGE, LapSegment, segment_laps
+
+CORNER_CHANNELS = ("Speed", "Brake", "Throttle")
+CORNER_PROFILE_STAGE = Stage("corner_profile", ("SessionTime", "LapDistPct", "Speed"))
+CORNER_METRICS_STAGE = Stage("corner_metrics", ("SessionTime", "LapDistPct"), CORNER_CHANNELS)
+
+MIN_PROFILE_LAPS = 5  # Laps pooled before a track's corner index is derived
+INDEX_REFRESH_GROWTH = 2.0  # Re-derive once pooled laps reach this multiple of the index's laps
+MIN_SPEED_DROP = 4.0  # m/s a trough must sit below the peaks around it to count as a corner
+SMOOTHING_POINTS = 5  # Moving-average half-width on the profile grid
+THROTTLE_PICKUP = 0.2  # Throttle fraction counted as back on the power after the apex
+
+
+@dataclass(frozen=True)
+class Corner:
+    number: int
+    entry_pct: float  # speed peak before the corner
+    apex_pct: float  # slowest point of the pooled profile
+    exit_pct: float  # speed peak after the corner
+    apex_speed: float  # m/s, pooled profile
+
+
+@dataclass(frozen=True)
+class CornerMetrics:
+    corner: int
+    brake_pct: Optional[float]  # LapDistPct where the brake goes on; None for a lift or flat corner
+    brake_release_pct: Optional[float]
+    entry_speed: float  # m/s at the braking point (or the fastest sample before the apex)
+    apex_pct: float
+    min_speed: float  # m/s
+    throttle_pct: Optional[float]  # LapDistPct of throttle pickup after the apex
+    exit_speed: float  # m/s at the corner's exit
+    corner_time: float  # seconds from entry to exit
+
+
+METRIC_COLUMNS = tuple(f.name for f in fields(CornerMetrics))[1:]
+
+
+@dataclass
+class SessionCorners:
+    """What `insert_session` stores for one session's corners."""
+
+    laps: int  # valid laps averaged into `profile`
+    profile: Optional[array]  # mean Speed on the corner grid
+    corners: Optional[List[Corner]]  # index the metrics were measured against
+    metrics: Dict[int, List[CornerMetrics]]  # by lap number
+
+
+def init_corner_tables(conn: sqlite3.Connection) -> None:
+    cur = conn.cursor()
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS corner_profiles (
+            session_id INTEGER PRIMARY KEY,
+            laps INTEGER NOT NULL,
+            data BLOB NOT NULL,
+            FOREIGN KEY(session_id) REFERENCES sessions(id)
+        );
+        """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS corner_indexes (
+            track_id TEXT PRIMARY KEY,
+            profile_laps INTEGER NOT NULL,
+            created_at REAL NOT NULL
+        );
+        """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS track_corners (
+            track_id TEXT NOT NULL,
+            corner INTEGER NOT NULL,
+            entry_pct REAL NOT NULL,
+            apex_pct REAL NOT NULL,
+            exit_pct REAL NOT NULL,
+            apex_speed REAL NOT NULL,
+            PRIMARY KEY (track_id, corner)
+        );
+        """
+    )
+    columns = ",\n            ".join(f"{name} REAL" for name in METRIC_COLUMNS)
+    cur.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS lap_corners (
+            lap_id INTEGER NOT NULL,
+            session_id INTEGER NOT NULL,
+            corner INTEGER NOT NULL,
+            {columns},
+            PRIMARY KEY (lap_id, corner),
+            FOREIGN KEY(session_id) REFERENCES sessions(id),
+            FOREIGN KEY(lap_id) REFERENCES laps(id)
+        );
+        """
+    )
+
+
+# ── Speed profiles ──────────────────────────────────────────────────
+
+def session_speed_profile(
+    session_time: Sequence[float],
+    lap_dist_pct: Sequence[float],
+    speed: Sequence[float],
+    segments: Sequence[LapSegment],
+    min_valid_lap_time: float = 0.0,
+    max_valid_lap_time: float = 0.0,
+    grid_size: int = DEFAULT_GRID_SIZE,
+) -> Tuple[int, Optional[array]]:
+    """`(laps, mean Speed on the grid)` over the session's valid laps; `(0, None)` without any."""
+    grid = pct_grid(grid_size)
+    total = array("d", bytes(8 * grid_size))
+    laps = 0
+    for seg in segments:
+        if seg.end_idx <= seg.start_idx or not is_valid_lap(seg, min_valid_lap_time, max_valid_lap_time):
+            continue
+        lo, hi = seg.start_idx, seg.end_idx + 1
+        resampled = resample_lap(session_time[lo:hi], lap_dist_pct[lo:hi], {"Speed": speed[lo:hi]}, grid)
+        if "Speed" not in resampled.channels:
+            continue
+        for i, value in enumerate(resampled.channels["Speed"]):
+            total[i] += value
+        laps += 1
+    if not laps:
+        return 0, None
+    return laps, array("d", (value / laps for value in total))
+
+
+def _encode(values: Sequence[float]) -> bytes:
+    data = array("f", values)
+    if sys.byteorder != "little":
+        data.byteswap()
+    return zlib.compress(data.tobytes(), 6)
+
+
+def _decode(blob: bytes) -> array:
+    data = array("f")
+    data.frombytes(zlib.decompress(blob))
+    if sys.byteorder != "little":
+        data.byteswap()
+    return array("d", data)
+
+
+def store_corner_profile(conn: sqlite3.Connection, session_id: int, laps: int, profile: Optional[Sequence[float]]) -> None:
+    """Replace a session's speed profile. Does not commit."""
+    conn.execute("DELETE FROM corner_profiles WHERE session_id = ?", (session_id,))
+    if laps and profile is not None:
+        conn.execute(
+            "INSERT INTO corner_profiles (session_id, laps, data) VALUES (?, ?, ?)",
+            (session_id, laps, _encode(profile)),
+        )
+
+
+def track_speed_profile(
+    conn: sqlite3.Connection,
+    track_id: str,
+    extra: Sequence[Tuple[int, Sequence[float]]] = (),
+) -> Tuple[int, Optional[array]]:
+    """Lap-weighted mean of the track's stored session profiles, plus `extra` `(laps, profile)` pairs."""
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT p.laps, p.data FROM corner_profiles p JOIN sessions s ON s.id = p.session_id
+        WHERE s.track_id = ?
+        """,
+        (track_id,),
+    )
+    parts = [(int(laps), _decode(blob)) for laps, blob in cur.fetchall()]
+    parts.extend((laps, profile) for laps, profile in extra if laps and profile is not None)
+    if not parts:
+        return 0, None
+    size = len(parts[0][1])
+    total = array("d", bytes(8 * size))
+    laps_total = 0
+    for laps, profile in parts:
+        if len(profile) != size:
+            continue
+        for i, value in enumerate(profile):
+            total[i] += value * laps
+        laps_total += laps
+    return laps_total, array("d", (value / laps_total for value in total))
+
+
+def track_profile_laps(conn: sqlite3.Connection, track_id: str) -> int:
+    """Laps pooled in the track's stored session profiles."""
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT COALESCE(SUM(p.laps), 0) FROM corner_profiles p JOIN sessions s ON s.id = p.session_id WHERE s.track_id = ?",
+        (track_id,),
+    )
+    return int(cur.fetchone()[0])
+
+
+# ── Corner index ────────────────────────────────────────────────────
+
+def _smooth(values: Sequence[float], half_width: int) -> array:
+    n = len(values)
+    width = 2 * half_width + 1
+    # Circular, so the start/finish line doesn't flatten the ends
+    window = sum(values[i % n] for i in range(-half_width, half_width + 1))
+    out = array("d")
+    for i in range(n):
+        out.append(window / width)
+        window += values[(i + half_width + 1) % n] - values[(i - half_width) % n]
+    return out
+
+
+def _turning_points(values: Sequence[float], threshold: float) -> List[Tuple[int, int]]:
+    """Alternating `(+1 peak / -1 trough, index)` pairs that swing by at least `threshold`."""
+    points: List[Tuple[int, int]] = []
+    direction = 0  # +1 while climbing towards a peak, -1 falling towards a trough
+    peak = trough = 0
+    for i, value in enumerate(values):
+        if value > values[peak]:
+            peak = i
+        if value < values[trough]:
+            trough = i
+        if direction >= 0 and values[peak] - value >= threshold:
+            points.append((1, peak))
+            direction, trough = -1, i
+        elif direction <= 0 and value - values[trough] >= threshold:
+            points.append((-1, trough))
+            direction, peak = 1, i
+    if direction > 0:
+        points.append((1, peak))
+    elif direction < 0:
+        points.append((-1, trough))
+    return points
+
+
+def derive_corners(profile: Sequence[float], min_drop: float = MIN_SPEED_DROP) -> List[Corner]:
+    """Corners of a mean speed profile sampled on `pct_grid(len(profile))`."""
+    if len(profile) < 2:
+        return []
+    grid = pct_grid(len(profile))
+    smoothed = _smooth(profile, SMOOTHING_POINTS)
+    points = _turning_points(smoothed, min_drop)
+    corners: List[Corner] = []
+    for k, (kind, apex) in enumerate(points):
+        if kind > 0:
+            continue
+        entry = points[k - 1][1] if k > 0 else 0
+        exit_ = points[k + 1][1] if k + 1 < len(points) else len(profile) - 1
+        corners.append(Corner(len(corners) + 1, grid[entry], grid[apex], grid[exit_], float(smoothed[apex])))
+    return corners
+
+
+def load_corner_index(conn: sqlite3.Connection, track_id: Optional[str]) -> Optional[List[Corner]]:
+    """A track's cached corners, or None if it has no index yet."""
+    if not track_id:
+        return None
+    cur = conn.cursor()
+    cur.execute("SELECT 1 FROM corner_indexes WHERE track_id = ?", (track_id,))
+    if cur.fetchone() is None:
+        return None
+    cur.execute(
+        """
+        SELECT corner, entry_pct, apex_pct, exit_pct, apex_speed FROM track_corners
+        WHERE track_id = ? ORDER BY corner
+        """,
+        (track_id,),
+    )
+    return [Corner(int(number), *values) for number, *values in cur.fetchall()]
+
+
+def index_due_for_refresh(conn: sqlite3.Connection, track_id: str, pooled_laps: int) -> bool:
+    """True if `pooled_laps` has grown to `INDEX_REFRESH_GROWTH` times the laps of the cached index."""
+    cur = conn.cursor()
+    cur.execute("SELECT profile_laps FROM corner_indexes WHERE track_id = ?", (track_id,))
+    row = cur.fetchone()
+    return row is not None and pooled_laps >= INDEX_REFRESH_GROWTH * max(int(row[0]), 1)
+
+
+def store_corner_index(conn: sqlite3.Connection, track_id: str, corners: Sequence[Corner], profile_laps: int) -> None:
+    """Replace a track's cached corners. Does not commit."""
+    conn.execute("DELETE FROM track_corners WHERE track_id = ?", (track_id,))
+    conn.execute(
+        "INSERT OR REPLACE INTO corner_indexes (track_id, profile_laps, created_at) VALUES (?, ?, ?)",
+        (track_id, profile_laps, time.time()),
+    )
+    conn.executemany(
+        "INSERT INTO track_corners VALUES (?, ?, ?, ?, ?, ?)",
+        [(track_id, *astuple(corner)) for corner in corners],
+    )
+
+
+def resolve_corner_index(
+    conn: sqlite3.Connection,
+    track_id: Optional[str],
+    laps: int = 0,
+    profile: Optional[Sequence[float]] = None,
+) -> Optional[List[Corner]]:
+    """The track's cached corners, or ones derived from its stored profiles plus this session's.
+
+    A cached index is re-derived once this session brings the pooled laps
+    to `INDEX_REFRESH_GROWTH` times its own. A derived index is not stored
+    here; `insert_session` caches it with the session. None while the track
+    has fewer than `MIN_PROFILE_LAPS` laps.
+    """
+    if not track_id:
+        return None
+    cached = load_corner_index(conn, track_id)
+    if cached is not None:
+        session_laps = laps if profile is not None else 0
+        if not index_due_for_refresh(conn, track_id, track_profile_laps(conn, track_id) + session_laps):
+            return cached
+    pooled_laps, pooled = track_speed_profile(conn, track_id, [(laps, profile)])
+    if pooled is None or pooled_laps < MIN_PROFILE_LAPS:
+        return None
+    return derive_corners(pooled)
+
+
+def rebuild_corner_index(conn: sqlite3.Connection, track_id: str) -> Optional[List[Corner]]:
+    """Re-derive a track's corners from its stored profiles and drop its lap metrics. Does not commit.
+
+    Corner numbers may change, so every lap of the track needs measuring
+    again (`scripts/backfill_corners.py` does both).
+    """
+    laps, profile = track_speed_profile(conn, track_id)
+    conn.execute(
+        "DELETE FROM lap_corners WHERE session_id IN (SELECT id FROM sessions WHERE track_id = ?)",
+        (track_id,),
+    )
+    if profile is None or laps < MIN_PROFILE_LAPS:
+        conn.execute("DELETE FROM track_corners WHERE track_id = ?", (track_id,))
+        conn.execute("DELETE FROM corner_indexes WHERE track_id = ?", (track_id,))
+        return None
+    corners = derive_corners(profile)
+    store_corner_index(conn, track_id, corners, laps)
+    return corners
+
+
+# ── Lap metrics ─────────────────────────────────────────────────────
+
+def _corner_metrics(
+    corner: Corner,
+    times: Sequence[float],
+    pcts: Sequence[float],
+    speed: Sequence[float],
+    brake: Optional[Sequence[float]],
+    throttle: Optional[Sequence[float]],
+) -> Optional[CornerMetrics]:
+    """Metrics over one lap's forward-moving samples (already in LapDistPct order)."""
+    lo = next((i for i, pct in enumerate(pcts) if pct >= corner.entry_pct), None)
+    if lo is None:
+        return None
+    hi = lo
+    while hi + 1 < len(pcts) and pcts[hi + 1] <= corner.exit_pct:
+        hi += 1
+    if hi - lo < 2:
+        return None
+
+    apex = min(range(lo, hi + 1), key=speed.__getitem__)
+    brake_on = brake_off = None
+    if brake is not None:
+        brake_on = next((i for i in range(lo, apex + 1) if brake[i] > PEDAL_ON), None)
+        if brake_on is not None:
+            brake_off = next((i for i in range(brake_on, hi + 1) if brake[i] <= PEDAL_ON), None)
+    pickup = None
+    if throttle is not None:
+        pickup = next((i for i in range(apex, hi + 1) if throttle[i] >= THROTTLE_PICKUP), None)
+
+    entry_speed = speed[brake_on] if brake_on is not None else max(speed[i] for i in range(lo, apex + 1))
+    return CornerMetrics(
+        corner=corner.number,
+        brake_pct=float(pcts[brake_on]) if brake_on is not None else None,
+        brake_release_pct=float(pcts[brake_off]) if brake_off is not None else None,
+        entry_speed=float(entry_speed),
+        apex_pct=float(pcts[apex]),
+        min_speed=float(speed[apex]),
+        throttle_pct=float(pcts[pickup]) if pickup is not None else None,
+        exit_speed=float(speed[hi]),
+        corner_time=float(times[hi] - times[lo]),
+    )
+
+
+def lap_corner_metrics(
+    session_time: Sequence[float],
+    lap_dist_pct: Sequence[float],
+    channels: Mapping[str, Sequence[float]],
+    start: int,
+    end: int,
+    corners: Sequence[Corner],
+) -> List[CornerMetrics]:
+    """Metrics of every corner the samples `start..end` (inclusive) cover."""
+    speed = channels.get("Speed")
+    if speed is None:
+        return []
+    kept = [start + i for i in monotonic_indices(lap_dist_pct[start:end + 1])]
+    if len(kept) < 3:
+        return []
+
+    def take(values: Optional[Sequence[float]]) -> Optional[List[float]]:
+        return [values[i] for i in kept] if values is not None else None
+
+    times, pcts = take(session_time), take(lap_dist_pct)
+    lap_speed, brake, throttle = take(speed), take(channels.get("Brake")), take(channels.get("Throttle"))
+    results = []
+    for corner in corners:
+        metrics = _corner_metrics(corner, times, pcts, lap_speed, brake, throttle)
+        if metrics is not None:
+            results.append(metrics)
+    return results
+
+
+def compute_corner_metrics(
+    session_time: Sequence[float],
+    lap_dist_pct: Sequence[float],
+    channels: Mapping[str, Sequence[float]],
+    segments: Sequence[LapSegment],
+    corners: Sequence[Corner],
+) -> Dict[int, List[CornerMetrics]]:
+    """Per-corner metrics of every complete lap, by lap number."""
+    results: Dict[int, List[CornerMetrics]] = {}
+    if not corners:
+        return results
+    for seg in segments:
+        if not seg.is_complete or seg.end_idx <= seg.start_idx:
+            continue
+        metrics = lap_corner_metrics(session_time, lap_dist_pct, channels, seg.start_idx, seg.end_idx, corners)
+        if metrics:
+            results[seg.lap_number] = metrics
+    return results
+
+
+def store_lap_corners(
+    conn: sqlite3.Connection,
+    session_id: int,
+    metrics_by_lap: Mapping[int, Sequence[CornerMetrics]],
+    lap_id_map: Mapping[int, int],
+) -> None:
+    """Replace a session's `lap_corners` rows. Does not commit."""
+    conn.execute("DELETE FROM lap_corners WHERE session_id = ?", (session_id,))
+    conn.executemany(
+        f"""
+        INSERT INTO lap_corners (lap_id, session_id, corner, {', '.join(METRIC_COLUMNS)})
+        VALUES (?, ?, ?, {', '.join('?' for _ in METRIC_COLUMNS)})
+        """,
+        [
+            (lap_id_map[lap_number], session_id, *astuple(metrics))
+            for lap_number, lap_metrics in metrics_by_lap.items()
+            if lap_number in lap_id_map
+            for metrics in lap_metrics
+        ],
+    )
+
+
+def store_session_corners(
+    conn: sqlite3.Connection,
+    session_id: int,
+    track_id: Optional[str],
+    data: SessionCorners,
+    lap_id_map: Mapping[int, int],
+) -> None:
+    """Store a session's profile and lap metrics, caching the track's index if it has none. Does not commit.
+
+    An index re-derived because the track's laps have grown enough
+    (`index_due_for_refresh`) replaces the cached one and clears the lap
+    metrics of the track's other sessions, which `remeasure_track_corners`
+    (or the backfill script) fills in again. Metrics measured against an
+    index that another writer has since replaced are dropped.
+    """
+    store_corner_profile(conn, session_id, data.laps, data.profile)
+    if not track_id or data.corners is None:
+        return
+    cached = load_corner_index(conn, track_id)
+    laps = track_profile_laps(conn, track_id)
+    if cached is None:
+        store_corner_index(conn, track_id, data.corners, laps)
+    elif cached != list(data.corners):
+        if not index_due_for_refresh(conn, track_id, laps):
+            return
+        store_corner_index(conn, track_id, data.corners, laps)
+        conn.execute(
+            "DELETE FROM lap_corners WHERE session_id IN (SELECT id FROM sessions WHERE track_id = ?) AND session_id != ?",
+            (track_id, session_id),
+        )
+    store_lap_corners(conn, session_id, data.metrics, lap_id_map)
+
+
+def read_corner_metrics(file_path: str, corners: Sequence[Corner]) -> Dict[int, List[CornerMetrics]]:
+    """Per-corner metrics of every complete lap of a telemetry file."""
+    reader = open_telemetry(file_path)
+    channels = plan_channels(reader.var_by_name, [SEGMENT_STAGE, CORNER_METRICS_STAGE]).read(reader)
+    segments = segment_laps(
+        session_time=channels["SessionTime"],
+        lap=channels["Lap"],
+        lap_dist_pct=channels["LapDistPct"],
+        lap_last_lap_time=channels["LapLastLapTime"],
+        lap_completed=channels["LapCompleted"],
+    )
+    return compute_corner_metrics(
+        session_time=channels["SessionTime"],
+        lap_dist_pct=channels["LapDistPct"],
+        channels=channels.view(CORNER_METRICS_STAGE),
+        segments=segments,
+        corners=corners,
+    )
+
+
+def remeasure_track_corners(conn: sqlite3.Connection, track_id: str) -> int:
+    """Measure the laps of a track's sessions that have no `lap_corners` against its current index.
+
+    Commits after each session; sessions whose file is gone are left for
+    the backfill script. Returns the number of sessions measured.
+    """
+    corners = load_corner_index(conn, track_id)
+    if not corners:
+        return 0
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT id, file_path FROM sessions
+        WHERE track_id = ? AND id NOT IN (SELECT DISTINCT session_id FROM lap_corners)
+        ORDER BY id
+        """,
+        (track_id,),
+    )
+    measured = 0
+    for session_id, file_path in cur.fetchall():
+        if not Path(file_path).exists():
+            continue
+        lap_ids = dict(conn.execute("SELECT lap_number, id FROM laps WHERE session_id = ?", (session_id,)))
+        store_lap_corners(conn, session_id, read_corner_metrics(file_path, corners), lap_ids)
+        conn.commit()
+        measured += 1
+    return measured
@@ -3,13 +3,35 @@ from __future__ import annotations
 import sqlite3
 from typing import Dict, Iterable, List, Optional, Sequence
 
-from .incident_detection import IncidentEvent, event_counts_by_lap, serious_event_counts_by_lap
+from .corners import SessionCorners, init_corner_tables, store_session_corners
+from .delta import init_reference_table
+from .envelopes import init_envelope_table
+from .event_index import index_session_events, init_event_index, unindex_session_events
+from .features import LapFeatures, init_lap_features_table, store_lap_features
+from .fingerprints import init_fingerprint_table, store_fingerprints
+from .heatmap import add_session_to_heatmap, init_heatmap_tables, remove_session_from_heatmap
+from .incident_detection import IncidentEvent, event_counts_by_lap, event_position, serious_event_counts_by_lap
 from .metrics import CleanMetrics, LapMetrics, is_clean_lap, is_valid_lap
+from .personal_bests import (
+    init_personal_best_tables,
+    pack_times,
+    rebuild_personal_bests,
+    tracks_referencing,
+    update_personal_bests,
+)
+from .pyramids import init_pyramid_table
 from .segments import LapSegment, ResetEvent
+from .sketches import init_sketch_tables, store_session_sketches
+from .track_map import init_track_map_table
+from .traces import init_lap_traces_table
 
 
 def connect(db_path: str) -> sqlite3.Connection:
-    return sqlite3.connect(db_path)
+    conn = sqlite3.connect(db_path)
+    # WAL lets readers (e.g. build_site_data) keep a consistent snapshot while
+    # an ingest transaction is writing
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
 
 
 def init_db(conn: sqlite3.Connection) -> None:
@@ -88,6 +110,38 @@ def init_db(conn: sqlite3.Connection) -> None:
         """
     )
 
+    init_lap_traces_table(conn)
+    init_reference_table(conn)
+    init_personal_best_tables(conn)
+    init_sketch_tables(conn)
+    init_heatmap_tables(conn)
+    init_event_index(conn)
+    init_lap_features_table(conn)
+    init_pyramid_table(conn)
+    init_corner_tables(conn)
+    init_track_map_table(conn)
+    init_fingerprint_table(conn)
+    init_envelope_table(conn)
+
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS ingest_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id INTEGER,
+            file_path TEXT NOT NULL,
+            run_started_at REAL,
+            stage TEXT NOT NULL,
+            wall_time REAL,
+            cpu_time REAL,
+            records INTEGER,
+            records_per_sec REAL,
+            bytes_read INTEGER,
+            peak_memory INTEGER,
+            FOREIGN KEY(session_id) REFERENCES sessions(id)
+        );
+        """
+    )
+
     # Migrations for new columns (idempotent)
     migrations = [
         "ALTER TABLE laps ADD COLUMN is_clean INTEGER DEFAULT 0",
@@ -101,6 +155,11 @@ def init_db(conn: sqlite3.Connection) -> None:
         "ALTER TABLE laps ADD COLUMN has_official_time INTEGER DEFAULT 1",
         "ALTER TABLE laps ADD COLUMN event_count INTEGER DEFAULT 0",
         "ALTER TABLE sessions ADD COLUMN is_baseline INTEGER DEFAULT 0",
+        "ALTER TABLE sessions ADD COLUMN track_id TEXT",
+        "ALTER TABLE sessions ADD COLUMN min_valid_lap_time REAL",
+        "ALTER TABLE sessions ADD COLUMN max_valid_lap_time REAL",
+        "ALTER TABLE sessions ADD COLUMN data_version INTEGER DEFAULT 0",
+        "ALTER TABLE events ADD COLUMN lap_dist_pct REAL",
     ]
     for sql in migrations:
         try:
@@ -108,6 +167,10 @@ def init_db(conn: sqlite3.Connection) -> None:
         except sqlite3.OperationalError:
             pass  # column already exists
 
+    # Per-session lookups (site build, replace and duplicate cleanup)
+    for table in SESSION_CHILD_TABLES:
+        cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_session ON {table}(session_id)")
+
     conn.commit()
 
 
@@ -126,41 +189,116 @@ def insert_session(
     classified_session_type: Optional[str] = None,
     min_valid_lap_time: float = 0.0,
     max_valid_lap_time: float = 0.0,
+    track_id: Optional[str] = None,
+    sector_data: Optional[Sequence[Dict]] = None,
+    replace: bool = False,
+    microsector_data: Optional[Dict[int, Sequence[float]]] = None,
+    event_lap_dist_pct: Optional[Sequence[float]] = None,
+    lap_features: Optional[Dict[int, LapFeatures]] = None,
+    corner_data: Optional[SessionCorners] = None,
+    lap_fingerprints: Optional[Dict[int, Sequence[float]]] = None,
 ) -> int:
+    """Insert a session with its laps, events, resets and sector times.
+
+    Everything is written in one transaction, together with the track's
+    personal-best index, heatmap and event R*Tree. `event_lap_dist_pct` is the session's
+    LapDistPct channel, used to place each event on the track. `corner_data`
+    also caches the track's corner index if it has none yet or refreshes it.
+    With `replace=True` an existing session for the
+    same `file_path` keeps its ID: its derived rows are deleted and
+    rewritten and the session row updated in place, so readers only ever
+    see the old or the new version.
+
+    The insert runs in its own `BEGIN IMMEDIATE` transaction, so `conn` must
+    not have one open; sqlite3.ProgrammingError is raised rather than
+    committing or rolling back the caller's pending writes.
+    """
+    values = {
+        "file_path": file_path,
+        "start_time": getattr(disk_header, "start_time", None),
+        "session_start_time": getattr(disk_header, "session_start_time", None),
+        "session_end_time": getattr(disk_header, "session_end_time", None),
+        "session_lap_count": getattr(disk_header, "session_lap_count", None),
+        "record_count": getattr(disk_header, "record_count", None),
+        "best_lap": metrics.best_lap,
+        "median_lap": metrics.median_lap,
+        "worst_lap": metrics.worst_lap,
+        "stddev_lap": metrics.stddev_lap,
+        "iqr_lap": metrics.iqr_lap,
+        "track_name": track_name,
+        "car_name": car_name,
+        "clean_best_lap": clean_metrics.clean_best_lap if clean_metrics else None,
+        "clean_median_lap": clean_metrics.clean_median_lap if clean_metrics else None,
+        "clean_stddev_lap": clean_metrics.clean_stddev_lap if clean_metrics else None,
+        "clean_lap_count": clean_metrics.clean_lap_count if clean_metrics else None,
+        "classified_session_type": classified_session_type,
+        "track_id": track_id,
+        "min_valid_lap_time": min_valid_lap_time,
+        "max_valid_lap_time": max_valid_lap_time,
+    }
+
+    if conn.in_transaction:
+        raise sqlite3.ProgrammingError("insert_session needs a connection without an open transaction")
+    cur = conn.cursor()
+    cur.execute("BEGIN IMMEDIATE")
+    try:
+        values["data_version"] = next_data_version(conn)
+        columns = list(values)
+        session_id = find_session_id(conn, file_path) if replace else None
+        stale_tracks: List[str] = []
+        if session_id is not None:
+            stale_tracks = tracks_referencing(conn, session_id)
+            remove_session_from_heatmap(conn, session_id)
+            unindex_session_events(conn, session_id)
+            delete_session_rows(conn, session_id)
+            cur.execute(
+                f"UPDATE sessions SET {', '.join(f'{col} = ?' for col in columns)} WHERE id = ?",
+                [values[col] for col in columns] + [session_id],
+            )
+        else:
+            cur.execute(
+                f"INSERT INTO sessions ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+                [values[col] for col in columns],
+            )
+            session_id = cur.lastrowid
+        _insert_session_rows(
+            conn, session_id, segments, incidents_by_lap, events, reset_events,
+            min_valid_lap_time, max_valid_lap_time, sector_data, microsector_data,
+            event_lap_dist_pct, lap_features, lap_fingerprints,
+        )
+        if corner_data is not None:
+            store_session_corners(conn, session_id, track_id, corner_data, get_lap_id_map(conn, session_id))
+        if stale_tracks:
+            # The replaced rows held PBs that may no longer stand
+            rebuild_personal_bests(conn, set(stale_tracks) | ({track_id} if track_id else set()))
+        else:
+            update_personal_bests(conn, session_id)
+        store_session_sketches(conn, [session_id])
+        add_session_to_heatmap(conn, session_id)
+        index_session_events(conn, session_id)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return session_id
+
+
+def _insert_session_rows(
+    conn: sqlite3.Connection,
+    session_id: int,
+    segments: Iterable[LapSegment],
+    incidents_by_lap,
+    events: Optional[Sequence[IncidentEvent]],
+    reset_events: Optional[Sequence[ResetEvent]],
+    min_valid_lap_time: float,
+    max_valid_lap_time: float,
+    sector_data: Optional[Sequence[Dict]],
+    microsector_data: Optional[Dict[int, Sequence[float]]] = None,
+    event_lap_dist_pct: Optional[Sequence[float]] = None,
+    lap_features: Optional[Dict[int, LapFeatures]] = None,
+    lap_fingerprints: Optional[Dict[int, Sequence[float]]] = None,
+) -> None:
     cur = conn.cursor()
-    cur.execute(
-        """
-        INSERT INTO sessions (
-            file_path, start_time, session_start_time, session_end_time,
-            session_lap_count, record_count, best_lap, median_lap,
-            worst_lap, stddev_lap, iqr_lap,
-            track_name, car_name,
-            clean_best_lap, clean_median_lap, clean_stddev_lap, clean_lap_count,
-            classified_session_type
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """,
-        (
-            file_path,
-            getattr(disk_header, "start_time", None),
-            getattr(disk_header, "session_start_time", None),
-            getattr(disk_header, "session_end_time", None),
-            getattr(disk_header, "session_lap_count", None),
-            getattr(disk_header, "record_count", None),
-            metrics.best_lap,
-            metrics.median_lap,
-            metrics.worst_lap,
-            metrics.stddev_lap,
-            metrics.iqr_lap,
-            track_name,
-            car_name,
-            clean_metrics.clean_best_lap if clean_metrics else None,
-            clean_metrics.clean_median_lap if clean_metrics else None,
-            clean_metrics.clean_stddev_lap if clean_metrics else None,
-            clean_metrics.clean_lap_count if clean_metrics else None,
-            classified_session_type,
-        ),
-    )
-    session_id = cur.lastrowid
 
     segments_list = list(segments)
     lap_id_map: Dict[int, int] = {}
@@ -204,8 +342,8 @@ def insert_session(
             cur.execute(
                 """
                 INSERT INTO events (
-                    session_id, event_type, session_time, lap_number, index_in_session
-                ) VALUES (?, ?, ?, ?, ?)
+                    session_id, event_type, session_time, lap_number, index_in_session, lap_dist_pct
+                ) VALUES (?, ?, ?, ?, ?, ?)
                 """,
                 (
                     session_id,
@@ -213,6 +351,7 @@ def insert_session(
                     event.session_time,
                     event.lap_number,
                     event.index,
+                    event_position(event, event_lap_dist_pct) if event_lap_dist_pct is not None else None,
                 ),
             )
 
@@ -232,8 +371,72 @@ def insert_session(
                 ),
             )
 
-    conn.commit()
-    return session_id
+    if sector_data:
+        insert_sector_times(conn, session_id, sector_data, lap_id_map, commit=False)
+
+    if microsector_data:
+        cur.executemany(
+            "INSERT INTO lap_microsectors (lap_id, session_id, data) VALUES (?, ?, ?)",
+            [
+                (lap_id_map[lap_number], session_id, pack_times(times))
+                for lap_number, times in microsector_data.items()
+                if lap_number in lap_id_map
+            ],
+        )
+
+    if lap_features:
+        store_lap_features(conn, session_id, lap_features, lap_id_map)
+
+    if lap_fingerprints:
+        store_fingerprints(conn, session_id, lap_fingerprints, lap_id_map)
+
+
+# Tables holding rows derived from a session's telemetry, keyed by session_id
+# (tables referencing laps come first).
+SESSION_CHILD_TABLES = (
+    "lap_corners", "lap_features", "lap_fingerprints", "lap_traces", "lap_microsectors", "sector_times",
+    "laps", "events", "reset_events", "session_sketches", "channel_pyramids", "corner_profiles",
+)
+
+
+def find_session_id(conn: sqlite3.Connection, file_path: str) -> Optional[int]:
+    cur = conn.cursor()
+    cur.execute("SELECT id FROM sessions WHERE file_path = ? ORDER BY id LIMIT 1", (file_path,))
+    row = cur.fetchone()
+    return int(row[0]) if row else None
+
+
+def next_data_version(conn: sqlite3.Connection) -> int:
+    """Next value for `sessions.data_version`; call inside the writing transaction."""
+    cur = conn.cursor()
+    cur.execute("SELECT COALESCE(MAX(data_version), 0) + 1 FROM sessions")
+    return int(cur.fetchone()[0])
+
+
+def touch_sessions(conn: sqlite3.Connection, session_ids: Iterable[int]) -> None:
+    """Bump `data_version` on sessions whose derived data changed. Does not commit.
+
+    Consumers that cache per-session output (the site build) compare
+    `data_version` against the value they last saw.
+    """
+    ids = [int(session_id) for session_id in session_ids]
+    if not ids:
+        return
+    try:
+        version = next_data_version(conn)
+        conn.executemany("UPDATE sessions SET data_version = ? WHERE id = ?", [(version, sid) for sid in ids])
+    except sqlite3.OperationalError:
+        pass  # database predates data_version; the site build falls back to a full rebuild
+
+
+def delete_session_rows(conn: sqlite3.Connection, session_id: int) -> None:
+    """Delete a session's derived rows (not the session row). Does not commit."""
+    cur = conn.cursor()
+    for table in SESSION_CHILD_TABLES:
+        try:
+            cur.execute(f"DELETE FROM {table} WHERE session_id = ?", (session_id,))
+        except sqlite3.OperationalError:
+            pass  # table not created in this database yet
 
 
 def insert_sector_times(
@@ -241,6 +444,7 @@ def insert_sector_times(
     session_id: int,
     sector_data: Sequence[Dict],
     lap_id_map: Optional[Dict[int, int]] = None,
+    commit: bool = True,
 ) -> None:
     cur = conn.cursor()
     for entry in sector_data:
@@ -260,7 +464,8 @@ def insert_sector_times(
                 entry["sector_time"],
             ),
         )
-    conn.commit()
+    if commit:
+        conn.commit()
 
 
 def get_lap_id_map(conn: sqlite3.Connection, session_id: int) -> Dict[int, int]:
@@ -270,3 +475,36 @@ def get_lap_id_map(conn: sqlite3.Connection, session_id: int) -> Dict[int, int]:
         (session_id,),
     )
     return {row[1]: row[0] for row in cur.fetchall()}
+
+
+def insert_ingest_run(
+    conn: sqlite3.Connection,
+    session_id: Optional[int],
+    file_path: str,
+    run_started_at: float,
+    stages: Sequence,
+) -> None:
+    """Store one row per instrumented stage (see `instrumentation.StageStats`)."""
+    cur = conn.cursor()
+    for stats in stages:
+        cur.execute(
+            """
+            INSERT INTO ingest_runs (
+                session_id, file_path, run_started_at, stage, wall_time, cpu_time,
+                records, records_per_sec, bytes_read, peak_memory
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                session_id,
+                file_path,
+                run_started_at,
+                stats.stage,
+                stats.wall_time,
+                stats.cpu_time,
+                stats.records,
+                stats.records_per_sec,
+                stats.bytes_read,
+                stats.peak_memory,
+            ),
+        )
+    conn.commit()
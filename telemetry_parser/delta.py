@@ -0,0 +1,228 @@
+"""Distance-aligned lap deltas against a per-track reference lap.
+
+Laps are resampled onto a common `LapDistPct` grid (see `distance`), after
+which the running time delta and per-channel differences are plain
+element-wise subtractions. The reference lap for a track (its best clean
+lap, or the best lap of its baseline sessions) is resampled once and cached
+in `reference_laps` as float32 blobs; the cache entry is rebuilt when a
+different lap becomes the reference or the grid/channels change. Comparing
+a session then costs one `.ibt` pass plus a few milliseconds per lap.
+"""
+from __future__ import annotations
+
+import json
+import sqlite3
+import sys
+import time
+from array import array
+from dataclasses import dataclass
+from operator import sub
+from typing import Dict, Hashable, List, Mapping, Optional, Sequence, Tuple
+
+from .distance import DEFAULT_GRID_SIZE, DistanceLap, pct_grid, resample_lap
+from .traces import TRACE_CHANNELS, read_lap_channels
+
+REFERENCE_BEST_CLEAN = "best_clean"
+REFERENCE_BASELINE = "baseline"
+REFERENCE_KINDS = (REFERENCE_BEST_CLEAN, REFERENCE_BASELINE)
+
+
+@dataclass
+class LapDelta:
+    """A lap compared with a reference on the same distance grid.
+
+    `delta[i]` is lap time minus reference time at `grid[i]` (positive means
+    the lap is behind); `channels[name][i]` is lap value minus reference value.
+    """
+
+    grid: array
+    delta: array
+    channels: Dict[str, array]
+
+    @property
+    def final_delta(self) -> float:
+        return self.delta[-1] if len(self.delta) else 0.0
+
+
+@dataclass(frozen=True)
+class ReferenceLap:
+    track_id: str
+    kind: str
+    lap_id: int
+    lap: DistanceLap
+
+
+def init_reference_table(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS reference_laps (
+            track_id TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            lap_id INTEGER NOT NULL,
+            grid_size INTEGER NOT NULL,
+            requested TEXT NOT NULL,
+            channels TEXT NOT NULL,
+            data BLOB NOT NULL,
+            created_at REAL,
+            PRIMARY KEY (track_id, kind),
+            FOREIGN KEY(lap_id) REFERENCES laps(id)
+        );
+        """
+    )
+
+
+def compare(lap: DistanceLap, reference: DistanceLap) -> LapDelta:
+    if len(lap.grid) != len(reference.grid):
+        raise ValueError("Lap and reference must be resampled onto the same grid")
+    return LapDelta(
+        grid=reference.grid,
+        delta=array("d", map(sub, lap.elapsed, reference.elapsed)),
+        channels={
+            name: array("d", map(sub, values, reference.channels[name]))
+            for name, values in lap.channels.items()
+            if name in reference.channels
+        },
+    )
+
+
+def compare_many(laps: Mapping[Hashable, DistanceLap], reference: DistanceLap) -> Dict[Hashable, LapDelta]:
+    return {key: compare(lap, reference) for key, lap in laps.items()}
+
+
+def load_distance_laps(
+    file_path: str,
+    laps: Sequence[Tuple[Hashable, float, float]],
+    grid: Sequence[float],
+    channels: Sequence[str] = TRACE_CHANNELS,
+) -> Dict[Hashable, DistanceLap]:
+    """Resample several laps of one `.ibt` (`(key, start_time, end_time)`) onto `grid`."""
+    columns_by_lap, _ = read_lap_channels(file_path, laps, ["SessionTime", *channels])
+    resampled: Dict[Hashable, DistanceLap] = {}
+    for key, columns in columns_by_lap.items():
+        session_time = columns.pop("SessionTime")
+        lap_dist_pct = columns.pop("LapDistPct")
+        resampled[key] = resample_lap(session_time, lap_dist_pct, columns, grid)
+    return resampled
+
+
+# ── Reference cache ─────────────────────────────────────────────────
+
+def _encode(lap: DistanceLap, channels: Sequence[str]) -> bytes:
+    data = array("f", lap.elapsed)
+    for name in channels:
+        data.fromlist(lap.channels[name].tolist())
+    if sys.byteorder != "little":
+        data.byteswap()
+    return data.tobytes()
+
+
+def _decode(blob: bytes, grid_size: int, channels: Sequence[str]) -> DistanceLap:
+    data = array("f")
+    data.frombytes(blob)
+    if sys.byteorder != "little":
+        data.byteswap()
+    parts = [array("d", data[i * grid_size:(i + 1) * grid_size]) for i in range(len(channels) + 1)]
+    return DistanceLap(
+        grid=pct_grid(grid_size),
+        elapsed=parts[0],
+        channels=dict(zip(channels, parts[1:])),
+    )
+
+
+def _current_reference_lap(
+    conn: sqlite3.Connection, track_id: str, kind: str
+) -> Optional[Tuple[int, str, float, float]]:
+    if kind not in REFERENCE_KINDS:
+        raise ValueError(f"Unknown reference kind: {kind}")
+    baseline = "AND s.is_baseline = 1" if kind == REFERENCE_BASELINE else ""
+    cur = conn.cursor()
+    cur.execute(
+        f"""
+        SELECT l.id, s.file_path, l.start_time, l.end_time
+        FROM laps l JOIN sessions s ON s.id = l.session_id
+        WHERE s.track_id = ? AND l.is_clean = 1 AND l.lap_time > 0 {baseline}
+        ORDER BY l.lap_time, l.id
+        LIMIT 1
+        """,
+        (track_id,),
+    )
+    row = cur.fetchone()
+    return (int(row[0]), row[1], float(row[2]), float(row[3])) if row else None
+
+
+def get_reference(
+    conn: sqlite3.Connection,
+    track_id: str,
+    kind: str = REFERENCE_BEST_CLEAN,
+    grid_size: int = DEFAULT_GRID_SIZE,
+    channels: Sequence[str] = TRACE_CHANNELS,
+) -> Optional[ReferenceLap]:
+    """The track's reference lap on a `grid_size` grid, from the cache when still current.
+
+    Returns None if the track has no qualifying lap. Reading a new reference
+    needs its `.ibt` (OSError if it is gone) and commits the cache entry.
+    """
+    current = _current_reference_lap(conn, track_id, kind)
+    if current is None:
+        return None
+    lap_id, file_path, start_time, end_time = current
+
+    init_reference_table(conn)
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT lap_id, grid_size, requested, channels, data FROM reference_laps WHERE track_id = ? AND kind = ?",
+        (track_id, kind),
+    )
+    row = cur.fetchone()
+    # `requested` may name channels the reference's .ibt lacks; only `channels` are stored
+    requested = json.dumps(list(channels))
+    if row and int(row[0]) == lap_id and int(row[1]) == grid_size and row[2] == requested:
+        return ReferenceLap(track_id, kind, lap_id, _decode(row[4], grid_size, json.loads(row[3])))
+
+    lap = load_distance_laps(file_path, [(lap_id, start_time, end_time)], pct_grid(grid_size), channels)[lap_id]
+    stored = [name for name in channels if name in lap.channels]
+    conn.execute(
+        """
+        INSERT OR REPLACE INTO reference_laps (
+            track_id, kind, lap_id, grid_size, requested, channels, data, created_at
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        (track_id, kind, lap_id, grid_size, requested, json.dumps(stored), _encode(lap, stored), time.time()),
+    )
+    conn.commit()
+    return ReferenceLap(track_id, kind, lap_id, lap)
+
+
+def compare_session(
+    conn: sqlite3.Connection,
+    session_id: int,
+    kind: str = REFERENCE_BEST_CLEAN,
+    grid_size: int = DEFAULT_GRID_SIZE,
+    channels: Sequence[str] = TRACE_CHANNELS,
+) -> Dict[int, LapDelta]:
+    """Deltas of every complete lap of a session against its track's reference, by lap number."""
+    cur = conn.cursor()
+    cur.execute("SELECT track_id, file_path FROM sessions WHERE id = ?", (session_id,))
+    row = cur.fetchone()
+    if row is None:
+        raise KeyError(f"Unknown session: {session_id}")
+    track_id, file_path = row
+    if not track_id:
+        return {}
+    reference = get_reference(conn, track_id, kind, grid_size, channels)
+    if reference is None:
+        return {}
+
+    cur.execute(
+        """
+        SELECT lap_number, start_time, end_time FROM laps
+        WHERE session_id = ? AND is_complete = 1 AND is_reset = 0
+        ORDER BY lap_number
+        """,
+        (session_id,),
+    )
+    laps: List[Tuple[int, float, float]] = [(int(n), float(s), float(e)) for n, s, e in cur.fetchall()]
+    if not laps:
+        return {}
+    resampled = load_distance_laps(file_path, laps, reference.lap.grid, list(reference.lap.channels))
+    return compare_many(resampled, reference.lap)
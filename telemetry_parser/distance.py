@@ -0,0 +1,104 @@
+"""Resampling laps onto a common `LapDistPct` grid.
+
+Laps recorded at the same tick rate still have different sample counts and
+sample positions along the track, so any comparison between laps first
+maps them onto a fixed distance grid. Values between samples are linearly
+interpolated; samples carried over from the previous lap (LapDistPct still
+near 1.0 at the start) and any backwards steps are dropped first.
+"""
+from __future__ import annotations
+
+from array import array
+from dataclasses import dataclass, field
+from typing import Dict, List, Mapping, Sequence
+
+DEFAULT_GRID_SIZE = 1000
+
+
+def pct_grid(size: int = DEFAULT_GRID_SIZE) -> array:
+    """`size` evenly spaced LapDistPct points from 0.0 to 1.0 inclusive."""
+    if size < 2:
+        raise ValueError("grid size must be at least 2")
+    return array("d", (i / (size - 1) for i in range(size)))
+
+
+def monotonic_indices(lap_dist_pct: Sequence[float]) -> List[int]:
+    """Indices of the samples forming a strictly increasing LapDistPct run.
+
+    Leading samples from the end of the previous lap (above 0.5 before the
+    wrap to ~0) are skipped, as are samples that don't move forward.
+    """
+    n = len(lap_dist_pct)
+    start = 0
+    while start < n - 1 and lap_dist_pct[start] > 0.5 and lap_dist_pct[start + 1] < lap_dist_pct[start]:
+        start += 1
+    kept: List[int] = []
+    last = -1.0
+    for i in range(start, n):
+        pct = lap_dist_pct[i]
+        if pct > last:
+            kept.append(i)
+            last = pct
+    return kept
+
+
+def interpolate(xs: Sequence[float], ys: Sequence[float], grid: Sequence[float]) -> array:
+    """Linear interpolation of `ys(xs)` at `grid` (both ascending), clamped at the ends."""
+    out = array("d", bytes(8 * len(grid)))
+    n = len(xs)
+    if n == 0:
+        return out
+    j = 0
+    for i, g in enumerate(grid):
+        while j < n - 1 and xs[j + 1] < g:
+            j += 1
+        if g <= xs[0]:
+            out[i] = ys[0]
+        elif j >= n - 1:
+            out[i] = ys[n - 1]
+        else:
+            x0, x1 = xs[j], xs[j + 1]
+            y0 = ys[j]
+            out[i] = y0 + (ys[j + 1] - y0) * (g - x0) / (x1 - x0)
+    return out
+
+
+@dataclass
+class DistanceLap:
+    """One lap on a distance grid: elapsed time and channels at each grid point."""
+
+    grid: array
+    elapsed: array
+    channels: Dict[str, array] = field(default_factory=dict)
+
+    @property
+    def lap_time(self) -> float:
+        return self.elapsed[-1] if len(self.elapsed) else 0.0
+
+
+def resample_lap(
+    session_time: Sequence[float],
+    lap_dist_pct: Sequence[float],
+    channels: Mapping[str, Sequence[float]],
+    grid: Sequence[float],
+) -> DistanceLap:
+    """Map one lap's samples onto `grid`.
+
+    `elapsed` is the time since the lap's first kept sample, so it starts
+    at ~0 regardless of where in the session the lap was driven.
+    """
+    kept = monotonic_indices(lap_dist_pct)
+    grid = grid if isinstance(grid, array) else array("d", grid)
+    if not kept:
+        return DistanceLap(grid, array("d", bytes(8 * len(grid))))
+    xs = array("d", (lap_dist_pct[i] for i in kept))
+    t0 = session_time[kept[0]]
+    elapsed = interpolate(xs, array("d", (session_time[i] - t0 for i in kept)), grid)
+    return DistanceLap(
+        grid=grid,
+        elapsed=elapsed,
+        channels={
+            name: interpolate(xs, array("d", (values[i] for i in kept)), grid)
+            for name, values in channels.items()
+        },
+    )
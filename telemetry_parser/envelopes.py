@@ -0,0 +1,333 @@
+"""Distance-domain consistency envelopes across many laps.
+
+For every point of an `ENVELOPE_POINTS` LapDistPct grid, an envelope holds
+the 10th, 50th and 90th percentile of Speed and of the time delta to the
+track's reference lap (`delta.get_reference`) over a set of clean laps. The
+width of the p10..p90 band along the lap shows where lap-to-lap variance
+collapses (or doesn't), which a whole-lap `stddev_lap` can't.
+
+Laps are streamed from their `.ibt` in batches of at most `BATCH_LAPS` and
+folded into an `EnvelopeSketch`: a sparse histogram per grid point (0.01
+m/s and 1 ms bins), so memory depends on the spread of values, not on the
+number of laps. Sketches merge by adding bins, so a date window is the
+merge of the cached sketches of the track-weeks it covers
+(`track_week_envelopes`, Monday-based weeks of local session days) plus
+whatever partial weeks remain at its ends. A week's cache entry is rebuilt
+when its sessions or the reference lap change.
+"""
+from __future__ import annotations
+
+import sqlite3
+import sys
+import time
+import zlib
+from array import array
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .delta import REFERENCE_BEST_CLEAN, get_reference, load_distance_laps
+from .distance import interpolate, pct_grid
+
+ENVELOPE_POINTS = 200
+BATCH_LAPS = 25
+QUANTILES = (0.1, 0.5, 0.9)
+
+_SPEED_BIN = 0.01  # m/s
+_DELTA_BIN = 0.001  # s
+
+_SESSION_DAY = "date(s.start_time, 'unixepoch', 'localtime')"
+
+
+@dataclass
+class Envelope:
+    """p10/p50/p90 per grid point of Speed (m/s) and delta to the reference (s)."""
+
+    grid: array
+    laps: int
+    reference_lap_id: Optional[int]
+    speed: Dict[float, array]  # by quantile
+    delta: Dict[float, array]
+
+    def band(self, channel: str = "delta") -> array:
+        """p90 - p10 at each grid point of `"speed"` or `"delta"`."""
+        values = getattr(self, channel)
+        return array("d", (hi - lo for lo, hi in zip(values[0.1], values[0.9])))
+
+
+def _quantiles(bins: Dict[int, int], count: int, qs: Sequence[float], width: float) -> List[float]:
+    """Linearly interpolated percentiles of binned values (as `LapTimeSketch.quantiles`)."""
+    if not count:
+        return [0.0] * len(qs)
+    wanted = [(int((count - 1) * q), (count - 1) * q - int((count - 1) * q)) for q in qs]
+    ranks = sorted({f for f, _ in wanted} | {min(f + 1, count - 1) for f, _ in wanted})
+    value_at: Dict[int, float] = {}
+    seen = 0
+    i = 0
+    for key in sorted(bins):
+        seen += bins[key]
+        while i < len(ranks) and ranks[i] < seen:
+            value_at[ranks[i]] = key * width
+            i += 1
+        if i == len(ranks):
+            break
+    out = []
+    for f, frac in wanted:
+        low = value_at[f]
+        high = value_at[min(f + 1, count - 1)]
+        out.append(low + (high - low) * frac)
+    return out
+
+
+class EnvelopeSketch:
+    """Per-grid-point histograms of Speed and reference delta over a set of laps."""
+
+    __slots__ = ("points", "laps", "speed", "delta")
+
+    def __init__(self, points: int = ENVELOPE_POINTS) -> None:
+        self.points = points
+        self.laps = 0
+        self.speed: List[Dict[int, int]] = [defaultdict(int) for _ in range(points)]
+        self.delta: List[Dict[int, int]] = [defaultdict(int) for _ in range(points)]
+
+    def add_lap(self, speed: Sequence[float], delta: Sequence[float]) -> None:
+        for bins, value in zip(self.speed, speed):
+            bins[int(round(value / _SPEED_BIN))] += 1
+        for bins, value in zip(self.delta, delta):
+            bins[int(round(value / _DELTA_BIN))] += 1
+        self.laps += 1
+
+    def merge(self, other: "EnvelopeSketch") -> "EnvelopeSketch":
+        """Fold `other` into this sketch in place; returns self."""
+        if other.points != self.points:
+            raise ValueError("Envelope sketches must share a grid")
+        for mine, theirs in zip(self.speed + self.delta, other.speed + other.delta):
+            for key, n in theirs.items():
+                mine[key] += n
+        self.laps += other.laps
+        return self
+
+    def envelope(self, reference_lap_id: Optional[int] = None, qs: Sequence[float] = QUANTILES) -> Envelope:
+        def columns(histograms: List[Dict[int, int]], width: float) -> Dict[float, array]:
+            out = {q: array("d") for q in qs}
+            for bins in histograms:
+                for q, value in zip(qs, _quantiles(bins, self.laps, qs, width)):
+                    out[q].append(value)
+            return out
+
+        return Envelope(
+            grid=pct_grid(self.points),
+            laps=self.laps,
+            reference_lap_id=reference_lap_id,
+            speed=columns(self.speed, _SPEED_BIN),
+            delta=columns(self.delta, _DELTA_BIN),
+        )
+
+    def to_bytes(self) -> bytes:
+        # points, laps, then per histogram: pair count followed by (bin, count) pairs
+        data = array("i", [self.points, self.laps])
+        for bins in self.speed + self.delta:
+            data.append(len(bins))
+            for key in sorted(bins):
+                data.append(key)
+                data.append(bins[key])
+        if sys.byteorder != "little":
+            data.byteswap()
+        return zlib.compress(data.tobytes(), 6)
+
+    @classmethod
+    def from_bytes(cls, blob: bytes) -> "EnvelopeSketch":
+        data = array("i")
+        data.frombytes(zlib.decompress(blob))
+        if sys.byteorder != "little":
+            data.byteswap()
+        sketch = cls(data[0])
+        sketch.laps = data[1]
+        pos = 2
+        for bins in sketch.speed + sketch.delta:
+            n = data[pos]
+            bins.update(zip(data[pos + 1:pos + 1 + 2 * n:2], data[pos + 2:pos + 2 + 2 * n:2]))
+            pos += 1 + 2 * n
+        return sketch
+
+
+def init_envelope_table(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS track_week_envelopes (
+            track_id TEXT NOT NULL,
+            week TEXT NOT NULL,
+            reference_lap_id INTEGER NOT NULL,
+            signature TEXT NOT NULL,
+            laps INTEGER NOT NULL,
+            data BLOB NOT NULL,
+            created_at REAL NOT NULL,
+            PRIMARY KEY (track_id, week)
+        );
+        """
+    )
+
+
+# ── Streaming laps ──────────────────────────────────────────────────
+
+def reference_elapsed(conn: sqlite3.Connection, track_id: str, points: int = ENVELOPE_POINTS) -> Optional[Tuple[int, array]]:
+    """`(lap_id, elapsed time on the envelope grid)` of the track's best clean lap; None without one."""
+    reference = get_reference(conn, track_id, REFERENCE_BEST_CLEAN)
+    if reference is None:
+        return None
+    lap = reference.lap
+    return reference.lap_id, interpolate(lap.grid, lap.elapsed, pct_grid(points))
+
+
+def _clean_laps(conn: sqlite3.Connection, where: str, params: Sequence) -> Dict[str, List[Tuple[int, float, float]]]:
+    """Clean laps `(lap_id, start_time, end_time)` by `.ibt` path, for sessions matching `where`."""
+    cur = conn.cursor()
+    cur.execute(
+        f"""
+        SELECT s.file_path, l.id, l.start_time, l.end_time
+        FROM laps l JOIN sessions s ON s.id = l.session_id
+        WHERE {where} AND l.is_clean = 1 AND l.is_complete = 1 AND l.is_reset = 0
+        ORDER BY s.id, l.lap_number
+        """,
+        params,
+    )
+    by_file: Dict[str, List[Tuple[int, float, float]]] = {}
+    for file_path, lap_id, start, end in cur.fetchall():
+        by_file.setdefault(file_path, []).append((int(lap_id), float(start), float(end)))
+    return by_file
+
+
+def stream_laps(
+    laps_by_file: Dict[str, List[Tuple[int, float, float]]],
+    reference_elapsed: Sequence[float],
+    sketch: EnvelopeSketch,
+    batch_laps: int = BATCH_LAPS,
+) -> EnvelopeSketch:
+    """Resample laps `batch_laps` at a time and fold them into `sketch`. Files missing on disk are skipped."""
+    grid = pct_grid(sketch.points)
+    for file_path, laps in laps_by_file.items():
+        for start in range(0, len(laps), batch_laps):
+            try:
+                resampled = load_distance_laps(file_path, laps[start:start + batch_laps], grid, ["Speed"])
+            except OSError:
+                break
+            for lap in resampled.values():
+                if "Speed" not in lap.channels:
+                    continue
+                sketch.add_lap(lap.channels["Speed"], [t - r for t, r in zip(lap.elapsed, reference_elapsed)])
+    return sketch
+
+
+def session_envelope(conn: sqlite3.Connection, session_id: int, points: int = ENVELOPE_POINTS) -> Optional[Envelope]:
+    """Envelope of one session's clean laps; None without a track or reference lap."""
+    cur = conn.cursor()
+    cur.execute("SELECT track_id FROM sessions WHERE id = ?", (session_id,))
+    row = cur.fetchone()
+    if row is None:
+        raise KeyError(f"Unknown session: {session_id}")
+    if not row[0]:
+        return None
+    reference = reference_elapsed(conn, row[0], points)
+    if reference is None:
+        return None
+    sketch = stream_laps(_clean_laps(conn, "s.id = ?", (session_id,)), reference[1], EnvelopeSketch(points))
+    return sketch.envelope(reference[0])
+
+
+# ── Track-week cache ────────────────────────────────────────────────
+
+def week_start(day: str) -> str:
+    """Monday of the week containing `day` (YYYY-MM-DD)."""
+    d = date.fromisoformat(day)
+    return (d - timedelta(days=d.weekday())).isoformat()
+
+
+def _week_signature(conn: sqlite3.Connection, track_id: str, week: str) -> str:
+    """Changes whenever a session of the week is added, removed or re-derived."""
+    end = (date.fromisoformat(week) + timedelta(days=7)).isoformat()
+    cur = conn.cursor()
+    cur.execute(
+        f"""
+        SELECT COUNT(*), COALESCE(SUM(s.id), 0), COALESCE(MAX(s.data_version), 0)
+        FROM sessions s WHERE s.track_id = ? AND {_SESSION_DAY} >= ? AND {_SESSION_DAY} < ?
+        """,
+        (track_id, week, end),
+    )
+    return ":".join(str(value) for value in cur.fetchone())
+
+
+def _day_range(track_id: str, start_day: str, end_day: str) -> Tuple[str, Tuple]:
+    return f"s.track_id = ? AND {_SESSION_DAY} >= ? AND {_SESSION_DAY} <= ?", (track_id, start_day, end_day)
+
+
+def week_sketch(
+    conn: sqlite3.Connection,
+    track_id: str,
+    week: str,
+    reference: Tuple[int, Sequence[float]],
+    points: int = ENVELOPE_POINTS,
+) -> EnvelopeSketch:
+    """The track-week's sketch, from the cache when still current (else rebuilt and stored; commits)."""
+    init_envelope_table(conn)
+    signature = _week_signature(conn, track_id, week)
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT reference_lap_id, signature, data FROM track_week_envelopes WHERE track_id = ? AND week = ?",
+        (track_id, week),
+    )
+    row = cur.fetchone()
+    if row and int(row[0]) == reference[0] and row[1] == signature:
+        sketch = EnvelopeSketch.from_bytes(row[2])
+        if sketch.points == points:
+            return sketch
+
+    last_day = (date.fromisoformat(week) + timedelta(days=6)).isoformat()
+    where, params = _day_range(track_id, week, last_day)
+    sketch = stream_laps(_clean_laps(conn, where, params), reference[1], EnvelopeSketch(points))
+    conn.execute(
+        """
+        INSERT OR REPLACE INTO track_week_envelopes (
+            track_id, week, reference_lap_id, signature, laps, data, created_at
+        ) VALUES (?, ?, ?, ?, ?, ?, ?)
+        """,
+        (track_id, week, reference[0], signature, sketch.laps, sketch.to_bytes(), time.time()),
+    )
+    conn.commit()
+    return sketch
+
+
+def _weeks(start_day: str, end_day: str) -> Iterable[str]:
+    week = date.fromisoformat(week_start(start_day))
+    last = date.fromisoformat(end_day)
+    while week <= last:
+        yield week.isoformat()
+        week += timedelta(days=7)
+
+
+def window_envelope(
+    conn: sqlite3.Connection,
+    track_id: str,
+    start_day: str,
+    end_day: str,
+    points: int = ENVELOPE_POINTS,
+) -> Optional[Envelope]:
+    """Envelope of a track's clean laps between two local days (inclusive).
+
+    Whole weeks inside the window come from `track_week_envelopes` (built
+    and committed when missing or stale, so not inside a read transaction);
+    the days of partial weeks at either end are streamed directly. None if
+    the track has no reference lap.
+    """
+    reference = reference_elapsed(conn, track_id, points)
+    if reference is None:
+        return None
+    sketch = EnvelopeSketch(points)
+    for week in _weeks(start_day, end_day):
+        last_day = (date.fromisoformat(week) + timedelta(days=6)).isoformat()
+        if week >= start_day and last_day <= end_day:
+            sketch.merge(week_sketch(conn, track_id, week, reference, points))
+        else:
+            where, params = _day_range(track_id, max(week, start_day), min(last_day, end_day))
+            stream_laps(_clean_laps(conn, where, params), reference[1], sketch)
+    return sketch.envelope(reference[0])
@@ -0,0 +1,195 @@
+"""R*Tree index of events and resets by track position and time.
+
+`event_rtree` holds one entry per `events` / `reset_events` row with three
+integer dimensions: the track (a key from `event_rtree_tracks`, so each
+track is its own partition), LapDistPct in millionths, and the session's
+disk-header start time in Unix seconds. A query such as "all spins between
+0.18 and 0.22 of Spa in March" is then a single R*Tree range search instead
+of a scan of every event joined through `sessions`.
+
+Entries are written by `insert_session` (and removed before a session's
+rows are replaced or deleted); `rebuild_event_index` recreates them from
+stored rows.
+"""
+from __future__ import annotations
+
+import sqlite3
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from .heatmap import KIND_RESET
+
+PCT_SCALE = 1_000_000
+
+
+@dataclass(frozen=True)
+class IndexedEvent:
+    kind: str
+    session_id: int
+    row_id: int
+    lap_dist_pct: float
+    start_time: int
+
+
+def init_event_index(conn: sqlite3.Connection) -> None:
+    cur = conn.cursor()
+    cur.execute(
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS event_rtree USING rtree_i32(
+            id,
+            track_min, track_max,
+            pct_min, pct_max,
+            time_min, time_max,
+            +session_id INTEGER,
+            +kind TEXT,
+            +row_id INTEGER
+        );
+        """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS event_rtree_tracks (
+            track_key INTEGER PRIMARY KEY,
+            track_id TEXT NOT NULL UNIQUE
+        );
+        """
+    )
+
+
+def _track_key(conn: sqlite3.Connection, track_id: str, create: bool = False) -> Optional[int]:
+    cur = conn.cursor()
+    cur.execute("SELECT track_key FROM event_rtree_tracks WHERE track_id = ?", (track_id,))
+    row = cur.fetchone()
+    if row is not None:
+        return int(row[0])
+    if not create:
+        return None
+    cur.execute("INSERT INTO event_rtree_tracks (track_id) VALUES (?)", (track_id,))
+    return int(cur.lastrowid)
+
+
+def _session_rows(conn: sqlite3.Connection, where: str, params: Sequence) -> List[Tuple]:
+    """(track_id, start_time, session_id, kind, row_id, lap_dist_pct) of positioned events and resets."""
+    cur = conn.cursor()
+    rows: List[Tuple] = []
+    for table, kind in (("events", "e.event_type"), ("reset_events", f"'{KIND_RESET}'")):
+        try:
+            cur.execute(
+                f"""
+                SELECT s.track_id, COALESCE(s.start_time, 0), s.id, {kind}, e.id, e.lap_dist_pct
+                FROM {table} e JOIN sessions s ON s.id = e.session_id
+                WHERE {where} AND s.track_id IS NOT NULL AND e.lap_dist_pct >= 0
+                """,
+                params,
+            )
+        except sqlite3.OperationalError:
+            continue  # events.lap_dist_pct not migrated in this database yet
+        rows.extend(cur.fetchall())
+    return rows
+
+
+def _insert(conn: sqlite3.Connection, rows: Iterable[Tuple]) -> None:
+    keys = {}
+    entries = []
+    for track_id, start_time, session_id, kind, row_id, pct in rows:
+        if track_id not in keys:
+            keys[track_id] = _track_key(conn, track_id, create=True)
+        key = keys[track_id]
+        scaled = int(round(pct * PCT_SCALE))
+        start_time = int(start_time)
+        entries.append((key, key, scaled, scaled, start_time, start_time, session_id, kind, row_id))
+    conn.executemany(
+        """
+        INSERT INTO event_rtree (
+            track_min, track_max, pct_min, pct_max, time_min, time_max, session_id, kind, row_id
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        entries,
+    )
+
+
+def index_session_events(conn: sqlite3.Connection, session_id: int) -> None:
+    """Add a session's stored events and resets to the index. Does not commit."""
+    _insert(conn, _session_rows(conn, "s.id = ?", (session_id,)))
+
+
+def unindex_session_events(conn: sqlite3.Connection, session_id: int) -> None:
+    """Drop a session's entries; call before its rows or track change. Does not commit."""
+    cur = conn.cursor()
+    cur.execute("SELECT track_id, COALESCE(start_time, 0) FROM sessions WHERE id = ?", (session_id,))
+    row = cur.fetchone()
+    if row is None or row[0] is None:
+        return
+    key = _track_key(conn, row[0])
+    if key is None:
+        return
+    # The session's entries all sit at (track, start_time); session_id is an unindexed column
+    cur.execute(
+        """
+        DELETE FROM event_rtree WHERE id IN (
+            SELECT id FROM event_rtree
+            WHERE track_min = ? AND track_max = ? AND time_min = ? AND time_max = ? AND session_id = ?
+        )
+        """,
+        (key, key, int(row[1]), int(row[1]), session_id),
+    )
+
+
+def rebuild_event_index(conn: sqlite3.Connection) -> None:
+    """Recreate every entry from stored rows. Does not commit."""
+    cur = conn.cursor()
+    cur.execute("DELETE FROM event_rtree")
+    _insert(conn, _session_rows(conn, "1 = 1", ()))
+
+
+def _day_start(day: str) -> int:
+    # Local midnight, matching how iRacing names files
+    return int(time.mktime(datetime.strptime(day, "%Y-%m-%d").timetuple()))
+
+
+def query_events(
+    conn: sqlite3.Connection,
+    track_id: str,
+    pct_range: Optional[Tuple[float, float]] = None,
+    start_day: Optional[str] = None,
+    end_day: Optional[str] = None,
+    kinds: Optional[Sequence[str]] = None,
+) -> List[IndexedEvent]:
+    """Events and resets of a track inside a LapDistPct range and a day range (both inclusive).
+
+    `kinds` are event types (`"spin"`, `"off_track"`, `"big_save"`) and/or
+    `"reset"`; by default all of them. Results are ordered by time, then position.
+    """
+    key = _track_key(conn, track_id)
+    if key is None:
+        return []
+    clauses = ["track_min >= ?", "track_max <= ?"]
+    params: List = [key, key]
+    if pct_range is not None:
+        clauses += ["pct_max >= ?", "pct_min <= ?"]
+        params += [int(round(pct_range[0] * PCT_SCALE)), int(round(pct_range[1] * PCT_SCALE))]
+    if start_day is not None:
+        clauses.append("time_max >= ?")
+        params.append(_day_start(start_day))
+    if end_day is not None:
+        next_day = (datetime.strptime(end_day, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+        clauses.append("time_min < ?")
+        params.append(_day_start(next_day))
+    if kinds:
+        clauses.append(f"kind IN ({', '.join('?' for _ in kinds)})")
+        params += list(kinds)
+    cur = conn.cursor()
+    cur.execute(
+        f"""
+        SELECT kind, session_id, row_id, pct_min, time_min FROM event_rtree
+        WHERE {' AND '.join(clauses)}
+        ORDER BY time_min, pct_min
+        """,
+        params,
+    )
+    return [
+        IndexedEvent(kind, int(session_id), int(row_id), pct / PCT_SCALE, int(start_time))
+        for kind, session_id, row_id, pct, start_time in cur.fetchall()
+    ]
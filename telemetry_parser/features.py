@@ -0,0 +1,164 @@
+"""Per-lap driving features computed at ingest.
+
+One pass over each lap's samples of the channels ingest already decodes
+yields speed extremes, throttle/brake usage, coasting, steering reversals
+and yaw-rate energy. They are stored in `lap_features` so technique and
+consistency trends can be queried across the whole history without
+reopening any `.ibt`.
+
+Time-based features weight each sample by the time to the next one, so
+they don't depend on the tick rate. A feature whose channel is missing
+from the file is stored as NULL.
+"""
+from __future__ import annotations
+
+import math
+import sqlite3
+from dataclasses import astuple, dataclass, fields
+from typing import Dict, Mapping, Optional, Sequence
+
+from .channel_plan import Stage
+from .segments import LapSegment
+
+FEATURE_CHANNELS = ("Speed", "Throttle", "Brake", "SteeringWheelAngle", "YawRate")
+FEATURE_STAGE = Stage("lap_features", ("SessionTime",), FEATURE_CHANNELS)
+
+FULL_THROTTLE = 0.95  # Throttle fraction counted as flat out
+PEDAL_ON = 0.05  # Throttle/Brake fraction counted as applied
+STEERING_REVERSAL_GAP = math.radians(2.0)  # Swing needed to count a steering reversal
+
+
+@dataclass(frozen=True)
+class LapFeatures:
+    max_speed: Optional[float]  # m/s
+    min_speed: Optional[float]  # m/s
+    full_throttle_pct: Optional[float]  # share of lap time at FULL_THROTTLE or more
+    brake_pct: Optional[float]  # share of lap time with the brake applied
+    coasting_time: Optional[float]  # seconds with neither pedal applied
+    steering_reversal_rate: Optional[float]  # reversals per minute
+    yaw_energy: Optional[float]  # integral of YawRate^2 over the lap, rad^2/s
+
+
+FEATURE_COLUMNS = tuple(f.name for f in fields(LapFeatures))
+
+
+def init_lap_features_table(conn: sqlite3.Connection) -> None:
+    columns = ",\n            ".join(f"{name} REAL" for name in FEATURE_COLUMNS)
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS lap_features (
+            lap_id INTEGER PRIMARY KEY,
+            session_id INTEGER NOT NULL,
+            {columns},
+            FOREIGN KEY(session_id) REFERENCES sessions(id),
+            FOREIGN KEY(lap_id) REFERENCES laps(id)
+        );
+        """
+    )
+
+
+def _steering_reversals(steering: Sequence[float], gap: float) -> int:
+    """Direction changes of the steering wheel by at least `gap` (the usual reversal-rate definition)."""
+    reversals = 0
+    direction = 0  # +1 while steering up towards a peak, -1 down towards a trough
+    peak = trough = steering[0]
+    for angle in steering:
+        if angle > peak:
+            peak = angle
+        if angle < trough:
+            trough = angle
+        if direction >= 0 and peak - angle >= gap:
+            reversals += direction > 0
+            direction, trough = -1, angle
+        elif direction <= 0 and angle - trough >= gap:
+            reversals += direction < 0
+            direction, peak = 1, angle
+    return reversals
+
+
+def lap_features(
+    session_time: Sequence[float],
+    channels: Mapping[str, Sequence[float]],
+    start: int,
+    end: int,
+) -> Optional[LapFeatures]:
+    """Features of samples `start..end` (inclusive); None if the lap spans no time."""
+    times = session_time[start:end + 1]
+    duration = float(times[-1] - times[0]) if len(times) > 1 else 0.0
+    if duration <= 0:
+        return None
+    # Each sample holds until the next one
+    dts = [b - a for a, b in zip(times, times[1:])]
+    dts.append(0.0)
+
+    def window(name: str) -> Optional[Sequence[float]]:
+        values = channels.get(name)
+        return values[start:end + 1] if values is not None else None
+
+    speed = window("Speed")
+    throttle = window("Throttle")
+    brake = window("Brake")
+    steering = window("SteeringWheelAngle")
+    yaw_rate = window("YawRate")
+
+    full_throttle_pct = brake_pct = coasting_time = None
+    if throttle is not None:
+        full_throttle_pct = math.fsum(dt for dt, t in zip(dts, throttle) if t >= FULL_THROTTLE) / duration
+    if brake is not None:
+        brake_pct = math.fsum(dt for dt, b in zip(dts, brake) if b > PEDAL_ON) / duration
+    if throttle is not None and brake is not None:
+        coasting_time = math.fsum(
+            dt for dt, t, b in zip(dts, throttle, brake) if t <= PEDAL_ON and b <= PEDAL_ON
+        )
+
+    return LapFeatures(
+        max_speed=float(max(speed)) if speed is not None else None,
+        min_speed=float(min(speed)) if speed is not None else None,
+        full_throttle_pct=full_throttle_pct,
+        brake_pct=brake_pct,
+        coasting_time=coasting_time,
+        steering_reversal_rate=(
+            _steering_reversals(steering, STEERING_REVERSAL_GAP) * 60.0 / duration
+            if steering is not None else None
+        ),
+        yaw_energy=(
+            math.fsum(dt * r * r for dt, r in zip(dts, yaw_rate)) if yaw_rate is not None else None
+        ),
+    )
+
+
+def compute_lap_features(
+    session_time: Sequence[float],
+    channels: Mapping[str, Sequence[float]],
+    segments: Sequence[LapSegment],
+) -> Dict[int, LapFeatures]:
+    """Features of every lap with samples, by lap number."""
+    results: Dict[int, LapFeatures] = {}
+    for seg in segments:
+        if seg.end_idx <= seg.start_idx:
+            continue
+        features = lap_features(session_time, channels, seg.start_idx, seg.end_idx)
+        if features is not None:
+            results[seg.lap_number] = features
+    return results
+
+
+def store_lap_features(
+    conn: sqlite3.Connection,
+    session_id: int,
+    features_by_lap: Mapping[int, LapFeatures],
+    lap_id_map: Mapping[int, int],
+) -> None:
+    """Replace a session's `lap_features` rows. Does not commit."""
+    conn.execute("DELETE FROM lap_features WHERE session_id = ?", (session_id,))
+    conn.executemany(
+        f"""
+        INSERT INTO lap_features (lap_id, session_id, {', '.join(FEATURE_COLUMNS)})
+        VALUES (?, ?, {', '.join('?' for _ in FEATURE_COLUMNS)})
+        """,
+        [
+            (lap_id_map[lap_number], session_id, *astuple(features))
+            for lap_number, features in features_by_lap.items()
+            if lap_number in lap_id_map
+        ],
+    )
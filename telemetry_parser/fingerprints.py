@@ -0,0 +1,216 @@
+"""Fixed-length lap fingerprints and nearest-neighbour lap search.
+
+A lap's fingerprint is its Speed resampled onto a `FINGERPRINT_POINTS`
+LapDistPct grid, stored as a little-endian float32 BLOB in
+`lap_fingerprints` at ingest. Every lap of a track is then comparable
+point for point, so "which laps look like my PB through Eau Rouge" is a
+k-nearest-neighbour search over one slice of the fingerprints instead of
+a re-analysis of every `.ibt`.
+
+`FingerprintIndex` loads a track's fingerprints once and answers queries
+by brute force (`math.dist` per lap plus a bounded heap), which takes a
+few milliseconds for tens of thousands of laps. Distances are the RMS
+speed difference in m/s over the compared points.
+"""
+from __future__ import annotations
+
+import heapq
+import math
+import sqlite3
+import sys
+from array import array
+from dataclasses import dataclass
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+from .channel_plan import Stage
+from .distance import pct_grid, resample_lap
+from .segments import LapSegment
+
+FINGERPRINT_CHANNEL = "Speed"
+FINGERPRINT_STAGE = Stage("lap_fingerprints", ("SessionTime", "LapDistPct", FINGERPRINT_CHANNEL))
+FINGERPRINT_POINTS = 200
+
+
+@dataclass(frozen=True)
+class SimilarLap:
+    lap_id: int
+    session_id: int
+    lap_number: int
+    distance: float  # RMS speed difference, m/s
+
+
+def init_fingerprint_table(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS lap_fingerprints (
+            lap_id INTEGER PRIMARY KEY,
+            session_id INTEGER NOT NULL,
+            data BLOB NOT NULL,
+            FOREIGN KEY(session_id) REFERENCES sessions(id),
+            FOREIGN KEY(lap_id) REFERENCES laps(id)
+        );
+        """
+    )
+
+
+def pack_fingerprint(values: Sequence[float]) -> bytes:
+    data = array("f", values)
+    if sys.byteorder != "little":
+        data.byteswap()
+    return data.tobytes()
+
+
+def unpack_fingerprint(blob: bytes) -> array:
+    data = array("f")
+    data.frombytes(blob)
+    if sys.byteorder != "little":
+        data.byteswap()
+    return data
+
+
+def compute_fingerprints(
+    session_time: Sequence[float],
+    lap_dist_pct: Sequence[float],
+    speed: Sequence[float],
+    segments: Sequence[LapSegment],
+    points: int = FINGERPRINT_POINTS,
+) -> Dict[int, array]:
+    """Fingerprint of every complete lap, by lap number."""
+    grid = pct_grid(points)
+    results: Dict[int, array] = {}
+    for seg in segments:
+        if not seg.is_complete or seg.end_idx <= seg.start_idx:
+            continue
+        lo, hi = seg.start_idx, seg.end_idx + 1
+        resampled = resample_lap(session_time[lo:hi], lap_dist_pct[lo:hi], {FINGERPRINT_CHANNEL: speed[lo:hi]}, grid)
+        if FINGERPRINT_CHANNEL in resampled.channels:
+            results[seg.lap_number] = resampled.channels[FINGERPRINT_CHANNEL]
+    return results
+
+
+def store_fingerprints(
+    conn: sqlite3.Connection,
+    session_id: int,
+    fingerprints: Mapping[int, Sequence[float]],
+    lap_id_map: Mapping[int, int],
+) -> None:
+    """Replace a session's fingerprints. Does not commit."""
+    conn.execute("DELETE FROM lap_fingerprints WHERE session_id = ?", (session_id,))
+    conn.executemany(
+        "INSERT INTO lap_fingerprints (lap_id, session_id, data) VALUES (?, ?, ?)",
+        [
+            (lap_id_map[lap_number], session_id, pack_fingerprint(values))
+            for lap_number, values in fingerprints.items()
+            if lap_number in lap_id_map
+        ],
+    )
+
+
+def _point_range(pct_range: Optional[Tuple[float, float]], points: int) -> Tuple[int, int]:
+    """Grid indices `lo..hi` (exclusive) covering a LapDistPct range."""
+    if pct_range is None:
+        return 0, points
+    start, end = pct_range
+    lo = max(0, math.ceil(start * (points - 1)))
+    hi = min(points, math.floor(end * (points - 1)) + 1)
+    if hi <= lo:
+        raise ValueError(f"pct_range {pct_range} covers no fingerprint point")
+    return lo, hi
+
+
+class FingerprintIndex:
+    """A track's lap fingerprints in memory, for repeated similarity queries."""
+
+    def __init__(
+        self,
+        track_id: str,
+        laps: List[Tuple[int, int, int]],
+        vectors: List[Tuple[float, ...]],
+        clean_only: bool = False,
+    ):
+        self.track_id = track_id
+        self.clean_only = clean_only  # Whether only clean laps were loaded
+        self.laps = laps  # (lap_id, session_id, lap_number) per vector
+        self.vectors = vectors
+        self._by_lap_id = {lap[0]: i for i, lap in enumerate(laps)}
+
+    def __len__(self) -> int:
+        return len(self.vectors)
+
+    @classmethod
+    def load(cls, conn: sqlite3.Connection, track_id: str, clean_only: bool = False) -> "FingerprintIndex":
+        cur = conn.cursor()
+        cur.execute(
+            f"""
+            SELECT f.lap_id, f.session_id, l.lap_number, f.data
+            FROM lap_fingerprints f
+            JOIN sessions s ON s.id = f.session_id
+            JOIN laps l ON l.id = f.lap_id
+            WHERE s.track_id = ? {'AND l.is_clean = 1' if clean_only else ''}
+            ORDER BY f.lap_id
+            """,
+            (track_id,),
+        )
+        laps, vectors = [], []
+        for lap_id, session_id, lap_number, blob in cur.fetchall():
+            laps.append((int(lap_id), int(session_id), int(lap_number)))
+            vectors.append(tuple(unpack_fingerprint(blob)))
+        return cls(track_id, laps, vectors, clean_only)
+
+    def fingerprint(self, lap_id: int) -> Optional[Tuple[float, ...]]:
+        i = self._by_lap_id.get(lap_id)
+        return self.vectors[i] if i is not None else None
+
+    def search(
+        self,
+        query: Sequence[float],
+        k: int = 10,
+        pct_range: Optional[Tuple[float, float]] = None,
+        exclude: Sequence[int] = (),
+    ) -> List[SimilarLap]:
+        """The `k` laps closest to `query` over `pct_range` (default: the whole lap), closest first."""
+        if not self.vectors:
+            return []
+        lo, hi = _point_range(pct_range, len(query))
+        target = tuple(query[lo:hi])
+        skip = set(exclude)
+        scored = (
+            (math.dist(target, vector[lo:hi]), i)
+            for i, vector in enumerate(self.vectors)
+            if self.laps[i][0] not in skip and len(vector) == len(query)
+        )
+        scale = math.sqrt(hi - lo)
+        return [
+            SimilarLap(*self.laps[i], distance / scale)
+            for distance, i in heapq.nsmallest(k, scored)
+        ]
+
+
+def similar_laps(
+    conn: sqlite3.Connection,
+    lap_id: int,
+    k: int = 10,
+    pct_range: Optional[Tuple[float, float]] = None,
+    clean_only: bool = False,
+    index: Optional[FingerprintIndex] = None,
+) -> List[SimilarLap]:
+    """Laps of the same track most like `lap_id` (itself excluded).
+
+    Pass an `index` loaded for the lap's track to avoid reloading it on
+    every query; one for another track or `clean_only` setting is replaced
+    by a fresh load. Empty if the lap has no fingerprint or no track.
+    """
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT s.track_id, f.data FROM lap_fingerprints f JOIN sessions s ON s.id = f.session_id
+        WHERE f.lap_id = ?
+        """,
+        (lap_id,),
+    )
+    row = cur.fetchone()
+    if row is None or row[0] is None:
+        return []
+    if index is None or index.track_id != row[0] or index.clean_only != clean_only:
+        index = FingerprintIndex.load(conn, row[0], clean_only)
+    return index.search(unpack_fingerprint(row[1]), k, pct_range, exclude=(lap_id,))
@@ -0,0 +1,223 @@
+"""Per-track spatial heatmap of incidents and resets.
+
+Every event (`events.event_type`) and reset (kind `"reset"`) is counted in
+one of `HEATMAP_BINS` LapDistPct bins (0.1% of a lap each) per track and
+day. Rows are maintained by `insert_session` as sessions come and go, so
+hotspot queries never re-read telemetry or re-bin old rows.
+
+Each `track_heatmap` row also holds the running total of its bin up to and
+including its day. A date-window query therefore costs two index seeks per
+populated bin (at most `HEATMAP_BINS` per kind) whatever the length of the
+history; `track_heatmap_totals` lists the populated bins with their all-time
+counts.
+
+Days are the session's disk-header start time in local time (the date
+in iRacing's file names).
+"""
+from __future__ import annotations
+
+import sqlite3
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+HEATMAP_BINS = 1000
+KIND_RESET = "reset"
+
+_SESSION_DAY = "COALESCE(date(s.start_time, 'unixepoch', 'localtime'), '')"
+
+
+def init_heatmap_tables(conn: sqlite3.Connection) -> None:
+    cur = conn.cursor()
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS track_heatmap (
+            track_id TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            bin INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            cumulative INTEGER NOT NULL,
+            PRIMARY KEY (track_id, kind, bin, day)
+        ) WITHOUT ROWID;
+        """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS track_heatmap_totals (
+            track_id TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            bin INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (track_id, kind, bin)
+        ) WITHOUT ROWID;
+        """
+    )
+
+
+def heatmap_bin(lap_dist_pct: Optional[float]) -> Optional[int]:
+    if lap_dist_pct is None or lap_dist_pct < 0:
+        return None
+    return min(int(lap_dist_pct * HEATMAP_BINS), HEATMAP_BINS - 1)
+
+
+# ── Maintenance ─────────────────────────────────────────────────────
+
+def _session_counts(
+    conn: sqlite3.Connection, where: str, params: Sequence
+) -> Dict[Tuple[str, str], Counter]:
+    """(kind, bin) counts per (track_id, day) of the sessions matching `where` (on `sessions s`)."""
+    cur = conn.cursor()
+    counts: Dict[Tuple[str, str], Counter] = {}
+    for table, kind in (("events", "e.event_type"), ("reset_events", f"'{KIND_RESET}'")):
+        try:
+            cur.execute(
+                f"""
+                SELECT s.track_id, {_SESSION_DAY}, {kind}, e.lap_dist_pct
+                FROM {table} e JOIN sessions s ON s.id = e.session_id
+                WHERE {where} AND s.track_id IS NOT NULL AND e.lap_dist_pct >= 0
+                """,
+                params,
+            )
+        except sqlite3.OperationalError:
+            continue  # events.lap_dist_pct not migrated in this database yet
+        for track_id, day, event_kind, pct in cur.fetchall():
+            counts.setdefault((track_id, day), Counter())[(event_kind, heatmap_bin(pct))] += 1
+    return counts
+
+
+def _adjust(conn: sqlite3.Connection, track_id: str, day: str, counts: Counter, sign: int) -> None:
+    cur = conn.cursor()
+    for (kind, bin_index), n in counts.items():
+        n *= sign
+        key = (track_id, kind, bin_index)
+        cur.execute(
+            """
+            INSERT INTO track_heatmap (track_id, kind, bin, day, count, cumulative)
+            VALUES (?, ?, ?, ?, ?, ? + COALESCE((
+                SELECT cumulative FROM track_heatmap
+                WHERE track_id = ? AND kind = ? AND bin = ? AND day < ?
+                ORDER BY day DESC LIMIT 1
+            ), 0))
+            ON CONFLICT (track_id, kind, bin, day)
+            DO UPDATE SET count = count + excluded.count, cumulative = cumulative + excluded.count
+            """,
+            (*key, day, n, n, *key, day),
+        )
+        cur.execute(
+            "UPDATE track_heatmap SET cumulative = cumulative + ? WHERE track_id = ? AND kind = ? AND bin = ? AND day > ?",
+            (n, *key, day),
+        )
+        cur.execute(
+            """
+            INSERT INTO track_heatmap_totals (track_id, kind, bin, count) VALUES (?, ?, ?, ?)
+            ON CONFLICT (track_id, kind, bin) DO UPDATE SET count = count + excluded.count
+            """,
+            (*key, n),
+        )
+        if sign < 0:
+            # An emptied day carries the same running total as the day before it
+            cur.execute(
+                "DELETE FROM track_heatmap WHERE track_id = ? AND kind = ? AND bin = ? AND day = ? AND count <= 0",
+                (*key, day),
+            )
+            cur.execute(
+                "DELETE FROM track_heatmap_totals WHERE track_id = ? AND kind = ? AND bin = ? AND count <= 0",
+                key,
+            )
+
+
+def add_session_to_heatmap(conn: sqlite3.Connection, session_id: int) -> None:
+    """Count a session's stored events and resets in its track's heatmap. Does not commit."""
+    for (track_id, day), counts in _session_counts(conn, "s.id = ?", (session_id,)).items():
+        _adjust(conn, track_id, day, counts, 1)
+
+
+def remove_session_from_heatmap(conn: sqlite3.Connection, session_id: int) -> None:
+    """Undo `add_session_to_heatmap`; call before the session's rows change. Does not commit."""
+    for (track_id, day), counts in _session_counts(conn, "s.id = ?", (session_id,)).items():
+        _adjust(conn, track_id, day, counts, -1)
+
+
+def rebuild_heatmap(conn: sqlite3.Connection, track_ids: Optional[Iterable[str]] = None) -> None:
+    """Recount `track_ids` (default: every track) from stored rows. Does not commit."""
+    cur = conn.cursor()
+    if track_ids is None:
+        cur.execute("DELETE FROM track_heatmap")
+        cur.execute("DELETE FROM track_heatmap_totals")
+        by_day = _session_counts(conn, "1 = 1", ())
+    else:
+        by_day = {}
+        for track_id in track_ids:
+            cur.execute("DELETE FROM track_heatmap WHERE track_id = ?", (track_id,))
+            cur.execute("DELETE FROM track_heatmap_totals WHERE track_id = ?", (track_id,))
+            by_day.update(_session_counts(conn, "s.track_id = ?", (track_id,)))
+
+    rows = []
+    totals: Counter = Counter()
+    running: Counter = Counter()
+    for (track_id, day), counts in sorted(by_day.items()):
+        for (kind, bin_index), n in counts.items():
+            key = (track_id, kind, bin_index)
+            running[key] += n
+            totals[key] += n
+            rows.append((*key, day, n, running[key]))
+    cur.executemany("INSERT INTO track_heatmap VALUES (?, ?, ?, ?, ?, ?)", rows)
+    cur.executemany("INSERT INTO track_heatmap_totals VALUES (?, ?, ?, ?)", [(*key, n) for key, n in totals.items()])
+
+
+# ── Queries ─────────────────────────────────────────────────────────
+
+def heatmap_counts(
+    conn: sqlite3.Connection,
+    track_id: str,
+    kinds: Optional[Sequence[str]] = None,
+    start_day: Optional[str] = None,
+    end_day: Optional[str] = None,
+) -> Dict[int, int]:
+    """Counts per bin for `kinds` (default: all) between two days inclusive (default: all time)."""
+    kind_filter = f"AND t.kind IN ({', '.join('?' for _ in kinds)})" if kinds else ""
+    params: List = [track_id, *(kinds or ())]
+    if start_day is None and end_day is None:
+        sql = f"SELECT t.bin, t.count FROM track_heatmap_totals t WHERE t.track_id = ? {kind_filter}"
+    else:
+        # Running total at the end of the window minus the one just before it
+        cumulative_at = """
+            COALESCE((
+                SELECT h.cumulative FROM track_heatmap h
+                WHERE h.track_id = t.track_id AND h.kind = t.kind AND h.bin = t.bin AND h.day {op} ?
+                ORDER BY h.day DESC LIMIT 1
+            ), 0)
+        """
+        upper = cumulative_at.format(op="<=") if end_day is not None else "t.count"
+        lower = cumulative_at.format(op="<") if start_day is not None else "0"
+        sql = f"SELECT t.bin, {upper} - {lower} FROM track_heatmap_totals t WHERE t.track_id = ? {kind_filter}"
+        params = [*([end_day] if end_day is not None else []), *([start_day] if start_day is not None else []), *params]
+    counts: Counter = Counter()
+    for bin_index, n in conn.execute(sql, params):
+        if n:
+            counts[bin_index] += n
+    return dict(counts)
+
+
+def heatmap_hotspots(
+    conn: sqlite3.Connection,
+    track_id: str,
+    kinds: Optional[Sequence[str]] = None,
+    start_day: Optional[str] = None,
+    end_day: Optional[str] = None,
+    bucket_size: float = 0.05,
+) -> List[Tuple[float, float, int]]:
+    """Cross-session hotspots as `(start, end, count)`, busiest first (like `hotspot_buckets`).
+
+    `bucket_size` is rounded to a whole number of heatmap bins.
+    """
+    per_bucket = max(1, round(bucket_size * HEATMAP_BINS))
+    buckets: Counter = Counter()
+    for bin_index, n in heatmap_counts(conn, track_id, kinds, start_day, end_day).items():
+        buckets[bin_index // per_bucket] += n
+    results = [
+        (round(b * per_bucket / HEATMAP_BINS, 4), round((b + 1) * per_bucket / HEATMAP_BINS, 4), n)
+        for b, n in buckets.items()
+    ]
+    results.sort(key=lambda item: item[2], reverse=True)
+    return results
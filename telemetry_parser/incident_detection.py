@@ -4,6 +4,13 @@ from dataclasses import dataclass
 from statistics import median
 from typing import Dict, List, Optional, Sequence, Tuple
 
+from .channel_plan import Stage
+
+EVENT_STAGE = Stage(
+    "detect_events",
+    ("SessionTime", "Lap", "LapDistPct", "Speed", "YawRate", "SteeringWheelAngle", "IsOnTrack"),
+)
+
 
 @dataclass(frozen=True)
 class IncidentEvent:
@@ -133,6 +140,14 @@ def serious_event_counts_by_lap(events: Sequence[IncidentEvent]) -> Dict[int, in
     return counts
 
 
+def event_position(event: IncidentEvent, lap_dist_pct: Sequence[float]) -> Optional[float]:
+    """LapDistPct at the event's sample, or None if it is out of range or invalid."""
+    if event.index < 0 or event.index >= len(lap_dist_pct):
+        return None
+    pct = float(lap_dist_pct[event.index])
+    return pct if pct >= 0 else None
+
+
 def hotspot_buckets(
     events: Sequence[IncidentEvent],
     lap_dist_pct: Sequence[float],
@@ -140,10 +155,8 @@ def hotspot_buckets(
 ) -> List[Tuple[float, float, int]]:
     buckets: Dict[float, int] = {}
     for event in events:
-        if event.index < 0 or event.index >= len(lap_dist_pct):
-            continue
-        pct = float(lap_dist_pct[event.index])
-        if pct < 0:
+        pct = event_position(event, lap_dist_pct)
+        if pct is None:
             continue
         bucket_start = (pct // bucket_size) * bucket_size
         bucket_start = round(bucket_start, 4)
@@ -1,69 +1,80 @@
 from __future__ import annotations
 
 import argparse
+import os
 import re
+import sqlite3
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
-
-from .db import connect, get_lap_id_map, init_db, insert_sector_times, insert_session
-from .ibt import IBTReader
-from .incident_detection import detect_events
+from typing import Container, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .archive import TelemetryReader, open_telemetry
+from .channel_plan import ChannelColumns, ChannelPlan, plan_channels, required_channels
+from .corners import (
+    CORNER_METRICS_STAGE,
+    CORNER_PROFILE_STAGE,
+    SessionCorners,
+    compute_corner_metrics,
+    load_corner_index,
+    remeasure_track_corners,
+    resolve_corner_index,
+    session_speed_profile,
+)
+from .db import connect, init_db, insert_ingest_run, insert_session
+from .instrumentation import (
+    PROFILE_DIR_ENV,
+    PROFILE_ENV,
+    PROMETHEUS_ENV,
+    IngestProfiler,
+    profiling_enabled,
+    write_prometheus_textfile,
+)
+from .features import FEATURE_STAGE, LapFeatures, compute_lap_features
+from .fingerprints import FINGERPRINT_STAGE, compute_fingerprints
+from .incident_detection import EVENT_STAGE, IncidentEvent, detect_events, serious_event_counts_by_lap
 from .metrics import (
+    BEST_LAP_STAGE,
+    INCIDENT_STAGE,
+    CleanMetrics,
+    LapMetrics,
     compute_clean_metrics,
     compute_lap_metrics,
     incident_counts,
     override_best_lap,
 )
 from .reporting import write_publishable_summary, write_session_report
-from .segments import detect_reset_events, segment_laps
-from .track_config import get_max_valid_lap_time, get_min_valid_lap_time
-
-_ALL_CHANNELS = list(dict.fromkeys([
-    "SessionTime",
-    "Lap",
-    "LapDistPct",
-    "LapLastLapTime",
-    "LapCompleted",
-    "PlayerIncidents",
-    "LapBestLapTime",
-    "Speed",
-    "YawRate",
-    "SteeringWheelAngle",
-    "IsOnTrack",
-]))
-
-REQUIRED_CHANNELS = [
-    "SessionTime",
-    "Lap",
-    "LapDistPct",
-    "LapLastLapTime",
-    "LapCompleted",
-    "PlayerIncidents",
-    "LapBestLapTime",
-]
-
-EVENT_CHANNELS = [
-    "SessionTime",
-    "Lap",
-    "LapDistPct",
-    "Speed",
-    "YawRate",
-    "SteeringWheelAngle",
-    "IsOnTrack",
-]
+from .sectors import MICROSECTOR_STAGE, SECTOR_STAGE, compute_microsector_times, compute_sector_times
+from .segments import RESET_STAGE, SEGMENT_STAGE, LapSegment, ResetEvent, detect_reset_events, segment_laps
+from .track_config import get_max_valid_lap_time, get_min_valid_lap_time, load_track_config
+
+# Stages every ingest runs; a file without their channels is rejected
+CORE_STAGES = (SEGMENT_STAGE, RESET_STAGE, INCIDENT_STAGE, BEST_LAP_STAGE, MICROSECTOR_STAGE)
+# Stages run when enabled and the file has their required channels
+OPTIONAL_STAGES = (
+    EVENT_STAGE,
+    SECTOR_STAGE,
+    FEATURE_STAGE,
+    FINGERPRINT_STAGE,
+    CORNER_PROFILE_STAGE,
+    CORNER_METRICS_STAGE,
+)
+
+REQUIRED_CHANNELS = required_channels(CORE_STAGES)
+EVENT_CHANNELS = list(EVENT_STAGE.required)
 
 _FILENAME_RE = re.compile(
-    r"superformulalights324_(?P<track>.+?) \d{4}-\d{2}-\d{2}",
+    r"(?:superformulalights324|porsche9922cup)_(?P<track>.+?) \d{4}-\d{2}-\d{2}",
     re.IGNORECASE,
 )
 
 
-def _read_channels(reader: IBTReader, names: List[str]) -> Dict[str, List[object]]:
-    data = {name: [] for name in names}
-    for record in reader.iter_records(names):
-        for name in names:
-            data[name].append(record[name])
-    return data
+def ingest_plan(available: Container[str], skip_stages: Iterable[str] = ()) -> ChannelPlan:
+    """Channels to decode for the core stages plus the optional ones not in `skip_stages`."""
+    skip = set(skip_stages)
+    unknown = skip - {stage.name for stage in OPTIONAL_STAGES}
+    if unknown:
+        raise ValueError(f"Unknown optional stages: {', '.join(sorted(unknown))}")
+    return plan_channels(available, CORE_STAGES, [stage for stage in OPTIONAL_STAGES if stage.name not in skip])
 
 
 def _extract_track_id(file_path: str, session_info: Optional[str] = None) -> Optional[str]:
@@ -99,57 +110,158 @@ def _extract_metadata(session_info: Optional[str]) -> Tuple[Optional[str], Optio
     return track_name, car_name
 
 
-def ingest_file(file_path: str, db_path: str, report_dir: str, summary_dir: str) -> int:
-    reader = IBTReader(file_path).read()
-    missing = [name for name in REQUIRED_CHANNELS if name not in reader.var_by_name]
-    if missing:
-        raise ValueError(f"Missing required channels: {', '.join(missing)}")
+def ingest_file(
+    file_path: str,
+    db_path: str,
+    report_dir: str,
+    summary_dir: str,
+    profile: Optional[bool] = None,
+    profile_dir: Optional[str] = None,
+    prometheus_path: Optional[str] = None,
+    replace: bool = False,
+    skip_stages: Iterable[str] = (),
+) -> int:
+    """Ingest one `.ibt` file and return its session ID.
+
+    With `replace=True` a file that was already ingested keeps its session ID
+    and all of its derived rows are swapped in a single transaction.
+    `skip_stages` names optional stages (`OPTIONAL_STAGES`) to leave out; their
+    channels are not decoded and nothing is stored for them.
+    """
+    profiler = IngestProfiler(
+        enabled=profiling_enabled(profile),
+        profile_dir=profile_dir or os.environ.get(PROFILE_DIR_ENV),
+    ).start()
+    try:
+        session_id = _ingest(file_path, db_path, report_dir, summary_dir, profiler, replace, skip_stages)
+    finally:
+        profiler.stop(dump_name=Path(file_path).stem)
+
+    if profiler.enabled:
+        stages = profiler.stages + [profiler.total()]
+        conn = connect(db_path)
+        init_db(conn)
+        insert_ingest_run(conn, session_id, file_path, profiler.started_at, stages)
+        conn.close()
+        prometheus_path = prometheus_path or os.environ.get(PROMETHEUS_ENV)
+        if prometheus_path:
+            write_prometheus_textfile(prometheus_path, file_path, stages)
 
-    # Read all available channels in a single pass
-    available = [ch for ch in _ALL_CHANNELS if ch in reader.var_by_name]
-    channels = _read_channels(reader, available)
+    return session_id
 
-    segments = segment_laps(
-        session_time=channels["SessionTime"],
-        lap=channels["Lap"],
-        lap_dist_pct=channels["LapDistPct"],
-        lap_last_lap_time=channels["LapLastLapTime"],
-        lap_completed=channels["LapCompleted"],
-    )
-    reset_events = detect_reset_events(
-        lap=channels["Lap"],
-        lap_dist_pct=channels["LapDistPct"],
-        session_time=channels["SessionTime"],
-    )
+
+@dataclass
+class SessionAnalysis:
+    """Everything ingest derives from one file, ready for `insert_session` and the reports."""
+
+    track_id: Optional[str]
+    track_name: Optional[str]
+    car_name: Optional[str]
+    min_valid_lap_time: float
+    max_valid_lap_time: float
+    segments: List[LapSegment]
+    reset_events: List[ResetEvent]
+    metrics: LapMetrics
+    incidents_by_lap: Dict[int, int]
+    clean_metrics: CleanMetrics
+    classified_session_type: Optional[str] = None
+    events: Optional[List[IncidentEvent]] = None
+    event_lap_dist_pct: Optional[Sequence[float]] = None
+    sector_data: Optional[List[Dict]] = None
+    microsector_data: Optional[Dict[int, List[float]]] = None
+    lap_features: Optional[Dict[int, LapFeatures]] = None
+    lap_fingerprints: Optional[Dict[int, Sequence[float]]] = None
+    corner_data: Optional[SessionCorners] = None
+
+    def insert_kwargs(self) -> Dict[str, object]:
+        """Keyword arguments for `insert_session`, apart from the file and its disk header."""
+        return {
+            "metrics": self.metrics,
+            "segments": self.segments,
+            "incidents_by_lap": self.incidents_by_lap,
+            "events": self.events,
+            "reset_events": self.reset_events,
+            "track_name": self.track_name,
+            "car_name": self.car_name,
+            "clean_metrics": self.clean_metrics,
+            "classified_session_type": self.classified_session_type,
+            "min_valid_lap_time": self.min_valid_lap_time,
+            "max_valid_lap_time": self.max_valid_lap_time,
+            "track_id": self.track_id,
+            "sector_data": self.sector_data,
+            "microsector_data": self.microsector_data,
+            "event_lap_dist_pct": self.event_lap_dist_pct,
+            "lap_features": self.lap_features,
+            "corner_data": self.corner_data,
+            "lap_fingerprints": self.lap_fingerprints,
+        }
+
+
+def analyze_session(
+    file_path: str,
+    reader: TelemetryReader,
+    plan: ChannelPlan,
+    channels: ChannelColumns,
+    conn: sqlite3.Connection,
+    profiler: Optional[IngestProfiler] = None,
+    tracks_dir: str = "tracks",
+) -> SessionAnalysis:
+    """Run every stage in `plan` over the decoded `channels` of one file.
+
+    `conn` supplies the track's cached corner index (and caches one derived
+    from this session's laps). Stages are timed on `profiler` when given.
+    """
+    profiler = profiler or IngestProfiler()
+    record_count = len(channels["SessionTime"])
+
+    with profiler.stage("segment_laps") as stage:
+        stage.records = record_count
+        segments = segment_laps(
+            session_time=channels["SessionTime"],
+            lap=channels["Lap"],
+            lap_dist_pct=channels["LapDistPct"],
+            lap_last_lap_time=channels["LapLastLapTime"],
+            lap_completed=channels["LapCompleted"],
+        )
+    with profiler.stage("detect_reset_events") as stage:
+        stage.records = record_count
+        reset_events = detect_reset_events(
+            lap=channels["Lap"],
+            lap_dist_pct=channels["LapDistPct"],
+            session_time=channels["SessionTime"],
+        )
 
     # Determine track and valid lap time range
     track_id = _extract_track_id(file_path, reader.session_info)
     min_valid_lap_time = get_min_valid_lap_time(track_id)
     max_valid_lap_time = get_max_valid_lap_time(track_id)
 
-    metrics = compute_lap_metrics(segments, min_valid_lap_time=min_valid_lap_time, max_valid_lap_time=max_valid_lap_time)
+    with profiler.stage("lap_metrics") as stage:
+        stage.records = record_count
+        metrics = compute_lap_metrics(segments, min_valid_lap_time=min_valid_lap_time, max_valid_lap_time=max_valid_lap_time)
 
-    if "LapBestLapTime" in channels:
-        best_candidates = [v for v in channels["LapBestLapTime"] if v and v > 0]
-        if best_candidates:
-            metrics = override_best_lap(metrics, min(best_candidates))
-    incidents_by_lap = incident_counts(channels["PlayerIncidents"], segments)
+        if plan.runs(BEST_LAP_STAGE):
+            best_candidates = [v for v in channels["LapBestLapTime"] if v and v > 0]
+            if best_candidates:
+                metrics = override_best_lap(metrics, min(best_candidates))
+        incidents_by_lap = incident_counts(channels["PlayerIncidents"], segments)
 
     events = None
     event_lap_dist_pct = None
     events_by_lap: Dict[int, int] = {}
-    if all(name in channels for name in EVENT_CHANNELS):
-        events = detect_events(
-            session_time=channels["SessionTime"],
-            lap=channels["Lap"],
-            speed=channels["Speed"],
-            yaw_rate=channels["YawRate"],
-            steering_angle=channels["SteeringWheelAngle"],
-            is_on_track=channels["IsOnTrack"],
-        )
-        event_lap_dist_pct = channels["LapDistPct"]
-        from .incident_detection import serious_event_counts_by_lap
-        events_by_lap = serious_event_counts_by_lap(events)
+    if plan.runs(EVENT_STAGE):
+        with profiler.stage("detect_events") as stage:
+            stage.records = record_count
+            events = detect_events(
+                session_time=channels["SessionTime"],
+                lap=channels["Lap"],
+                speed=channels["Speed"],
+                yaw_rate=channels["YawRate"],
+                steering_angle=channels["SteeringWheelAngle"],
+                is_on_track=channels["IsOnTrack"],
+            )
+            event_lap_dist_pct = channels["LapDistPct"]
+            events_by_lap = serious_event_counts_by_lap(events)
 
     # Clean metrics consider incidents + serious events (telemetry-based filtering)
     # big_save is informational only — not used for clean determination
@@ -174,71 +286,167 @@ def ingest_file(file_path: str, db_path: str, report_dir: str, summary_dir: str)
     except ImportError:
         pass
 
-    Path(db_path).parent.mkdir(parents=True, exist_ok=True)
-    conn = connect(db_path)
-    init_db(conn)
-    session_id = insert_session(
-        conn,
-        file_path=file_path,
-        disk_header=reader.disk_header,
-        metrics=metrics,
-        segments=segments,
-        incidents_by_lap=incidents_by_lap,
-        events=events,
-        reset_events=reset_events,
-        track_name=track_name,
-        car_name=car_name,
-        clean_metrics=clean_metrics,
-        classified_session_type=classified_session_type,
-        min_valid_lap_time=min_valid_lap_time,
-        max_valid_lap_time=max_valid_lap_time,
-    )
-
     # Sector timing
-    try:
-        from .sectors import compute_sector_times
-        from .track_config import load_track_config
-
-        track_config = load_track_config(track_id)
-        if track_config and track_config.zones:
+    sector_data = None
+    track_config = load_track_config(track_id, tracks_dir)
+    if plan.runs(SECTOR_STAGE) and track_config and track_config.zones:
+        with profiler.stage("sector_times") as stage:
+            stage.records = record_count
             sector_data = compute_sector_times(
                 session_time=channels["SessionTime"],
                 lap_dist_pct=channels["LapDistPct"],
                 segments=segments,
                 zones=track_config.zones,
             )
-            if sector_data:
-                lap_id_map = get_lap_id_map(conn, session_id)
-                insert_sector_times(conn, session_id, sector_data, lap_id_map)
-    except ImportError:
-        pass
 
-    conn.close()
+    # Microsector splits feed the personal-best index
+    with profiler.stage("microsector_times") as stage:
+        stage.records = record_count
+        microsector_data = compute_microsector_times(
+            session_time=channels["SessionTime"],
+            lap_dist_pct=channels["LapDistPct"],
+            segments=segments,
+        )
 
-    report_path = Path(report_dir) / f"session_{session_id}.md"
-    write_session_report(
-        output_path=str(report_path),
-        file_path=file_path,
-        metrics=metrics,
-        segments=segments,
-        incidents_by_lap=incidents_by_lap,
-        session_info=reader.session_info,
-        events=events,
-        lap_dist_pct=event_lap_dist_pct,
-    )
+    lap_features = None
+    if plan.runs(FEATURE_STAGE):
+        with profiler.stage("lap_features") as stage:
+            stage.records = record_count
+            lap_features = compute_lap_features(
+                session_time=channels["SessionTime"],
+                channels=channels.view(FEATURE_STAGE),
+                segments=segments,
+            )
 
-    summary_path = Path(summary_dir) / f"session_{session_id}.md"
-    write_publishable_summary(
-        output_path=str(summary_path),
-        file_path=file_path,
-        metrics=metrics,
+    profile_laps, speed_profile = 0, None
+    lap_fingerprints = None
+    if plan.runs(FINGERPRINT_STAGE):
+        with profiler.stage("lap_fingerprints") as stage:
+            stage.records = record_count
+            lap_fingerprints = compute_fingerprints(
+                session_time=channels["SessionTime"],
+                lap_dist_pct=channels["LapDistPct"],
+                speed=channels["Speed"],
+                segments=segments,
+            )
+    if plan.runs(CORNER_PROFILE_STAGE):
+        with profiler.stage("corner_profile") as stage:
+            stage.records = record_count
+            profile_laps, speed_profile = session_speed_profile(
+                session_time=channels["SessionTime"],
+                lap_dist_pct=channels["LapDistPct"],
+                speed=channels["Speed"],
+                segments=segments,
+                min_valid_lap_time=min_valid_lap_time,
+                max_valid_lap_time=max_valid_lap_time,
+            )
+
+    # Corners come from the track's cached index, or one derived with this session's laps
+    corner_data = None
+    if plan.runs(CORNER_METRICS_STAGE):
+        with profiler.stage("corner_metrics") as stage:
+            stage.records = record_count
+            corners = resolve_corner_index(conn, track_id, profile_laps, speed_profile)
+            corner_data = SessionCorners(
+                laps=profile_laps,
+                profile=speed_profile,
+                corners=corners,
+                metrics=compute_corner_metrics(
+                    session_time=channels["SessionTime"],
+                    lap_dist_pct=channels["LapDistPct"],
+                    channels=channels.view(CORNER_METRICS_STAGE),
+                    segments=segments,
+                    corners=corners or [],
+                ),
+            )
+
+    return SessionAnalysis(
+        track_id=track_id,
+        track_name=track_name,
+        car_name=car_name,
+        min_valid_lap_time=min_valid_lap_time,
+        max_valid_lap_time=max_valid_lap_time,
         segments=segments,
+        reset_events=reset_events,
+        metrics=metrics,
         incidents_by_lap=incidents_by_lap,
-        session_info=reader.session_info,
+        clean_metrics=clean_metrics,
+        classified_session_type=classified_session_type,
         events=events,
-        lap_dist_pct=event_lap_dist_pct,
+        event_lap_dist_pct=event_lap_dist_pct,
+        sector_data=sector_data,
+        microsector_data=microsector_data,
+        lap_features=lap_features,
+        lap_fingerprints=lap_fingerprints,
+        corner_data=corner_data,
     )
 
+
+def _ingest(
+    file_path: str,
+    db_path: str,
+    report_dir: str,
+    summary_dir: str,
+    profiler: IngestProfiler,
+    replace: bool = False,
+    skip_stages: Iterable[str] = (),
+) -> int:
+    with profiler.stage("read") as stage:
+        reader = open_telemetry(file_path)
+        # Every channel the planned stages need, decoded in a single pass
+        plan = ingest_plan(reader.var_by_name, skip_stages)
+        channels = plan.read(reader)
+        stage.records = len(channels["SessionTime"])
+        stage.bytes_read = reader.bytes_read
+
+    Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+    conn = connect(db_path)
+    init_db(conn)
+    analysis = analyze_session(file_path, reader, plan, channels, conn, profiler)
+    previous_corners = load_corner_index(conn, analysis.track_id)
+
+    with profiler.stage("db_insert") as stage:
+        stage.records = len(analysis.segments)
+        session_id = insert_session(
+            conn,
+            file_path=file_path,
+            disk_header=reader.disk_header,
+            replace=replace,
+            **analysis.insert_kwargs(),
+        )
+
+    # This session derived or refreshed the track's corner index: measure its other sessions against it
+    if load_corner_index(conn, analysis.track_id) != previous_corners:
+        with profiler.stage("corner_remeasure") as stage:
+            stage.records = remeasure_track_corners(conn, analysis.track_id)
+    conn.close()
+
+    with profiler.stage("reports") as stage:
+        stage.records = len(analysis.segments)
+        report_path = Path(report_dir) / f"session_{session_id}.md"
+        write_session_report(
+            output_path=str(report_path),
+            file_path=file_path,
+            metrics=analysis.metrics,
+            segments=analysis.segments,
+            incidents_by_lap=analysis.incidents_by_lap,
+            session_info=reader.session_info,
+            events=analysis.events,
+            lap_dist_pct=analysis.event_lap_dist_pct,
+        )
+
+        summary_path = Path(summary_dir) / f"session_{session_id}.md"
+        write_publishable_summary(
+            output_path=str(summary_path),
+            file_path=file_path,
+            metrics=analysis.metrics,
+            segments=analysis.segments,
+            incidents_by_lap=analysis.incidents_by_lap,
+            session_info=reader.session_info,
+            events=analysis.events,
+            lap_dist_pct=analysis.event_lap_dist_pct,
+        )
+
     return session_id
 
 
@@ -248,9 +456,27 @@ def main() -> None:
     parser.add_argument("--db", default="data/telemetry.db", help="SQLite database path")
     parser.add_argument("--reports", default="reports", help="Reports output directory")
     parser.add_argument("--summaries", default="summaries", help="Publishable summaries output directory")
+    parser.add_argument("--profile", action="store_true", default=None,
+                        help=f"Record per-stage timing/memory to ingest_runs (or set {PROFILE_ENV}=1)")
+    parser.add_argument("--profile-dir", help="Also dump a cProfile file per ingest into this folder")
+    parser.add_argument("--prometheus-textfile", help="Write stage metrics to this Prometheus textfile")
+    parser.add_argument("--replace", action="store_true",
+                        help="Re-ingest in place if the file was already ingested (keeps the session ID)")
+    parser.add_argument("--skip-stage", action="append", default=[], choices=[stage.name for stage in OPTIONAL_STAGES],
+                        help="Leave out an optional analysis stage and skip decoding its channels (repeatable)")
     args = parser.parse_args()
 
-    session_id = ingest_file(args.ibt_path, args.db, args.reports, args.summaries)
+    session_id = ingest_file(
+        args.ibt_path,
+        args.db,
+        args.reports,
+        args.summaries,
+        profile=args.profile,
+        profile_dir=args.profile_dir,
+        prometheus_path=args.prometheus_textfile,
+        replace=args.replace,
+        skip_stages=args.skip_stage,
+    )
     print(f"Ingested session {session_id}")
 
 
@@ -0,0 +1,146 @@
+"""Per-stage timing and memory instrumentation for the ingest pipeline.
+
+Disabled by default. Enable with `ingest_file(..., profile=True)`, the
+`--profile` CLI flag, or `TELEMETRY_PROFILE=1`. `TELEMETRY_PROFILE_DIR`
+additionally dumps a cProfile file per ingest, and
+`TELEMETRY_PROMETHEUS_TEXTFILE` writes the last run's numbers in the
+node_exporter textfile format.
+"""
+from __future__ import annotations
+
+import cProfile
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+PROFILE_ENV = "TELEMETRY_PROFILE"
+PROFILE_DIR_ENV = "TELEMETRY_PROFILE_DIR"
+PROMETHEUS_ENV = "TELEMETRY_PROMETHEUS_TEXTFILE"
+
+
+@dataclass
+class StageStats:
+    stage: str
+    wall_time: float = 0.0
+    cpu_time: float = 0.0
+    records: int = 0
+    bytes_read: int = 0
+    peak_memory: int = 0
+
+    @property
+    def records_per_sec(self) -> float:
+        if self.wall_time <= 0 or not self.records:
+            return 0.0
+        return self.records / self.wall_time
+
+
+def _env_flag(name: str) -> bool:
+    return os.environ.get(name, "").strip().lower() in ("1", "true", "yes", "on")
+
+
+def profiling_enabled(flag: Optional[bool] = None) -> bool:
+    if flag is not None:
+        return flag
+    return _env_flag(PROFILE_ENV)
+
+
+class IngestProfiler:
+    """Collects a `StageStats` per `stage()` block.
+
+    When disabled every call is a no-op, so the pipeline can be instrumented
+    unconditionally.
+    """
+
+    def __init__(self, enabled: bool = False, profile_dir: Optional[str] = None) -> None:
+        self.enabled = enabled
+        self.profile_dir = profile_dir if enabled else None
+        self.stages: List[StageStats] = []
+        self.started_at = time.time()
+        self._started_tracing = False
+        self._cprofile: Optional[cProfile.Profile] = None
+
+    def start(self) -> "IngestProfiler":
+        if not self.enabled:
+            return self
+        self.started_at = time.time()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        if self.profile_dir:
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+        return self
+
+    def stop(self, dump_name: Optional[str] = None) -> None:
+        if not self.enabled:
+            return
+        if self._cprofile is not None:
+            self._cprofile.disable()
+            out_dir = Path(self.profile_dir)
+            out_dir.mkdir(parents=True, exist_ok=True)
+            name = dump_name or f"ingest_{int(self.started_at)}"
+            self._cprofile.dump_stats(str(out_dir / f"{name}.prof"))
+            self._cprofile = None
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[StageStats]:
+        stats = StageStats(stage=name)
+        if not self.enabled:
+            yield stats
+            return
+        tracemalloc.reset_peak()
+        base_mem = tracemalloc.get_traced_memory()[0]
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield stats
+        finally:
+            stats.wall_time = time.perf_counter() - wall_start
+            stats.cpu_time = time.process_time() - cpu_start
+            stats.peak_memory = max(0, tracemalloc.get_traced_memory()[1] - base_mem)
+            self.stages.append(stats)
+
+    def total(self) -> StageStats:
+        total = StageStats(stage="total")
+        for stats in self.stages:
+            total.wall_time += stats.wall_time
+            total.cpu_time += stats.cpu_time
+            total.bytes_read += stats.bytes_read
+            total.records = max(total.records, stats.records)
+            total.peak_memory = max(total.peak_memory, stats.peak_memory)
+        return total
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def write_prometheus_textfile(path: str, file_path: str, stages: List[StageStats]) -> None:
+    """Write stage gauges for the node_exporter textfile collector (atomic rename)."""
+    metrics = [
+        ("telemetry_ingest_stage_wall_seconds", "Wall time per ingest stage", "wall_time"),
+        ("telemetry_ingest_stage_cpu_seconds", "CPU time per ingest stage", "cpu_time"),
+        ("telemetry_ingest_stage_records_per_second", "Records processed per second", "records_per_sec"),
+        ("telemetry_ingest_stage_bytes_read", "Bytes read from disk per stage", "bytes_read"),
+        ("telemetry_ingest_stage_peak_memory_bytes", "Peak traced allocation per stage", "peak_memory"),
+    ]
+    source = _escape_label(Path(file_path).name)
+    lines: List[str] = []
+    for metric, help_text, attr in metrics:
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} gauge")
+        for stats in stages:
+            value = getattr(stats, attr)
+            lines.append(f'{metric}{{stage="{_escape_label(stats.stage)}",file="{source}"}} {value}')
+    output = Path(path)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    tmp = output.with_name(output.name + ".tmp")
+    tmp.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    os.replace(tmp, output)
@@ -0,0 +1,198 @@
+"""Resumable, parallel per-session backfill jobs.
+
+A backfill is a `BackfillJob`: which sessions to visit, a `process` step that
+runs in a worker process (typically re-reading the `.ibt`), and an `apply`
+step that writes the result from the main process. Progress is checkpointed
+per session in the `backfill_jobs` table, so an interrupted run picks up
+where it stopped, and a failing session is recorded without stopping the
+others.
+
+`process` must be picklable (a module-level function or a
+`functools.partial` of one).
+"""
+from __future__ import annotations
+
+import sqlite3
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+STATUS_PENDING = "pending"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+SessionRow = Tuple[int, str]
+
+
+@dataclass(frozen=True)
+class BackfillJob:
+    name: str
+    select_sessions: Callable[[sqlite3.Connection], Sequence[SessionRow]]
+    process: Callable[[int, str], object]
+    apply: Callable[[sqlite3.Connection, int, object], None]
+
+
+@dataclass
+class JobSummary:
+    total: int = 0
+    skipped: int = 0
+    done: int = 0
+    failed: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def rate(self) -> float:
+        return (self.done + self.failed) / self.elapsed if self.elapsed > 0 else 0.0
+
+
+def init_jobs_table(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS backfill_jobs (
+            job_name TEXT NOT NULL,
+            session_id INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            attempts INTEGER DEFAULT 0,
+            error TEXT,
+            updated_at REAL,
+            PRIMARY KEY (job_name, session_id)
+        );
+        """
+    )
+    conn.commit()
+
+
+def reset_job(conn: sqlite3.Connection, job_name: str) -> None:
+    """Forget all checkpoints for a job so the next run starts over."""
+    init_jobs_table(conn)
+    conn.execute("DELETE FROM backfill_jobs WHERE job_name = ?", (job_name,))
+    conn.commit()
+
+
+def _mark(conn: sqlite3.Connection, job_name: str, session_id: int, status: str, error: Optional[str] = None) -> None:
+    conn.execute(
+        """
+        UPDATE backfill_jobs
+        SET status = ?, error = ?, attempts = attempts + 1, updated_at = ?
+        WHERE job_name = ? AND session_id = ?
+        """,
+        (status, error, time.time(), job_name, session_id),
+    )
+
+
+def _pending(conn: sqlite3.Connection, job: BackfillJob, retry_failed: bool) -> Tuple[List[SessionRow], int]:
+    rows = list(job.select_sessions(conn))
+    conn.executemany(
+        "INSERT OR IGNORE INTO backfill_jobs (job_name, session_id, status) VALUES (?, ?, ?)",
+        [(job.name, session_id, STATUS_PENDING) for session_id, _ in rows],
+    )
+    conn.commit()
+    cur = conn.execute("SELECT session_id, status FROM backfill_jobs WHERE job_name = ?", (job.name,))
+    status: Dict[int, str] = {int(sid): st for sid, st in cur.fetchall()}
+    todo = []
+    for session_id, file_path in rows:
+        st = status.get(int(session_id), STATUS_PENDING)
+        if st == STATUS_DONE or (st == STATUS_FAILED and not retry_failed):
+            continue
+        todo.append((int(session_id), file_path))
+    return todo, len(rows) - len(todo)
+
+
+def _describe(exc: BaseException) -> str:
+    return f"{type(exc).__name__}: {exc}"
+
+
+def run_job(
+    conn: sqlite3.Connection,
+    job: BackfillJob,
+    workers: int = 0,
+    retry_failed: bool = False,
+    progress_every: int = 10,
+    limit: Optional[int] = None,
+    clear_on_success: bool = True,
+) -> JobSummary:
+    """Run `job` over its sessions, skipping ones already checkpointed as done.
+
+    `workers=0` runs `process` inline (useful for debugging); otherwise a
+    process pool of that size is used. `apply` always runs in this process,
+    and each session's result is committed together with its checkpoint.
+    With `clear_on_success`, a run that covers every session without a
+    failure drops its checkpoints so the next invocation starts fresh.
+    """
+    init_jobs_table(conn)
+    todo, skipped = _pending(conn, job, retry_failed)
+    if limit is not None:
+        todo = todo[:limit]
+    summary = JobSummary(total=len(todo), skipped=skipped)
+    started = time.perf_counter()
+
+    def finish(session_id: int, result: object = None, error: Optional[BaseException] = None) -> None:
+        if error is None:
+            try:
+                job.apply(conn, session_id, result)
+            except Exception as exc:
+                conn.rollback()
+                error = exc
+        if error is None:
+            _mark(conn, job.name, session_id, STATUS_DONE)
+            summary.done += 1
+        else:
+            _mark(conn, job.name, session_id, STATUS_FAILED, _describe(error))
+            summary.failed += 1
+            print(f"  [{job.name}] session {session_id} failed: {_describe(error)}")
+        conn.commit()
+
+        completed = summary.done + summary.failed
+        summary.elapsed = time.perf_counter() - started
+        if progress_every and (completed % progress_every == 0 or completed == summary.total):
+            remaining = summary.total - completed
+            eta = remaining / summary.rate if summary.rate > 0 else 0.0
+            print(
+                f"  [{job.name}] {completed}/{summary.total} "
+                f"({summary.failed} failed) {summary.rate:.2f} sessions/s, ETA {eta:.0f}s"
+            )
+
+    if workers <= 0:
+        for session_id, file_path in todo:
+            try:
+                result = job.process(session_id, file_path)
+            except Exception as exc:
+                finish(session_id, error=exc)
+                continue
+            finish(session_id, result)
+    else:
+        queue = list(reversed(todo))
+        in_flight: Dict[Future, int] = {}
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            while queue or in_flight:
+                # Keep a bounded number of sessions in flight so results don't pile up
+                while queue and len(in_flight) < workers * 2:
+                    session_id, file_path = queue.pop()
+                    in_flight[pool.submit(job.process, session_id, file_path)] = session_id
+                completed, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+                for future in completed:
+                    session_id = in_flight.pop(future)
+                    exc = future.exception()
+                    if exc is not None:
+                        finish(session_id, error=exc)
+                    else:
+                        finish(session_id, future.result())
+
+    summary.elapsed = time.perf_counter() - started
+    if clear_on_success and limit is None and summary.failed == 0:
+        cur = conn.execute(
+            "SELECT COUNT(*) FROM backfill_jobs WHERE job_name = ? AND status != ?",
+            (job.name, STATUS_DONE),
+        )
+        if cur.fetchone()[0] == 0:
+            reset_job(conn, job.name)
+    return summary
+
+
+def print_summary(job: BackfillJob, summary: JobSummary) -> None:
+    print(
+        f"[{job.name}] {summary.done} done, {summary.failed} failed, "
+        f"{summary.skipped} already checkpointed, {summary.elapsed:.1f}s "
+        f"({summary.rate:.2f} sessions/s)"
+    )
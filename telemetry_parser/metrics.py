@@ -4,8 +4,12 @@ from dataclasses import dataclass
 from statistics import median, pstdev
 from typing import Dict, Iterable, List, Optional, Sequence
 
+from .channel_plan import Stage
 from .segments import LapSegment
 
+INCIDENT_STAGE = Stage("incident_counts", ("PlayerIncidents",))
+BEST_LAP_STAGE = Stage("best_lap", ("LapBestLapTime",))
+
 
 @dataclass(frozen=True)
 class LapMetrics:
@@ -0,0 +1,307 @@
+"""Per-track personal-best index.
+
+`personal_bests` holds the current best per track for each category:
+
+- `overall`: fastest complete, non-reset lap above the track's minimum time
+- `clean`: fastest clean lap (`laps.is_clean`)
+- `sector` / `microsector`: fastest time per sector name or microsector index, clean laps only
+- `theoretical`: sum of the sector (`name="sector"`) or microsector (`name="microsector"`) bests
+
+`personal_best_history` records every improvement, for progression charts.
+`insert_session` applies a new session's candidates inside its own
+transaction; `rebuild_personal_bests` replays a track from stored rows after
+clean flags change or sessions are replaced or deleted.
+"""
+from __future__ import annotations
+
+import sqlite3
+import struct
+from collections import defaultdict
+from dataclasses import dataclass
+from itertools import groupby
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+CATEGORY_OVERALL = "overall"
+CATEGORY_CLEAN = "clean"
+CATEGORY_SECTOR = "sector"
+CATEGORY_MICROSECTOR = "microsector"
+CATEGORY_THEORETICAL = "theoretical"
+
+_SPLIT_CATEGORIES = (CATEGORY_SECTOR, CATEGORY_MICROSECTOR)
+
+
+@dataclass(frozen=True)
+class PersonalBest:
+    category: str
+    name: str
+    value: float
+    session_id: Optional[int]
+    lap_id: Optional[int]
+    achieved_at: Optional[float]
+
+
+def init_personal_best_tables(conn: sqlite3.Connection) -> None:
+    cur = conn.cursor()
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS personal_bests (
+            track_id TEXT NOT NULL,
+            category TEXT NOT NULL,
+            name TEXT NOT NULL,
+            value REAL NOT NULL,
+            session_id INTEGER,
+            lap_id INTEGER,
+            achieved_at REAL,
+            PRIMARY KEY (track_id, category, name)
+        );
+        """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS personal_best_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            track_id TEXT NOT NULL,
+            category TEXT NOT NULL,
+            name TEXT NOT NULL,
+            value REAL NOT NULL,
+            previous_value REAL,
+            session_id INTEGER,
+            lap_id INTEGER,
+            achieved_at REAL
+        );
+        """
+    )
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_personal_best_history_track "
+        "ON personal_best_history(track_id, category, name)"
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS lap_microsectors (
+            lap_id INTEGER PRIMARY KEY,
+            session_id INTEGER NOT NULL,
+            data BLOB NOT NULL,
+            FOREIGN KEY(session_id) REFERENCES sessions(id),
+            FOREIGN KEY(lap_id) REFERENCES laps(id)
+        );
+        """
+    )
+
+
+def pack_times(times: Sequence[float]) -> bytes:
+    return struct.pack(f"<{len(times)}f", *times)
+
+
+def unpack_times(blob: bytes) -> Tuple[float, ...]:
+    return struct.unpack(f"<{len(blob) // 4}f", blob)
+
+
+# ── Candidates from stored rows ─────────────────────────────────────
+
+def _candidates(conn: sqlite3.Connection, where: str, params: Sequence) -> List[PersonalBest]:
+    """Every lap, sector and microsector time of the matching sessions, oldest first.
+
+    `where` filters `sessions s`.
+    """
+    cur = conn.cursor()
+    rows: List[Tuple[tuple, PersonalBest]] = []
+
+    # achieved_at: disk-header start (Unix time) plus the lap's end in session time
+    cur.execute(
+        f"""
+        SELECT l.id, l.session_id, l.lap_number, l.lap_time, l.is_clean,
+               CASE WHEN l.is_complete = 1 AND l.is_reset = 0
+                         AND l.lap_time >= COALESCE(s.min_valid_lap_time, 0) THEN 1 ELSE 0 END,
+               s.start_time, CASE WHEN s.start_time > 0 THEN s.start_time + l.end_time END
+        FROM laps l JOIN sessions s ON s.id = l.session_id
+        WHERE {where} AND l.lap_time > 0
+        """,
+        params,
+    )
+    for lap_id, sid, lap_number, lap_time, is_clean, overall, start, achieved_at in cur.fetchall():
+        key = (start or 0, sid, lap_number)
+        if overall:
+            rows.append((key, PersonalBest(CATEGORY_OVERALL, "", lap_time, sid, lap_id, achieved_at)))
+        if is_clean:
+            rows.append((key, PersonalBest(CATEGORY_CLEAN, "", lap_time, sid, lap_id, achieved_at)))
+
+    try:
+        cur.execute(
+            f"""
+            SELECT st.sector_name, st.sector_time, l.id, l.session_id, l.lap_number,
+                   s.start_time, CASE WHEN s.start_time > 0 THEN s.start_time + l.end_time END
+            FROM sector_times st
+            JOIN laps l ON l.id = st.lap_id
+            JOIN sessions s ON s.id = l.session_id
+            WHERE {where} AND l.is_clean = 1 AND st.sector_time > 0
+            """,
+            params,
+        )
+        for name, sector_time, lap_id, sid, lap_number, start, achieved_at in cur.fetchall():
+            rows.append((
+                (start or 0, sid, lap_number),
+                PersonalBest(CATEGORY_SECTOR, name, sector_time, sid, lap_id, achieved_at),
+            ))
+    except sqlite3.OperationalError:
+        pass  # sector_times not created in this database yet
+
+    cur.execute(
+        f"""
+        SELECT m.data, l.id, l.session_id, l.lap_number,
+               s.start_time, CASE WHEN s.start_time > 0 THEN s.start_time + l.end_time END
+        FROM lap_microsectors m
+        JOIN laps l ON l.id = m.lap_id
+        JOIN sessions s ON s.id = l.session_id
+        WHERE {where} AND l.is_clean = 1
+        """,
+        params,
+    )
+    for blob, lap_id, sid, lap_number, start, achieved_at in cur.fetchall():
+        for index, micro_time in enumerate(unpack_times(blob)):
+            rows.append((
+                (start or 0, sid, lap_number),
+                PersonalBest(CATEGORY_MICROSECTOR, str(index), round(micro_time, 4), sid, lap_id, achieved_at),
+            ))
+
+    rows.sort(key=lambda row: row[0])
+    return [pb for _, pb in rows]
+
+
+# ── Index maintenance ───────────────────────────────────────────────
+
+def current_personal_bests(conn: sqlite3.Connection, track_id: str) -> Dict[Tuple[str, str], PersonalBest]:
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT category, name, value, session_id, lap_id, achieved_at
+        FROM personal_bests WHERE track_id = ?
+        """,
+        (track_id,),
+    )
+    return {(row[0], row[1]): PersonalBest(*row) for row in cur.fetchall()}
+
+
+def personal_best_history(
+    conn: sqlite3.Connection, track_id: str, category: str, name: str = ""
+) -> List[PersonalBest]:
+    """Every improvement of one PB, oldest first."""
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT category, name, value, session_id, lap_id, achieved_at
+        FROM personal_best_history
+        WHERE track_id = ? AND category = ? AND name = ?
+        ORDER BY id
+        """,
+        (track_id, category, name),
+    )
+    return [PersonalBest(*row) for row in cur.fetchall()]
+
+
+def _record(
+    conn: sqlite3.Connection,
+    track_id: str,
+    pb: PersonalBest,
+    previous: Optional[PersonalBest],
+) -> None:
+    conn.execute(
+        """
+        INSERT OR REPLACE INTO personal_bests (track_id, category, name, value, session_id, lap_id, achieved_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        """,
+        (track_id, pb.category, pb.name, pb.value, pb.session_id, pb.lap_id, pb.achieved_at),
+    )
+    conn.execute(
+        """
+        INSERT INTO personal_best_history (
+            track_id, category, name, value, previous_value, session_id, lap_id, achieved_at
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        (
+            track_id, pb.category, pb.name, pb.value,
+            previous.value if previous else None,
+            pb.session_id, pb.lap_id, pb.achieved_at,
+        ),
+    )
+
+
+def _apply(conn: sqlite3.Connection, track_id: str, candidates: Iterable[PersonalBest]) -> int:
+    """Record the candidates that beat the current bests; candidates arrive grouped by lap."""
+    current = current_personal_bests(conn, track_id)
+    improved = 0
+    for _, lap_candidates in groupby(candidates, key=lambda pb: pb.lap_id):
+        splits: Dict[str, List[str]] = defaultdict(list)
+        splits_improved = set()
+        for pb in lap_candidates:
+            key = (pb.category, pb.name)
+            previous = current.get(key)
+            if pb.category in _SPLIT_CATEGORIES:
+                splits[pb.category].append(pb.name)
+            if previous is None or pb.value < previous.value:
+                _record(conn, track_id, pb, previous)
+                current[key] = pb
+                improved += 1
+                if pb.category in _SPLIT_CATEGORIES:
+                    splits_improved.add(pb.category)
+
+        # Theoretical best over this lap's split layout, each split at its best
+        for category in splits_improved:
+            theoretical_key = (CATEGORY_THEORETICAL, category)
+            previous = current.get(theoretical_key)
+            total = round(sum(current[(category, name)].value for name in splits[category]), 4)
+            if previous is None or total < previous.value:
+                theoretical = PersonalBest(CATEGORY_THEORETICAL, category, total, pb.session_id, None, pb.achieved_at)
+                _record(conn, track_id, theoretical, previous)
+                current[theoretical_key] = theoretical
+    return improved
+
+
+def update_personal_bests(conn: sqlite3.Connection, session_id: int) -> int:
+    """Fold one session's laps into its track's index. Does not commit.
+
+    Returns the number of new PBs (theoretical bests not counted).
+    """
+    cur = conn.cursor()
+    cur.execute("SELECT track_id FROM sessions WHERE id = ?", (session_id,))
+    row = cur.fetchone()
+    if row is None or not row[0]:
+        return 0
+    return _apply(conn, row[0], _candidates(conn, "s.id = ?", (session_id,)))
+
+
+def rebuild_personal_bests(conn: sqlite3.Connection, track_ids: Optional[Iterable[str]] = None) -> int:
+    """Recompute the index and history of `track_ids` (default: every track). Does not commit.
+
+    Sessions are replayed in start-time order, so the history reads as if
+    they had been ingested chronologically.
+    """
+    cur = conn.cursor()
+    if track_ids is None:
+        cur.execute("SELECT DISTINCT track_id FROM sessions WHERE track_id IS NOT NULL")
+        track_ids = [row[0] for row in cur.fetchall()]
+    improved = 0
+    for track_id in track_ids:
+        if not track_id:
+            continue
+        cur.execute("DELETE FROM personal_bests WHERE track_id = ?", (track_id,))
+        cur.execute("DELETE FROM personal_best_history WHERE track_id = ?", (track_id,))
+        improved += _apply(conn, track_id, _candidates(conn, "s.track_id = ?", (track_id,)))
+    return improved
+
+
+def tracks_referencing(conn: sqlite3.Connection, session_id: int) -> List[str]:
+    """Tracks whose current PBs or PB history point at `session_id` (to rebuild before it changes).
+
+    History counts too: a session that once set a PB but no longer holds
+    it still has rows in `personal_best_history` referencing its laps.
+    """
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT track_id FROM personal_bests WHERE session_id = ?
+        UNION
+        SELECT track_id FROM personal_best_history WHERE session_id = ?
+        """,
+        (session_id, session_id),
+    )
+    return [row[0] for row in cur.fetchall()]
@@ -0,0 +1,265 @@
+"""Multi-resolution min/max/mean pyramids of full-session channels.
+
+Level `f` summarises every `f` consecutive samples of a channel by their
+minimum, maximum and mean; factors double from `BASE_FACTOR` until a level
+has no more than `MIN_LEVEL_POINTS` buckets. Each level is stored as one
+zlib-compressed float32 blob in `channel_pyramids`, together with a
+`SessionTime` row holding the start time of each bucket. A zoomable view
+asks `get_pyramid_window` for a time span and pixel width and receives
+between one and two buckets per pixel, however long the span; spans too
+narrow for the finest stored level are served from the raw samples.
+
+Pyramids are built on demand from the session's `.ibt` (or ahead of time
+with `scripts/build_pyramids.py`) and dropped with the session's other rows.
+"""
+from __future__ import annotations
+
+import sqlite3
+import sys
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .archive import ArchiveReader, open_telemetry
+from .traces import TRACE_CHANNELS
+
+PYRAMID_CHANNELS = TRACE_CHANNELS
+BASE_FACTOR = 4
+MIN_LEVEL_POINTS = 256
+TIME_CHANNEL = "SessionTime"
+
+
+@dataclass
+class PyramidLevel:
+    """Buckets of `factor` samples: start time, min, max and mean of each."""
+
+    factor: int
+    times: array
+    mins: array
+    maxs: array
+    means: array
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def slice(self, lo: int, hi: int) -> "PyramidLevel":
+        return PyramidLevel(self.factor, self.times[lo:hi], self.mins[lo:hi], self.maxs[lo:hi], self.means[lo:hi])
+
+
+def init_pyramid_table(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS channel_pyramids (
+            session_id INTEGER NOT NULL,
+            channel TEXT NOT NULL,
+            factor INTEGER NOT NULL,
+            points INTEGER NOT NULL,
+            data BLOB NOT NULL,
+            PRIMARY KEY (session_id, channel, factor),
+            FOREIGN KEY(session_id) REFERENCES sessions(id)
+        );
+        """
+    )
+
+
+# ── Building ────────────────────────────────────────────────────────
+
+def _first_level(values: Sequence[float], factor: int) -> Tuple[array, array, array]:
+    mins, maxs, means = array("d"), array("d"), array("d")
+    for start in range(0, len(values), factor):
+        chunk = values[start:start + factor]
+        mins.append(min(chunk))
+        maxs.append(max(chunk))
+        means.append(sum(chunk) / len(chunk))
+    return mins, maxs, means
+
+
+def _halve(mins: array, maxs: array, means: array, factor: int, samples: int) -> Tuple[array, array, array]:
+    """Merge bucket pairs of a `factor` level into a `2 * factor` level."""
+    n = len(mins)
+    out_min, out_max, out_mean = array("d"), array("d"), array("d")
+    for i in range(0, n - 1, 2):
+        out_min.append(min(mins[i], mins[i + 1]))
+        out_max.append(max(maxs[i], maxs[i + 1]))
+        # Only the very last bucket can be short
+        second = min(factor, samples - (i + 1) * factor)
+        out_mean.append((means[i] * factor + means[i + 1] * second) / (factor + second))
+    if n % 2:
+        out_min.append(mins[-1])
+        out_max.append(maxs[-1])
+        out_mean.append(means[-1])
+    return out_min, out_max, out_mean
+
+
+def build_pyramid(
+    values: Sequence[float],
+    base_factor: int = BASE_FACTOR,
+    min_points: int = MIN_LEVEL_POINTS,
+) -> Dict[int, Tuple[array, array, array]]:
+    """`{factor: (mins, maxs, means)}` for factors `base_factor`, `2 * base_factor`, ..."""
+    if not values:
+        return {}
+    levels = {base_factor: _first_level(values, base_factor)}
+    factor = base_factor
+    while len(levels[factor][0]) > min_points:
+        levels[factor * 2] = _halve(*levels[factor], factor, len(values))
+        factor *= 2
+    return levels
+
+
+def compute_pyramids(
+    file_path: str,
+    channels: Sequence[str] = PYRAMID_CHANNELS,
+    base_factor: int = BASE_FACTOR,
+    min_points: int = MIN_LEVEL_POINTS,
+) -> Dict[str, Dict[int, Tuple[array, ...]]]:
+    """Pyramids of every requested channel the `.ibt` has, plus bucket start times under `TIME_CHANNEL`."""
+    reader = open_telemetry(file_path)
+    names = [name for name in channels if name in reader.var_by_name and name != TIME_CHANNEL]
+    columns = reader.read_columns([TIME_CHANNEL, *names])
+    session_time = columns.pop(TIME_CHANNEL)
+    pyramids: Dict[str, Dict[int, Tuple[array, ...]]] = {
+        name: build_pyramid(values, base_factor, min_points) for name, values in columns.items()
+    }
+    factors = next(iter(pyramids.values())).keys() if pyramids else ()
+    pyramids[TIME_CHANNEL] = {factor: (array("d", session_time[::factor]),) for factor in factors}
+    return pyramids
+
+
+def _encode(parts: Sequence[array], typecode: str) -> bytes:
+    data = array(typecode)
+    for part in parts:
+        data.fromlist(part.tolist())
+    if sys.byteorder != "little":
+        data.byteswap()
+    return zlib.compress(data.tobytes(), 6)
+
+
+def _decode(blob: bytes, typecode: str, parts: int) -> List[array]:
+    data = array(typecode)
+    data.frombytes(zlib.decompress(blob))
+    if sys.byteorder != "little":
+        data.byteswap()
+    n = len(data) // parts
+    return [array("d", data[i * n:(i + 1) * n]) for i in range(parts)]
+
+
+def store_pyramids(conn: sqlite3.Connection, session_id: int, pyramids: Dict[str, Dict[int, Tuple[array, ...]]]) -> None:
+    """Replace a session's pyramids (times as float64, channel levels as float32). Does not commit."""
+    conn.execute("DELETE FROM channel_pyramids WHERE session_id = ?", (session_id,))
+    conn.executemany(
+        """
+        INSERT INTO channel_pyramids (session_id, channel, factor, points, data)
+        SELECT ?, ?, ?, ?, ? WHERE EXISTS (SELECT 1 FROM sessions WHERE id = ?)
+        """,
+        [
+            (
+                session_id, channel, factor, len(parts[0]),
+                _encode(parts, "d" if channel == TIME_CHANNEL else "f"),
+                session_id,
+            )
+            for channel, levels in pyramids.items()
+            for factor, parts in levels.items()
+        ],
+    )
+
+
+def build_session_pyramids(conn: sqlite3.Connection, session_id: int, channels: Sequence[str] = PYRAMID_CHANNELS) -> None:
+    """Read a session's `.ibt` and store its pyramids. Commits; OSError if the file is gone."""
+    cur = conn.cursor()
+    cur.execute("SELECT file_path FROM sessions WHERE id = ?", (session_id,))
+    row = cur.fetchone()
+    if row is None:
+        raise KeyError(f"Unknown session: {session_id}")
+    if not Path(row[0]).exists():
+        raise FileNotFoundError(row[0])
+    init_pyramid_table(conn)
+    store_pyramids(conn, session_id, compute_pyramids(row[0], channels))
+    conn.commit()
+
+
+# ── Reading ─────────────────────────────────────────────────────────
+
+def _load_level(conn: sqlite3.Connection, session_id: int, channel: str, factor: int) -> Optional[List[array]]:
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT data FROM channel_pyramids WHERE session_id = ? AND channel = ? AND factor = ?",
+        (session_id, channel, factor),
+    )
+    row = cur.fetchone()
+    if row is None:
+        return None
+    return _decode(row[0], "d" if channel == TIME_CHANNEL else "f", 1 if channel == TIME_CHANNEL else 3)
+
+
+def _raw_window(file_path: str, channel: str, start_time: float, end_time: float) -> PyramidLevel:
+    reader = open_telemetry(file_path)
+    if isinstance(reader, ArchiveReader):
+        # Archives decode only the chunks covering the window
+        columns = reader.read_columns([TIME_CHANNEL, channel], start_time, end_time)
+        values = array("d", map(float, columns[channel]))
+        return PyramidLevel(1, array("d", columns[TIME_CHANNEL]), values, values, values)
+    times, values = array("d"), array("d")
+    for record in reader.iter_records([TIME_CHANNEL, channel]):
+        t = record[TIME_CHANNEL]
+        if t > end_time:
+            break
+        if t >= start_time:
+            times.append(t)
+            values.append(float(record[channel]))
+    return PyramidLevel(1, times, values, values, values)
+
+
+def get_pyramid_window(
+    conn: sqlite3.Connection,
+    session_id: int,
+    channel: str,
+    start_time: float,
+    end_time: float,
+    pixels: int,
+) -> PyramidLevel:
+    """The coarsest level with at least one bucket per pixel over `start_time..end_time`.
+
+    Builds the session's pyramids first if they are missing (so must not be
+    called inside a read transaction). Returns raw samples (`factor == 1`)
+    when the span is narrower than `pixels * BASE_FACTOR` samples, and an
+    empty level if the channel isn't in the file.
+    """
+    cur = conn.cursor()
+    init_pyramid_table(conn)
+    cur.execute(
+        "SELECT factor, points FROM channel_pyramids WHERE session_id = ? AND channel = ? ORDER BY factor",
+        (session_id, TIME_CHANNEL),
+    )
+    factors = [int(factor) for factor, _ in cur.fetchall()]
+    if not factors:
+        build_session_pyramids(conn, session_id)
+        cur.execute(
+            "SELECT factor FROM channel_pyramids WHERE session_id = ? AND channel = ? ORDER BY factor",
+            (session_id, TIME_CHANNEL),
+        )
+        factors = [int(row[0]) for row in cur.fetchall()]
+    empty = PyramidLevel(0, array("d"), array("d"), array("d"), array("d"))
+    if not factors:
+        return empty
+
+    # Sample count of the span, from the finest level's bucket start times
+    finest_times = _load_level(conn, session_id, TIME_CHANNEL, factors[0])[0]
+    span_samples = (bisect_right(finest_times, end_time) - bisect_left(finest_times, start_time)) * factors[0]
+    usable = [factor for factor in factors if span_samples // factor >= pixels]
+    if not usable:
+        cur.execute("SELECT file_path FROM sessions WHERE id = ?", (session_id,))
+        return _raw_window(cur.fetchone()[0], channel, start_time, end_time) if span_samples else empty
+
+    factor = usable[-1]
+    parts = _load_level(conn, session_id, channel, factor)
+    if parts is None:
+        return empty
+    times = finest_times if factor == factors[0] else _load_level(conn, session_id, TIME_CHANNEL, factor)[0]
+    # Include the bucket that straddles start_time
+    lo = max(bisect_right(times, start_time) - 1, 0)
+    hi = bisect_right(times, end_time)
+    return PyramidLevel(factor, times, *parts).slice(lo, hi)
@@ -0,0 +1,244 @@
+"""Re-derive clean flags and session clean metrics from stored lap rows.
+
+When `track_config.DEFAULT_MIN_TIMES` / `DEFAULT_MAX_TIMES` change, only the
+tracks whose sessions were ingested with different bounds need updating, and
+everything needed (lap times, complete/reset/official flags, reset
+positions) is already in the database. All updates are set-based SQL inside
+one transaction; no `.ibt` file is opened.
+
+The SQL mirrors `metrics.is_clean_lap`, `metrics.compute_clean_metrics` and
+`classification.classify_session`.
+"""
+from __future__ import annotations
+
+import math
+import sqlite3
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .db import next_data_version
+from .event_index import index_session_events
+from .heatmap import add_session_to_heatmap
+from .personal_bests import rebuild_personal_bests
+from .track_config import get_max_valid_lap_time, get_min_valid_lap_time
+
+Bounds = Tuple[float, float]
+
+_TEMP_TABLES = ("_rederive_bounds", "_rederive_target", "_rederive_clean", "_rederive_class")
+
+
+def _ensure_sqrt(conn: sqlite3.Connection) -> None:
+    # Math functions are optional in SQLite builds before 3.35
+    try:
+        conn.execute("SELECT sqrt(4.0)").fetchone()
+    except sqlite3.OperationalError:
+        conn.create_function("sqrt", 1, lambda x: math.sqrt(x) if x is not None and x >= 0 else None, deterministic=True)
+
+
+def backfill_track_ids(conn: sqlite3.Connection) -> int:
+    """Fill `sessions.track_id` for rows ingested before the column existed."""
+    from .ingest import _extract_track_id
+
+    cur = conn.cursor()
+    cur.execute("SELECT id, file_path FROM sessions WHERE track_id IS NULL")
+    updates = []
+    for session_id, file_path in cur.fetchall():
+        track_id = _extract_track_id(file_path)
+        if track_id:
+            updates.append((track_id, session_id))
+    cur.executemany("UPDATE sessions SET track_id = ? WHERE id = ?", updates)
+    # Sessions without a track were left out of the heatmap and event index
+    for _, session_id in updates:
+        add_session_to_heatmap(conn, session_id)
+        index_session_events(conn, session_id)
+    conn.commit()
+    return len(updates)
+
+
+def current_bounds(track_id: Optional[str]) -> Bounds:
+    return get_min_valid_lap_time(track_id), get_max_valid_lap_time(track_id)
+
+
+def changed_tracks(conn: sqlite3.Connection) -> Dict[Optional[str], Bounds]:
+    """Tracks with at least one session stored under bounds other than the current ones."""
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT DISTINCT track_id, min_valid_lap_time, max_valid_lap_time FROM sessions"
+    )
+    changed: Dict[Optional[str], Bounds] = {}
+    for track_id, min_time, max_time in cur.fetchall():
+        bounds = current_bounds(track_id)
+        if min_time is None or max_time is None or (float(min_time), float(max_time)) != bounds:
+            changed[track_id] = bounds
+    return changed
+
+
+def rederive_clean_metrics(
+    conn: sqlite3.Connection,
+    track_ids: Optional[Sequence[Optional[str]]] = None,
+) -> int:
+    """Recompute `laps.is_clean`, `sessions.clean_*` and `classified_session_type`.
+
+    `track_ids=None` re-derives only the tracks reported by `changed_tracks`.
+    Returns the number of sessions updated.
+    """
+    _ensure_sqrt(conn)
+    if track_ids is None:
+        bounds = changed_tracks(conn)
+    else:
+        bounds = {track_id: current_bounds(track_id) for track_id in track_ids}
+    if not bounds:
+        return 0
+
+    if conn.in_transaction:
+        conn.commit()
+    cur = conn.cursor()
+    for table in _TEMP_TABLES:
+        cur.execute(f"DROP TABLE IF EXISTS temp.{table}")
+
+    try:
+        cur.execute("BEGIN IMMEDIATE")
+        cur.execute("CREATE TEMP TABLE _rederive_bounds (track_id TEXT, min_t REAL, max_t REAL)")
+        cur.executemany(
+            "INSERT INTO _rederive_bounds VALUES (?, ?, ?)",
+            [(track_id, b[0], b[1]) for track_id, b in bounds.items()],
+        )
+        cur.execute(
+            """
+            CREATE TEMP TABLE _rederive_target AS
+            SELECT s.id AS session_id, b.min_t, b.max_t
+            FROM sessions s JOIN _rederive_bounds b ON s.track_id IS b.track_id
+            """
+        )
+        cur.execute("CREATE INDEX temp._rederive_target_sid ON _rederive_target(session_id)")
+
+        # laps.is_clean — metrics.is_clean_lap
+        cur.execute(
+            """
+            UPDATE laps SET is_clean = (
+                SELECT CASE
+                    WHEN laps.is_complete = 1 AND laps.is_reset = 0
+                         AND COALESCE(laps.has_official_time, 1) = 1
+                         AND laps.lap_time >= t.min_t
+                         AND (t.max_t <= 0 OR laps.lap_time <= t.max_t)
+                    THEN 1 ELSE 0 END
+                FROM _rederive_target t WHERE t.session_id = laps.session_id
+            )
+            WHERE session_id IN (SELECT session_id FROM _rederive_target)
+            """
+        )
+
+        # sessions.clean_* — metrics.compute_clean_metrics (population stddev)
+        cur.execute(
+            """
+            CREATE TEMP TABLE _rederive_clean AS
+            WITH clean AS (
+                SELECT l.session_id, l.lap_time,
+                       ROW_NUMBER() OVER (PARTITION BY l.session_id ORDER BY l.lap_time) AS rn,
+                       COUNT(*) OVER (PARTITION BY l.session_id) AS n,
+                       AVG(l.lap_time) OVER (PARTITION BY l.session_id) AS mean
+                FROM laps l JOIN _rederive_target t ON t.session_id = l.session_id
+                WHERE l.is_clean = 1
+            )
+            SELECT session_id,
+                   MAX(n) AS n,
+                   MIN(lap_time) AS best,
+                   AVG(CASE WHEN rn IN ((n + 1) / 2, (n + 2) / 2) THEN lap_time END) AS med,
+                   CASE WHEN MAX(n) > 1
+                        THEN sqrt(MAX(0.0, AVG((lap_time - mean) * (lap_time - mean))))
+                        ELSE 0.0 END AS sd
+            FROM clean
+            GROUP BY session_id
+            """
+        )
+
+        # classified_session_type — classification.classify_session
+        cur.execute(
+            """
+            CREATE TEMP TABLE _rederive_class AS
+            WITH flagged AS (
+                SELECT l.session_id, l.id, l.start_time, l.end_time,
+                       CASE WHEN l.is_complete = 1 AND l.is_reset = 0 AND l.lap_time >= t.min_t
+                            THEN 1 ELSE 0 END AS c
+                FROM laps l JOIN _rederive_target t ON t.session_id = l.session_id
+            ),
+            islands AS (
+                SELECT session_id, c,
+                       ROW_NUMBER() OVER (PARTITION BY session_id ORDER BY id)
+                       - ROW_NUMBER() OVER (PARTITION BY session_id, c ORDER BY id) AS grp
+                FROM flagged
+            ),
+            runs AS (
+                SELECT session_id, MAX(cnt) AS max_run FROM (
+                    SELECT session_id, grp, COUNT(*) AS cnt FROM islands WHERE c = 1
+                    GROUP BY session_id, grp
+                ) GROUP BY session_id
+            ),
+            spans AS (
+                SELECT session_id, COUNT(*) AS total, SUM(c) AS clean_count,
+                       MIN(id) AS first_id, MAX(id) AS last_id
+                FROM flagged GROUP BY session_id
+            ),
+            totals AS (
+                SELECT sp.session_id, sp.total, sp.clean_count,
+                       last_lap.end_time - first_lap.start_time AS duration
+                FROM spans sp
+                JOIN laps first_lap ON first_lap.id = sp.first_id
+                JOIN laps last_lap ON last_lap.id = sp.last_id
+            ),
+            resets AS (
+                SELECT r.session_id, COUNT(*) AS n, MAX(r.lap_dist_pct) - MIN(r.lap_dist_pct) AS pct_range
+                FROM reset_events r JOIN _rederive_target t ON t.session_id = r.session_id
+                GROUP BY r.session_id
+            )
+            SELECT t.session_id,
+                   CASE
+                       WHEN tt.total IS NULL OR tt.total = 0 THEN 'mixed'
+                       WHEN (tt.total - tt.clean_count) * 1.0 / tt.total > 0.6
+                            AND COALESCE(r.n, 0) > 0
+                            AND (CASE WHEN r.n > 1 THEN r.pct_range ELSE 0.0 END) < 0.3
+                           THEN 'corner_isolation'
+                       WHEN tt.clean_count >= 10 AND tt.duration > 1200 AND COALESCE(ru.max_run, 0) >= 10
+                           THEN 'race_sim'
+                       WHEN tt.clean_count * 1.0 / tt.total > 0.6 THEN 'hot_laps'
+                       ELSE 'mixed'
+                   END AS session_type
+            FROM _rederive_target t
+            LEFT JOIN totals tt ON tt.session_id = t.session_id
+            LEFT JOIN runs ru ON ru.session_id = t.session_id
+            LEFT JOIN resets r ON r.session_id = t.session_id
+            """
+        )
+
+        cur.execute(
+            """
+            UPDATE sessions SET
+                clean_lap_count = COALESCE((SELECT n FROM _rederive_clean c WHERE c.session_id = sessions.id), 0),
+                clean_best_lap = COALESCE((SELECT best FROM _rederive_clean c WHERE c.session_id = sessions.id), 0.0),
+                clean_median_lap = COALESCE((SELECT med FROM _rederive_clean c WHERE c.session_id = sessions.id), 0.0),
+                clean_stddev_lap = COALESCE((SELECT sd FROM _rederive_clean c WHERE c.session_id = sessions.id), 0.0),
+                classified_session_type = (SELECT session_type FROM _rederive_class k WHERE k.session_id = sessions.id),
+                min_valid_lap_time = (SELECT min_t FROM _rederive_target t WHERE t.session_id = sessions.id),
+                max_valid_lap_time = (SELECT max_t FROM _rederive_target t WHERE t.session_id = sessions.id),
+                data_version = ?
+            WHERE id IN (SELECT session_id FROM _rederive_target)
+            """,
+            (next_data_version(conn),),
+        )
+        updated = cur.rowcount
+        # Clean flags feed the clean, sector and microsector PBs
+        rebuild_personal_bests(conn, [track_id for track_id in bounds if track_id])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        for table in _TEMP_TABLES:
+            cur.execute(f"DROP TABLE IF EXISTS temp.{table}")
+    return updated
+
+
+def describe_changes(bounds: Dict[Optional[str], Bounds]) -> List[str]:
+    return [
+        f"{track_id or '<unknown>'}: min {b[0]:g}s, max {b[1]:g}s"
+        for track_id, b in sorted(bounds.items(), key=lambda item: item[0] or "")
+    ]
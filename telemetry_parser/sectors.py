@@ -3,9 +3,16 @@ from __future__ import annotations
 from dataclasses import dataclass
 from typing import Dict, List, Sequence
 
+from .channel_plan import Stage
 from .segments import LapSegment
 from .track_config import Zone
 
+# Equal LapDistPct slices per lap for microsector timing
+MICROSECTOR_COUNT = 50
+
+SECTOR_STAGE = Stage("sector_times", ("SessionTime", "LapDistPct"))
+MICROSECTOR_STAGE = Stage("microsector_times", ("SessionTime", "LapDistPct"))
+
 
 @dataclass(frozen=True)
 class SectorTime:
@@ -70,6 +77,46 @@ def compute_sector_times(
     return results
 
 
+def compute_microsector_times(
+    session_time: Sequence[float],
+    lap_dist_pct: Sequence[float],
+    segments: Sequence[LapSegment],
+    count: int = MICROSECTOR_COUNT,
+) -> Dict[int, List[float]]:
+    """Time `count` equal LapDistPct slices of every complete lap.
+
+    Crossings are interpolated as for sector boundaries, in one sweep per
+    lap. Returns times by lap number; laps missing a crossing are skipped.
+    """
+    results: Dict[int, List[float]] = {}
+    for seg in segments:
+        if not seg.is_complete or seg.end_idx <= seg.start_idx:
+            continue
+
+        crossing_times: List[float] = [float(session_time[seg.start_idx])]
+        k = 1
+        for i in range(seg.start_idx, seg.end_idx):
+            if k >= count:
+                break
+            pct_before = float(lap_dist_pct[i])
+            pct_after = float(lap_dist_pct[i + 1])
+            # Skip wraps/resets and samples that don't move forward
+            if pct_after <= pct_before or (pct_after - pct_before) >= 0.5:
+                continue
+            while k < count and pct_before < k / count <= pct_after:
+                frac = (k / count - pct_before) / (pct_after - pct_before)
+                t_before = float(session_time[i])
+                crossing_times.append(t_before + frac * (float(session_time[i + 1]) - t_before))
+                k += 1
+        if k != count:
+            continue
+        crossing_times.append(float(session_time[seg.end_idx]))
+        results[seg.lap_number] = [
+            round(end - start, 4) for start, end in zip(crossing_times, crossing_times[1:])
+        ]
+    return results
+
+
 def _find_boundary_crossing(
     session_time: Sequence[float],
     lap_dist_pct: Sequence[float],
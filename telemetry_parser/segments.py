@@ -3,6 +3,7 @@ from __future__ import annotations
 from dataclasses import dataclass
 from typing import Iterable, List, Sequence
 
+from .channel_plan import Stage
 
 RESET_DROP_THRESHOLD = 0.05
 # If a "completed" lap is shorter than this, it's almost certainly a reset.
@@ -10,6 +11,9 @@ RESET_DROP_THRESHOLD = 0.05
 # lap_increment alone. The shortest real lap on any track is ~90s.
 RESET_MAX_DURATION = 60.0
 
+SEGMENT_STAGE = Stage("segment_laps", ("SessionTime", "Lap", "LapDistPct", "LapLastLapTime", "LapCompleted"))
+RESET_STAGE = Stage("detect_reset_events", ("Lap", "LapDistPct", "SessionTime"))
+
 
 @dataclass(frozen=True)
 class LapSegment:
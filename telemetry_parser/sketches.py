@@ -0,0 +1,267 @@
+"""Mergeable lap-time distribution sketches.
+
+A `LapTimeSketch` is a sparse histogram of lap times in 1 ms bins plus the
+exact count, sum, sum of squares, minimum and maximum. Sketches merge by
+adding bins, so the distribution of any window (a week, a month, an
+arbitrary date range) comes from merging the per-session or per-track-day
+sketches it covers instead of re-reading and sorting every lap.
+
+Best, worst, mean and standard deviation stay exact; percentiles are exact
+to the bin width (the sketch sees every lap rounded to the millisecond).
+
+`session_sketches` holds one sketch of clean lap times per session, written
+by `insert_session` and refreshed by `session_sketches_for` whenever a
+session's `data_version` moved on (clean flags re-derived, rows replaced).
+`track_day_sketches` is materialised by the site build per site track and
+day.
+"""
+from __future__ import annotations
+
+import math
+import sqlite3
+import sys
+from array import array
+from collections import defaultdict
+from struct import Struct
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+SKETCH_BIN_MS = 1
+
+# count, sum, sum of squares, min, max
+_HEADER = Struct("<Qdddd")
+
+
+class LapTimeSketch:
+    __slots__ = ("bins", "count", "total", "total_sq", "minimum", "maximum")
+
+    def __init__(self) -> None:
+        self.bins: Dict[int, int] = defaultdict(int)
+        self.count = 0
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.minimum = math.inf
+        self.maximum = -math.inf
+
+    @classmethod
+    def of(cls, values: Iterable[float]) -> "LapTimeSketch":
+        sketch = cls()
+        for value in values:
+            sketch.add(value)
+        return sketch
+
+    def add(self, value: float) -> None:
+        self.bins[int(round(value * 1000 / SKETCH_BIN_MS))] += 1
+        self.count += 1
+        self.total += value
+        self.total_sq += value * value
+        if value < self.minimum:
+            self.minimum = value
+        if value > self.maximum:
+            self.maximum = value
+
+    def merge(self, other: "LapTimeSketch") -> "LapTimeSketch":
+        """Fold `other` into this sketch in place; returns self."""
+        for key, n in other.bins.items():
+            self.bins[key] += n
+        self.count += other.count
+        self.total += other.total
+        self.total_sq += other.total_sq
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+        return self
+
+    @classmethod
+    def merged(cls, sketches: Iterable["LapTimeSketch"]) -> "LapTimeSketch":
+        result = cls()
+        for sketch in sketches:
+            result.merge(sketch)
+        return result
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    @property
+    def stddev(self) -> float:
+        """Population standard deviation (as `statistics.pstdev`)."""
+        if self.count < 2:
+            return 0.0
+        mean = self.total / self.count
+        return math.sqrt(max(self.total_sq / self.count - mean * mean, 0.0))
+
+    def quantiles(self, qs: Sequence[float]) -> List[float]:
+        """Linearly interpolated percentiles, as `metrics._percentile` on the binned values.
+
+        `qs` must be ascending; the median is `quantiles([0.5])`.
+        """
+        if not self.count:
+            return [0.0] * len(qs)
+        wanted: List[Tuple[int, float]] = []
+        for q in qs:
+            k = (self.count - 1) * q
+            wanted.append((int(k), k - int(k)))
+        ranks = sorted({f for f, _ in wanted} | {min(f + 1, self.count - 1) for f, _ in wanted})
+        value_at: Dict[int, float] = {}
+        seen = 0
+        i = 0
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            while i < len(ranks) and ranks[i] < seen:
+                value_at[ranks[i]] = key * SKETCH_BIN_MS / 1000
+                i += 1
+            if i == len(ranks):
+                break
+        out = []
+        for f, frac in wanted:
+            low = value_at[f]
+            high = value_at[min(f + 1, self.count - 1)]
+            out.append(low + (high - low) * frac)
+        return out
+
+    def to_bytes(self) -> bytes:
+        pairs = array("I")
+        for key in sorted(self.bins):
+            pairs.append(key)
+            pairs.append(self.bins[key])
+        if sys.byteorder != "little":
+            pairs.byteswap()
+        minimum = self.minimum if self.count else 0.0
+        maximum = self.maximum if self.count else 0.0
+        return _HEADER.pack(self.count, self.total, self.total_sq, minimum, maximum) + pairs.tobytes()
+
+    @classmethod
+    def from_bytes(cls, blob: bytes) -> "LapTimeSketch":
+        sketch = cls()
+        count, total, total_sq, minimum, maximum = _HEADER.unpack_from(blob)
+        if not count:
+            return sketch
+        pairs = array("I")
+        pairs.frombytes(blob[_HEADER.size:])
+        if sys.byteorder != "little":
+            pairs.byteswap()
+        sketch.bins.update(zip(pairs[0::2], pairs[1::2]))
+        sketch.count, sketch.total, sketch.total_sq = count, total, total_sq
+        sketch.minimum, sketch.maximum = minimum, maximum
+        return sketch
+
+
+def init_sketch_tables(conn: sqlite3.Connection) -> None:
+    cur = conn.cursor()
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS session_sketches (
+            session_id INTEGER PRIMARY KEY,
+            data_version INTEGER NOT NULL,
+            data BLOB NOT NULL,
+            FOREIGN KEY(session_id) REFERENCES sessions(id)
+        );
+        """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS track_day_sketches (
+            track TEXT NOT NULL,
+            date TEXT NOT NULL,
+            data BLOB NOT NULL,
+            PRIMARY KEY (track, date)
+        );
+        """
+    )
+
+
+# ── Per-session sketches ────────────────────────────────────────────
+
+def _sketches_from_laps(conn: sqlite3.Connection, session_ids: Sequence[int]) -> Dict[int, Tuple[int, LapTimeSketch]]:
+    """Clean-lap sketches (and the `data_version` they reflect) read from `laps`."""
+    cur = conn.cursor()
+    result: Dict[int, Tuple[int, LapTimeSketch]] = {}
+    for start in range(0, len(session_ids), 500):
+        chunk = session_ids[start:start + 500]
+        marks = ", ".join("?" for _ in chunk)
+        cur.execute(
+            f"SELECT id, COALESCE(data_version, 0) FROM sessions WHERE id IN ({marks})",
+            chunk,
+        )
+        for sid, version in cur.fetchall():
+            result[int(sid)] = (int(version), LapTimeSketch())
+        cur.execute(
+            f"""
+            SELECT session_id, lap_time FROM laps
+            WHERE session_id IN ({marks}) AND is_clean = 1 AND lap_time > 0
+            """,
+            chunk,
+        )
+        for sid, lap_time in cur.fetchall():
+            result[int(sid)][1].add(lap_time)
+    return result
+
+
+def store_session_sketches(conn: sqlite3.Connection, session_ids: Iterable[int]) -> None:
+    """(Re)compute and store the sketches of `session_ids`. Does not commit."""
+    fresh = _sketches_from_laps(conn, list(session_ids))
+    conn.executemany(
+        "INSERT OR REPLACE INTO session_sketches (session_id, data_version, data) VALUES (?, ?, ?)",
+        [(sid, version, sketch.to_bytes()) for sid, (version, sketch) in fresh.items()],
+    )
+
+
+def session_sketches_for(
+    conn: sqlite3.Connection, session_ids: Iterable[int]
+) -> Tuple[Dict[int, LapTimeSketch], List[int]]:
+    """Sketches of `session_ids`, plus the IDs whose stored sketch was missing or stale.
+
+    Stale sketches are rebuilt from `laps` but not written back, so this
+    is safe inside a read-only snapshot; pass the returned IDs to
+    `store_session_sketches` once writing is possible.
+    """
+    ids = [int(sid) for sid in session_ids]
+    cur = conn.cursor()
+    sketches: Dict[int, LapTimeSketch] = {}
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        cur.execute(
+            f"""
+            SELECT k.session_id, k.data FROM session_sketches k
+            JOIN sessions s ON s.id = k.session_id
+            WHERE k.session_id IN ({", ".join("?" for _ in chunk)})
+              AND k.data_version = COALESCE(s.data_version, 0)
+            """,
+            chunk,
+        )
+        for sid, blob in cur.fetchall():
+            sketches[int(sid)] = LapTimeSketch.from_bytes(blob)
+    stale = [sid for sid in ids if sid not in sketches]
+    for sid, (_, sketch) in _sketches_from_laps(conn, stale).items():
+        sketches[sid] = sketch
+    return sketches, stale
+
+
+# ── Per-track-day sketches ──────────────────────────────────────────
+
+def load_track_day_sketches(
+    conn: sqlite3.Connection, tracks: Optional[Iterable[str]] = None
+) -> Dict[Tuple[str, str], LapTimeSketch]:
+    cur = conn.cursor()
+    if tracks is None:
+        cur.execute("SELECT track, date, data FROM track_day_sketches")
+        rows = cur.fetchall()
+    else:
+        rows = []
+        for track in tracks:
+            cur.execute("SELECT track, date, data FROM track_day_sketches WHERE track = ?", (track,))
+            rows.extend(cur.fetchall())
+    return {(track, date_str): LapTimeSketch.from_bytes(blob) for track, date_str, blob in rows}
+
+
+def store_track_day_sketches(
+    conn: sqlite3.Connection,
+    sketches: Dict[Tuple[str, str], LapTimeSketch],
+    replace_all: bool = False,
+) -> None:
+    """Write track-day sketches; `replace_all` drops every existing row first. Does not commit."""
+    if replace_all:
+        conn.execute("DELETE FROM track_day_sketches")
+    conn.executemany(
+        "INSERT OR REPLACE INTO track_day_sketches (track, date, data) VALUES (?, ?, ?)",
+        [(track, date_str, sketch.to_bytes()) for (track, date_str), sketch in sketches.items()],
+    )
@@ -0,0 +1,359 @@
+"""Synthetic `.ibt` sessions for scale testing.
+
+Each track in `TRACK_PROFILES` gets a deterministic layout: corners with a
+turn angle and peak curvature, an apex speed from a lateral-grip limit and
+a braking/acceleration-limited speed profile between them (scaled to the
+track's nominal lap time), plus the heading and Lat/Lon path that layout
+implies. `generate_session` drives laps over that profile at the tick rate
+with per-lap pace noise and writes every channel ingest reads through
+`IBTWriter`, so files stream to disk whatever their length.
+
+Sessions start with an out-lap from the pit exit and end part-way through
+an in-lap. Resets (lap counter bumped, `LapLastLapTime` invalidated, back
+to the line), spins, off-tracks and big saves are injected at configurable
+per-lap rates with the channel signatures `segment_laps`,
+`detect_reset_events` and `detect_events` look for; spins and off-tracks
+also pulse `PlayerIncidents`. `scripts/generate_corpus.py` builds whole
+corpora from these.
+"""
+from __future__ import annotations
+
+import math
+import random
+from dataclasses import dataclass
+from datetime import datetime
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+from .ibt import VAR_TYPE_BOOL, VAR_TYPE_DOUBLE, VAR_TYPE_FLOAT, VAR_TYPE_INT, IBTWriter
+
+SYNTHETIC_CHANNELS = [
+    ("SessionTime", VAR_TYPE_DOUBLE, "s"),
+    ("Lap", VAR_TYPE_INT, ""),
+    ("LapDistPct", VAR_TYPE_FLOAT, "%"),
+    ("LapLastLapTime", VAR_TYPE_FLOAT, "s"),
+    ("LapCompleted", VAR_TYPE_INT, ""),
+    ("PlayerIncidents", VAR_TYPE_INT, ""),
+    ("LapBestLapTime", VAR_TYPE_FLOAT, "s"),
+    ("Speed", VAR_TYPE_FLOAT, "m/s"),
+    ("YawRate", VAR_TYPE_FLOAT, "rad/s"),
+    ("SteeringWheelAngle", VAR_TYPE_FLOAT, "rad"),
+    ("IsOnTrack", VAR_TYPE_BOOL, ""),
+    ("Throttle", VAR_TYPE_FLOAT, "%"),
+    ("Brake", VAR_TYPE_FLOAT, "%"),
+    ("Lat", VAR_TYPE_DOUBLE, "deg"),
+    ("Lon", VAR_TYPE_DOUBLE, "deg"),
+    ("Yaw", VAR_TYPE_FLOAT, "rad"),
+    ("VelocityX", VAR_TYPE_FLOAT, "m/s"),
+    ("VelocityY", VAR_TYPE_FLOAT, "m/s"),
+]
+
+CAR_PREFIX = "porsche9922cup"
+CAR_SCREEN_NAME = "Porsche 911 GT3 Cup (992)"
+
+MODEL_POINTS = 2000  # Grid resolution of a track model
+LATERAL_GRIP = 17.0  # m/s^2 at the apex
+BRAKING = 13.0  # m/s^2
+ACCELERATION = 5.5  # m/s^2
+STEERING_RATIO = 30.0  # Steering wheel radians per unit of curvature (1/m)
+EARTH_RADIUS = 6_371_000.0  # m
+
+
+@dataclass(frozen=True)
+class TrackProfile:
+    track_id: str
+    display_name: str
+    length: float  # m
+    lap_time: float  # s, nominal clean lap
+    corners: int
+    lat: float
+    lon: float
+
+
+TRACK_PROFILES = {
+    profile.track_id: profile
+    for profile in (
+        TrackProfile("spa 2024 up", "Circuit de Spa-Francorchamps", 7004.0, 139.5, 19, 50.437, 5.971),
+        TrackProfile("monza full", "Autodromo Nazionale Monza", 5793.0, 111.0, 11, 45.620, 9.281),
+        TrackProfile("nurburgring gp", "Nurburgring Grand-Prix-Strecke", 5148.0, 119.0, 15, 50.335, 6.947),
+        TrackProfile("barcelona gp", "Circuit de Barcelona-Catalunya", 4657.0, 113.0, 14, 41.570, 2.261),
+    )
+}
+
+
+@dataclass(frozen=True)
+class TrackModel:
+    """Per-grid-point values of a track's reference lap (grid point `i` is LapDistPct `i / points`)."""
+
+    profile: TrackProfile
+    speed: List[float]
+    throttle: List[float]
+    brake: List[float]
+    curvature: List[float]  # 1/m, signed (positive turns left)
+    heading: List[float]  # rad
+    lat: List[float]
+    lon: List[float]
+
+    @property
+    def points(self) -> int:
+        return len(self.speed)
+
+
+@dataclass
+class SessionSpec:
+    track_id: str
+    laps: int = 10  # timed laps between the out-lap and the in-lap
+    start_time: int = 0  # Unix seconds, written to the disk header
+    tick_rate: int = 60
+    seed: int = 0
+    pace_spread: float = 0.006  # lap-to-lap pace noise (fraction of speed)
+    reset_rate: float = 0.03  # per lap
+    spin_rate: float = 0.02
+    off_track_rate: float = 0.04
+    big_save_rate: float = 0.05
+
+
+@dataclass
+class SessionSummary:
+    path: str
+    records: int = 0
+    laps: int = 0  # completed timed laps
+    resets: int = 0
+    spins: int = 0
+    off_tracks: int = 0
+    big_saves: int = 0
+    incidents: int = 0
+    duration: float = 0.0  # s
+
+
+def session_file_name(track_id: str, when: datetime) -> str:
+    """iRacing's naming, which ingest parses the track and date from."""
+    return f"{CAR_PREFIX}_{track_id} {when.strftime('%Y-%m-%d %H-%M-%S')}.ibt"
+
+
+def session_info_yaml(profile: TrackProfile, laps: int) -> str:
+    return (
+        "WeekendInfo:\n"
+        f" TrackName: {profile.track_id}\n"
+        f" TrackDisplayName: {profile.display_name}\n"
+        f" TrackLength: {profile.length / 1000:.2f} km\n"
+        " EventType: Test\n"
+        "SessionInfo:\n"
+        " Sessions:\n"
+        " - SessionNum: 0\n"
+        f"   SessionLaps: {laps}\n"
+        "   SessionType: Offline Testing\n"
+        "DriverInfo:\n"
+        " DriverCarIdx: 0\n"
+        " Drivers:\n"
+        " - CarIdx: 0\n"
+        "   UserName: Synthetic Driver\n"
+        f"   CarScreenName: {CAR_SCREEN_NAME}\n"
+    )
+
+
+# ── Track models ────────────────────────────────────────────────────
+
+@lru_cache(maxsize=None)
+def track_model(track_id: str, points: int = MODEL_POINTS) -> TrackModel:
+    """The deterministic layout of a known track (KeyError otherwise)."""
+    profile = TRACK_PROFILES[track_id]
+    rnd = random.Random(track_id)
+    length = profile.length
+    ds = length / points
+
+    # Corners: position, turn angle, peak curvature; net turning is one full lap
+    positions = sorted(rnd.uniform(0.04, 0.96) for _ in range(profile.corners))
+    angles: List[float] = []
+    while sum(angles) < math.pi:
+        angles = [rnd.uniform(0.3, 2.6) * (1 if rnd.random() < 0.7 else -1) for _ in positions]
+    angles = [angle * 2 * math.pi / sum(angles) for angle in angles]
+    # Gentle enough that cornering yaw rates stay well below detect_events' big-save threshold
+    peaks = [rnd.uniform(0.004, 0.02) for _ in positions]
+
+    curvature = [0.0] * points
+    for pos, angle, peak in zip(positions, angles, peaks):
+        sigma = abs(angle) / (peak * math.sqrt(2 * math.pi))  # m, so the bump integrates to `angle`
+        centre = pos * length
+        for i in range(points):
+            d = (i * ds - centre + length / 2) % length - length / 2
+            if abs(d) < 4 * sigma:
+                curvature[i] += angle / (sigma * math.sqrt(2 * math.pi)) * math.exp(-0.5 * (d / sigma) ** 2)
+
+    # Speed: grip-limited apexes joined by braking and acceleration limits
+    top = 80.0
+    speed = [top] * points
+    for pos, peak in zip(positions, peaks):
+        apex_speed = math.sqrt(LATERAL_GRIP / peak)
+        centre = pos * length
+        for i in range(points):
+            d = (i * ds - centre + length / 2) % length - length / 2
+            limit = BRAKING if d < 0 else ACCELERATION
+            speed[i] = min(speed[i], math.sqrt(apex_speed * apex_speed + 2 * limit * abs(d)))
+    nominal = sum(ds / v for v in speed)
+    speed = [v * nominal / profile.lap_time for v in speed]
+
+    throttle, brake = [], []
+    for i in range(points):
+        dv = speed[(i + 1) % points] - speed[i - 1]
+        if dv < -0.05:
+            brake.append(min(1.0, -dv * 1.5))
+            throttle.append(0.0)
+        else:
+            brake.append(0.0)
+            throttle.append(1.0 if dv > 0.05 or speed[i] >= max(speed) * 0.98 else 0.6)
+
+    heading, xs, ys = [], [], []
+    theta = x = y = 0.0
+    for i in range(points):
+        heading.append(theta)
+        xs.append(x)
+        ys.append(y)
+        x += math.cos(theta) * ds
+        y += math.sin(theta) * ds
+        theta += curvature[i] * ds
+    # Close the loop
+    xs = [value - x * i / points for i, value in enumerate(xs)]
+    ys = [value - y * i / points for i, value in enumerate(ys)]
+    lat = [profile.lat + math.degrees(value / EARTH_RADIUS) for value in ys]
+    scale_x = EARTH_RADIUS * math.cos(math.radians(profile.lat))
+    lon = [profile.lon + math.degrees(value / scale_x) for value in xs]
+
+    return TrackModel(profile, speed, throttle, brake, curvature, heading, lat, lon)
+
+
+# ── Sessions ────────────────────────────────────────────────────────
+
+def _lap_events(spec: SessionSpec, rnd: random.Random) -> Tuple[Optional[float], List[Tuple[float, str]]]:
+    """(reset position or None, sorted (position, kind) of spins, off-tracks and big saves) for one lap."""
+    reset_at = rnd.uniform(0.05, 0.3) if rnd.random() < spec.reset_rate else None
+    events = []
+    for kind, rate in (("spin", spec.spin_rate), ("off_track", spec.off_track_rate), ("big_save", spec.big_save_rate)):
+        if rnd.random() < rate:
+            events.append((rnd.uniform(0.02, 0.98), kind))
+    events.sort()
+    if reset_at is not None:
+        events = [event for event in events if event[0] < reset_at]
+    return reset_at, events
+
+
+def generate_session(path: str, spec: SessionSpec) -> SessionSummary:
+    """Write one synthetic session to `path`."""
+    model = track_model(spec.track_id)
+    profile = model.profile
+    rnd = random.Random(spec.seed)
+    summary = SessionSummary(path)
+    dt = 1.0 / spec.tick_rate
+    points = model.points
+
+    session_time = rnd.uniform(0.0, 30.0)
+    lap_number = 0
+    completed = 0
+    last_lap_time = -1.0
+    best_lap_time = -1.0
+    pct = rnd.uniform(0.88, 0.96)  # pit exit
+    out_lap = True
+
+    with IBTWriter(
+        path,
+        SYNTHETIC_CHANNELS,
+        session_info_yaml(profile, spec.laps),
+        tick_rate=spec.tick_rate,
+        start_time=spec.start_time,
+    ) as writer:
+        timed_laps = 0
+        in_lap_end = rnd.uniform(0.2, 0.8)
+        while True:
+            in_lap = timed_laps >= spec.laps
+            pace = 1.0 + rnd.gauss(0.0, spec.pace_spread) if not out_lap else 0.9
+            reset_at, events = (None, []) if out_lap or in_lap else _lap_events(spec, rnd)
+            lap_start = session_time
+            event_kind, event_left, incident_pulse = None, 0, 0
+            slowdown = 1.0  # speed multiplier after a spin or off-track, recovering
+
+            while True:
+                if in_lap and pct >= in_lap_end:
+                    writer.session_lap_count = completed
+                    summary.records = writer.record_count
+                    summary.duration = session_time
+                    return summary
+
+                if event_kind is None and events and pct >= events[0][0]:
+                    _, event_kind = events.pop(0)
+                    event_left = int({"spin": 1.2, "off_track": 1.5, "big_save": 0.4}[event_kind] * spec.tick_rate)
+                    if event_kind == "spin":
+                        summary.spins += 1
+                        incident_pulse = 2
+                    elif event_kind == "off_track":
+                        summary.off_tracks += 1
+                        incident_pulse = 1
+                    else:
+                        summary.big_saves += 1
+                    summary.incidents += incident_pulse
+
+                i = int(pct * points) % points
+                speed = model.speed[i] * pace * slowdown
+                yaw_rate = speed * model.curvature[i]
+                steering = model.curvature[i] * STEERING_RATIO
+                on_track = True
+                if event_kind is not None:
+                    direction = 1.0 if model.curvature[i] >= 0 else -1.0
+                    if event_kind == "spin":
+                        slowdown = max(0.15, slowdown - 1.2 * dt)
+                        speed = max(model.speed[i] * pace * slowdown, 9.0)
+                        yaw_rate = 2.6 * direction
+                        steering = 0.2 * direction  # Not caught, so no big save first
+                    elif event_kind == "off_track":
+                        slowdown = max(0.7, slowdown - 0.3 * dt)
+                        on_track = False
+                    else:
+                        yaw_rate = 1.5 * direction
+                        steering = -0.6 * direction
+                    event_left -= 1
+                    if event_left <= 0:
+                        event_kind = None
+                elif slowdown < 1.0:
+                    slowdown = min(1.0, slowdown + 0.12 * dt)
+
+                writer.write_record((
+                    session_time,
+                    lap_number,
+                    pct,
+                    last_lap_time,
+                    completed,
+                    incident_pulse,
+                    best_lap_time,
+                    speed,
+                    yaw_rate,
+                    steering,
+                    on_track,
+                    model.throttle[i] if event_kind is None else 0.0,
+                    model.brake[i] if event_kind is None else 0.0,
+                    model.lat[i],
+                    model.lon[i],
+                    math.remainder(model.heading[i], 2 * math.pi),
+                    speed,
+                    0.0,
+                ))
+                incident_pulse = 0
+                session_time += dt
+                pct += speed * dt / profile.length
+
+                if reset_at is not None and pct >= reset_at:
+                    # Reset to the line: new lap number, no official time
+                    summary.resets += 1
+                    lap_number += 1
+                    last_lap_time = -1.0
+                    pct = 0.0
+                    break
+                if pct >= 1.0:
+                    pct -= 1.0
+                    lap_number += 1
+                    if not out_lap:
+                        completed += 1
+                        timed_laps += 1
+                        summary.laps += 1
+                        last_lap_time = session_time - lap_start
+                        best_lap_time = last_lap_time if best_lap_time < 0 else min(best_lap_time, last_lap_time)
+                    out_lap = False
+                    break
@@ -0,0 +1,211 @@
+"""Downsampled per-lap channel traces for charts.
+
+A trace is a lap's channels plotted against `LapDistPct`, decimated with
+Largest-Triangle-Three-Buckets (LTTB) to a fixed point budget per channel
+so peaks such as brake spikes survive. Traces are read from the session's
+`.ibt` in one pass and cached in `lap_traces` (keyed by lap ID), so later
+site builds only touch the telemetry for laps they haven't seen before.
+"""
+from __future__ import annotations
+
+import json
+import sqlite3
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Sequence, Tuple
+
+from .archive import TIME_CHANNEL, ArchiveReader, open_telemetry
+
+TRACE_CHANNELS = ("Speed", "Throttle", "Brake", "SteeringWheelAngle")
+DEFAULT_TRACE_POINTS = 600
+
+
+@dataclass(frozen=True)
+class TraceLap:
+    lap_id: int
+    session_id: int
+    file_path: str
+    start_time: float
+    end_time: float
+
+
+def init_lap_traces_table(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS lap_traces (
+            lap_id INTEGER PRIMARY KEY,
+            session_id INTEGER NOT NULL,
+            points INTEGER NOT NULL,
+            data TEXT NOT NULL,
+            FOREIGN KEY(session_id) REFERENCES sessions(id),
+            FOREIGN KEY(lap_id) REFERENCES laps(id)
+        );
+        """
+    )
+
+
+def lttb(x: Sequence[float], y: Sequence[float], threshold: int) -> List[int]:
+    """Indices of the points Largest-Triangle-Three-Buckets keeps.
+
+    The first and last points are always kept; each bucket in between
+    contributes the point forming the largest triangle with the previously
+    kept point and the average of the next bucket.
+    """
+    n = len(x)
+    if len(y) != n:
+        raise ValueError("x and y must be the same length")
+    if threshold < 3:
+        raise ValueError("threshold must be at least 3")
+    if n <= threshold:
+        return list(range(n))
+
+    every = (n - 2) / (threshold - 2)
+    kept = [0]
+    a = 0
+    for i in range(threshold - 2):
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        span = next_end - next_start
+        avg_x = sum(x[next_start:next_end]) / span
+        avg_y = sum(y[next_start:next_end]) / span
+
+        ax, ay = x[a], y[a]
+        best = start = int(i * every) + 1
+        best_area = -1.0
+        for j in range(start, int((i + 1) * every) + 1):
+            area = abs((ax - avg_x) * (y[j] - ay) - (ax - x[j]) * (avg_y - ay))
+            if area > best_area:
+                best_area = area
+                best = j
+        kept.append(best)
+        a = best
+    kept.append(n - 1)
+    return kept
+
+
+def read_lap_channels(
+    file_path: str,
+    laps: Sequence[Tuple[int, float, float]],
+    channels: Sequence[str] = TRACE_CHANNELS,
+) -> Tuple[Dict[int, Dict[str, array]], Dict[str, str]]:
+    """Slice `channels` for several laps out of one `.ibt` in a single pass.
+
+    `laps` holds `(key, start_time, end_time)` in session time, as stored in
+    the `laps` table. Returns `LapDistPct` plus every requested channel the
+    file has, per lap key, and the units of those channels. Laps without
+    records come back empty. Archives decode only the chunks spanning the
+    laps.
+    """
+    reader = open_telemetry(file_path)
+    names = ["LapDistPct"] + [
+        name for name in channels if name in reader.var_by_name and name != "LapDistPct"
+    ]
+    windows = sorted(laps, key=lambda lap: lap[1])
+    out = {key: {name: array("d") for name in names} for key, _, _ in windows}
+    units = {name: reader.var_by_name[name].unit for name in names}
+
+    if not windows:
+        return out, units
+    if isinstance(reader, ArchiveReader):
+        # Archives decode only the chunks covering the laps
+        columns = reader.read_columns(
+            [TIME_CHANNEL] + names, windows[0][1], max(end for _, _, end in windows)
+        )
+    else:
+        columns = reader.read_columns([TIME_CHANNEL] + names)
+    times = columns[TIME_CHANNEL]
+
+    # Each record goes to the first lap, in start order, whose window holds it
+    hi = 0
+    for key, start, end in windows:
+        lo = max(bisect_left(times, start), hi)
+        hi = max(bisect_right(times, end), lo)
+        for name in names:
+            out[key][name].extend(map(float, columns[name][lo:hi]))
+    return out, units
+
+
+def build_trace(columns: Dict[str, Sequence[float]], units: Dict[str, str], points: int) -> Dict:
+    """Decimate each channel of one lap against `LapDistPct`."""
+    x = columns["LapDistPct"]
+    traces: Dict[str, List[List[float]]] = {}
+    for name, y in columns.items():
+        if name == "LapDistPct":
+            continue
+        traces[name] = [[round(x[j], 4), round(y[j], 3)] for j in lttb(x, y, points)] if len(x) else []
+    return {
+        "units": {name: units.get(name, "") for name in traces},
+        "channels": traces,
+    }
+
+
+def load_cached_traces(conn: sqlite3.Connection, lap_ids: Sequence[int], points: int) -> Dict[int, Dict]:
+    cached: Dict[int, Dict] = {}
+    cur = conn.cursor()
+    for lap_id in lap_ids:
+        cur.execute("SELECT data FROM lap_traces WHERE lap_id = ? AND points = ?", (lap_id, points))
+        row = cur.fetchone()
+        if row:
+            cached[lap_id] = json.loads(row[0])
+    return cached
+
+
+def store_traces(conn: sqlite3.Connection, traces: Dict[int, Tuple[int, Dict]], points: int) -> None:
+    """Cache `{lap_id: (session_id, trace)}`, skipping laps deleted meanwhile."""
+    conn.executemany(
+        """
+        INSERT OR REPLACE INTO lap_traces (lap_id, session_id, points, data)
+        SELECT ?, ?, ?, ? WHERE EXISTS (SELECT 1 FROM laps WHERE id = ?)
+        """,
+        [
+            (lap_id, session_id, points, json.dumps(trace, separators=(",", ":")), lap_id)
+            for lap_id, (session_id, trace) in traces.items()
+        ],
+    )
+    conn.commit()
+
+
+def get_lap_traces(
+    conn: sqlite3.Connection,
+    laps: Sequence[TraceLap],
+    points: int = DEFAULT_TRACE_POINTS,
+) -> Tuple[Dict[int, Dict], int]:
+    """Traces for `laps` from the cache, reading each missing session's `.ibt` once.
+
+    Returns the traces by lap ID and how many laps had to be skipped because
+    their telemetry file is gone or unreadable. Must not be called inside a
+    read transaction: fresh traces are written back to the cache.
+    """
+    init_lap_traces_table(conn)
+    traces = load_cached_traces(conn, [lap.lap_id for lap in laps], points)
+
+    missing: Dict[Tuple[int, str], List[TraceLap]] = defaultdict(list)
+    for lap in laps:
+        if lap.lap_id not in traces:
+            missing[(lap.session_id, lap.file_path)].append(lap)
+
+    fresh: Dict[int, Tuple[int, Dict]] = {}
+    skipped = 0
+    for (session_id, file_path), session_laps in missing.items():
+        if not Path(file_path).exists():
+            skipped += len(session_laps)
+            continue
+        try:
+            columns_by_lap, units = read_lap_channels(
+                file_path, [(lap.lap_id, lap.start_time, lap.end_time) for lap in session_laps]
+            )
+        except (OSError, ValueError, KeyError) as exc:
+            print(f"  Warning: could not read traces from {file_path}: {exc}")
+            skipped += len(session_laps)
+            continue
+        for lap in session_laps:
+            trace = build_trace(columns_by_lap[lap.lap_id], units, points)
+            traces[lap.lap_id] = trace
+            fresh[lap.lap_id] = (session_id, trace)
+
+    if fresh:
+        store_traces(conn, fresh, points)
+    return traces, skipped
@@ -0,0 +1,293 @@
+"""Track outlines reconstructed from telemetry, cached once per track.
+
+A lap's path comes from `Lat`/`Lon` when the file has them (projected to
+metres around a fixed origin), otherwise from integrating the car's
+velocity over `SessionTime`: `VelocityX`/`VelocityY` (or `Speed` alone)
+rotated into the world frame by `Yaw`. Integrated laps drift, so each one
+starts at the start/finish line and has its closing error spread evenly
+along the lap. Every lap is resampled onto the `LapDistPct` grid and the
+valid laps of a track's most recent sessions are averaged into one
+outline, stored in `track_maps`.
+
+`TrackMap.position(pct)` maps LapDistPct to x/y (metres, +y north for
+Lat/Lon maps) by interpolating between grid points, so events, resets and
+microsector deltas can be placed on the outline without touching any
+`.ibt`. `get_track_map` builds a missing map on demand;
+`scripts/build_track_maps.py` builds or refreshes them ahead of time.
+"""
+from __future__ import annotations
+
+import math
+import sqlite3
+import sys
+import time
+import zlib
+from array import array
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from .archive import open_telemetry
+from .channel_plan import Stage, plan_channels
+from .distance import DEFAULT_GRID_SIZE, pct_grid, resample_lap
+from .metrics import is_valid_lap
+from .segments import SEGMENT_STAGE, segment_laps
+
+SOURCE_LATLON = "latlon"
+SOURCE_VELOCITY = "velocity"
+
+MAP_SESSIONS = 5  # Most recent sessions fused into a track's outline
+EARTH_RADIUS = 6_371_000.0  # m
+
+_PATH_STAGES = {
+    SOURCE_LATLON: Stage("latlon_path", ("Lat", "Lon")),
+    SOURCE_VELOCITY: Stage("velocity_path", ("Yaw",), ("VelocityX", "VelocityY", "Speed")),
+}
+
+
+@dataclass
+class TrackMap:
+    """A track outline: `xs[i]`, `ys[i]` is the position at LapDistPct `i / (len(xs) - 1)`."""
+
+    track_id: str
+    source: str
+    laps: int
+    xs: array
+    ys: array
+
+    def position(self, pct: float) -> Tuple[float, float]:
+        """x/y of a LapDistPct (wrapped into 0..1)."""
+        pct %= 1.0
+        scaled = pct * (len(self.xs) - 1)
+        i = min(int(scaled), len(self.xs) - 2)
+        frac = scaled - i
+        return (
+            self.xs[i] + (self.xs[i + 1] - self.xs[i]) * frac,
+            self.ys[i] + (self.ys[i + 1] - self.ys[i]) * frac,
+        )
+
+    def positions(self, pcts: Iterable[float]) -> List[Tuple[float, float]]:
+        return [self.position(pct) for pct in pcts]
+
+    def bounds(self) -> Tuple[float, float, float, float]:
+        """(min_x, min_y, max_x, max_y)"""
+        return min(self.xs), min(self.ys), max(self.xs), max(self.ys)
+
+
+def init_track_map_table(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS track_maps (
+            track_id TEXT PRIMARY KEY,
+            source TEXT NOT NULL,
+            laps INTEGER NOT NULL,
+            sessions INTEGER NOT NULL,
+            points INTEGER NOT NULL,
+            created_at REAL NOT NULL,
+            data BLOB NOT NULL
+        );
+        """
+    )
+
+
+# ── Lap paths ───────────────────────────────────────────────────────
+
+def _latlon_path(lat: Sequence[float], lon: Sequence[float], origin: Tuple[float, float]) -> Tuple[List[float], List[float]]:
+    """Equirectangular projection around `origin` (lat, lon in degrees); exact enough for one circuit."""
+    lat0, lon0 = map(math.radians, origin)
+    scale_x = EARTH_RADIUS * math.cos(lat0)
+    xs = [scale_x * (math.radians(value) - lon0) for value in lon]
+    ys = [EARTH_RADIUS * (math.radians(value) - lat0) for value in lat]
+    return xs, ys
+
+
+def _integrated_path(
+    session_time: Sequence[float],
+    yaw: Sequence[float],
+    velocity_x: Sequence[float],
+    velocity_y: Optional[Sequence[float]],
+) -> Tuple[List[float], List[float]]:
+    """Dead-reckoned path from the start of the samples, closing error removed."""
+    x = y = 0.0
+    xs, ys = [0.0], [0.0]
+    for i in range(1, len(session_time)):
+        dt = session_time[i] - session_time[i - 1]
+        # Body-frame velocity (x forward, y left) rotated by the heading
+        vx, vy = velocity_x[i - 1], velocity_y[i - 1] if velocity_y is not None else 0.0
+        cos_yaw, sin_yaw = math.cos(yaw[i - 1]), math.sin(yaw[i - 1])
+        x += (vx * cos_yaw - vy * sin_yaw) * dt
+        y += (vx * sin_yaw + vy * cos_yaw) * dt
+        xs.append(x)
+        ys.append(y)
+    n = len(xs) - 1
+    if n > 0:
+        # A lap ends where it started
+        err_x, err_y = xs[-1] / n, ys[-1] / n
+        xs = [value - err_x * i for i, value in enumerate(xs)]
+        ys = [value - err_y * i for i, value in enumerate(ys)]
+    return xs, ys
+
+
+def _has_channels(source: str, names: Iterable[str]) -> bool:
+    names = set(names)
+    if source == SOURCE_LATLON:
+        return {"Lat", "Lon"} <= names
+    return "Yaw" in names and ("VelocityX" in names or "Speed" in names)
+
+
+def map_source(channel_names: Iterable[str]) -> Optional[str]:
+    """The best path source a file's channels allow, or None."""
+    names = set(channel_names)
+    for source in (SOURCE_LATLON, SOURCE_VELOCITY):
+        if _has_channels(source, names):
+            return source
+    return None
+
+
+def session_lap_paths(
+    file_path: str,
+    source: str,
+    min_valid_lap_time: float = 0.0,
+    max_valid_lap_time: float = 0.0,
+    origin: Optional[Tuple[float, float]] = None,
+    grid_size: int = DEFAULT_GRID_SIZE,
+) -> Tuple[List[Tuple[array, array]], Optional[Tuple[float, float]]]:
+    """`([(xs, ys) per valid lap on the grid], origin)`; `origin` is set from the first lap if not given."""
+    reader = open_telemetry(file_path)
+    if not _has_channels(source, reader.var_by_name):
+        return [], origin
+    channels = plan_channels(reader.var_by_name, [SEGMENT_STAGE, _PATH_STAGES[source]]).read(reader)
+    segments = segment_laps(
+        session_time=channels["SessionTime"],
+        lap=channels["Lap"],
+        lap_dist_pct=channels["LapDistPct"],
+        lap_last_lap_time=channels["LapLastLapTime"],
+        lap_completed=channels["LapCompleted"],
+    )
+
+    grid = pct_grid(grid_size)
+    paths: List[Tuple[array, array]] = []
+    for seg in segments:
+        if seg.end_idx <= seg.start_idx or not is_valid_lap(seg, min_valid_lap_time, max_valid_lap_time):
+            continue
+        lo, hi = seg.start_idx, seg.end_idx + 1
+        session_time = channels["SessionTime"][lo:hi]
+        if source == SOURCE_LATLON:
+            lat, lon = channels["Lat"][lo:hi], channels["Lon"][lo:hi]
+            if origin is None:
+                origin = (lat[0], lon[0])
+            xs, ys = _latlon_path(lat, lon, origin)
+        else:
+            velocity_x = channels.get("VelocityX", channels.get("Speed"))
+            velocity_y = channels.get("VelocityY") if "VelocityX" in channels else None
+            xs, ys = _integrated_path(
+                session_time,
+                channels["Yaw"][lo:hi],
+                velocity_x[lo:hi],
+                velocity_y[lo:hi] if velocity_y is not None else None,
+            )
+        resampled = resample_lap(session_time, channels["LapDistPct"][lo:hi], {"x": xs, "y": ys}, grid)
+        if "x" in resampled.channels:
+            paths.append((resampled.channels["x"], resampled.channels["y"]))
+    return paths, origin
+
+
+def fuse_paths(paths: Sequence[Tuple[Sequence[float], Sequence[float]]]) -> Tuple[array, array]:
+    """Point-wise mean of lap paths sampled on the same grid."""
+    size = len(paths[0][0])
+    xs, ys = array("d", bytes(8 * size)), array("d", bytes(8 * size))
+    for lap_xs, lap_ys in paths:
+        for i in range(size):
+            xs[i] += lap_xs[i]
+            ys[i] += lap_ys[i]
+    n = len(paths)
+    return array("d", (value / n for value in xs)), array("d", (value / n for value in ys))
+
+
+# ── Cache ───────────────────────────────────────────────────────────
+
+def _encode(xs: Sequence[float], ys: Sequence[float]) -> bytes:
+    data = array("f", xs)
+    data.extend(array("f", ys))
+    if sys.byteorder != "little":
+        data.byteswap()
+    return zlib.compress(data.tobytes(), 6)
+
+
+def _decode(blob: bytes) -> Tuple[array, array]:
+    data = array("f")
+    data.frombytes(zlib.decompress(blob))
+    if sys.byteorder != "little":
+        data.byteswap()
+    n = len(data) // 2
+    return array("d", data[:n]), array("d", data[n:])
+
+
+def load_track_map(conn: sqlite3.Connection, track_id: str) -> Optional[TrackMap]:
+    cur = conn.cursor()
+    cur.execute("SELECT source, laps, data FROM track_maps WHERE track_id = ?", (track_id,))
+    row = cur.fetchone()
+    if row is None:
+        return None
+    xs, ys = _decode(row[2])
+    return TrackMap(track_id, row[0], int(row[1]), xs, ys)
+
+
+def build_track_map(
+    conn: sqlite3.Connection,
+    track_id: str,
+    max_sessions: int = MAP_SESSIONS,
+    grid_size: int = DEFAULT_GRID_SIZE,
+) -> Optional[TrackMap]:
+    """Fuse the valid laps of the track's latest sessions with files on disk and store the outline.
+
+    Commits. Returns None if no session yields a valid lap with position channels.
+    """
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT file_path, COALESCE(min_valid_lap_time, 0), COALESCE(max_valid_lap_time, 0)
+        FROM sessions WHERE track_id = ? ORDER BY start_time DESC, id DESC
+        """,
+        (track_id,),
+    )
+    candidates = [(path, lo, hi) for path, lo, hi in cur.fetchall() if Path(path).exists()]
+    if not candidates:
+        return None
+
+    # Lat/Lon beats dead reckoning whenever the latest file has it
+    source = map_source(open_telemetry(candidates[0][0]).var_by_name)
+    if source is None:
+        return None
+    paths: List[Tuple[array, array]] = []
+    origin = None
+    sessions = 0
+    for path, lo, hi in candidates:
+        if sessions >= max_sessions:
+            break
+        lap_paths, origin = session_lap_paths(path, source, lo, hi, origin, grid_size)
+        if lap_paths:
+            paths.extend(lap_paths)
+            sessions += 1
+    if not paths:
+        return None
+
+    xs, ys = fuse_paths(paths)
+    conn.execute(
+        """
+        INSERT OR REPLACE INTO track_maps (track_id, source, laps, sessions, points, created_at, data)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        """,
+        (track_id, source, len(paths), sessions, grid_size, time.time(), _encode(xs, ys)),
+    )
+    conn.commit()
+    return TrackMap(track_id, source, len(paths), xs, ys)
+
+
+def get_track_map(conn: sqlite3.Connection, track_id: str) -> Optional[TrackMap]:
+    """The track's cached outline, built first if missing (so not inside a read transaction)."""
+    init_track_map_table(conn)
+    track_map = load_track_map(conn, track_id)
+    if track_map is None:
+        track_map = build_track_map(conn, track_id)
+    return track_map
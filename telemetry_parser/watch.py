@@ -0,0 +1,198 @@
+"""Watch a source folder and hand off `.ibt` files once iRacing has finished writing them.
+
+iRacing appends records while a session is live and only fills in the disk
+header `record_count` when the file is closed, so a file is considered
+finalized once its size has been stable for a settle period AND the header
+says the record block covers the file.
+
+Only polling is used (the standard library has no inotify binding); the poll
+interval is the main knob for how much work the watcher does on the sim PC.
+"""
+from __future__ import annotations
+
+import os
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+from .ibt import IBTReader
+
+
+@dataclass
+class _FileState:
+    size: int
+    mtime: float
+    stable_since: float
+
+
+def expected_file_size(reader: IBTReader) -> int:
+    """Byte offset where the last telemetry record ends, per the headers."""
+    if not reader.header or not reader.disk_header:
+        raise ValueError("IBTReader.read() must be called before computing the expected size")
+    return reader.header.var_bufs[0].buf_offset + reader.disk_header.record_count * reader.header.buf_len
+
+
+def is_finalized(path: str) -> bool:
+    """True when the disk header `record_count` accounts for the file's size."""
+    try:
+        size = os.path.getsize(path)
+        reader = IBTReader(path).read()
+    except (OSError, ValueError):
+        return False
+    if reader.disk_header.record_count <= 0 or reader.header.buf_len <= 0:
+        return False
+    return expected_file_size(reader) == size
+
+
+class FolderPoller:
+    """Track `.ibt` files under a folder and report the ones that stopped growing."""
+
+    def __init__(
+        self,
+        source: str,
+        settle_seconds: float = 10.0,
+        accept: Optional[Callable[[Path], bool]] = None,
+    ) -> None:
+        self.source = Path(source)
+        self.settle_seconds = settle_seconds
+        self.accept = accept
+        self._states: Dict[str, _FileState] = {}
+        self._done: set = set()
+
+    def mark_done(self, path: str) -> None:
+        self._done.add(path)
+        self._states.pop(path, None)
+
+    def poll(self, now: Optional[float] = None) -> list:
+        """Return paths that have been stable for the settle period and are finalized."""
+        now = time.monotonic() if now is None else now
+        ready = []
+        seen = set()
+        for path in self.source.rglob("*.ibt"):
+            key = str(path)
+            if key in self._done:
+                continue
+            if self.accept and not self.accept(path):
+                continue
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            seen.add(key)
+            state = self._states.get(key)
+            if state is None or state.size != stat.st_size or state.mtime != stat.st_mtime:
+                self._states[key] = _FileState(stat.st_size, stat.st_mtime, now)
+                continue
+            if now - state.stable_since < self.settle_seconds:
+                continue
+            if is_finalized(key):
+                ready.append(key)
+
+        # Forget files that were deleted or moved away
+        for key in list(self._states):
+            if key not in seen:
+                del self._states[key]
+        return sorted(ready)
+
+
+def watch_folder(
+    poller: FolderPoller,
+    handler: Callable[[str], None],
+    poll_interval: float = 5.0,
+    queue_size: int = 4,
+    on_idle: Optional[Callable[[], None]] = None,
+    idle_delay: float = 30.0,
+    stop_event: Optional[threading.Event] = None,
+    max_attempts: int = 5,
+    retry_delay: float = 30.0,
+) -> None:
+    """Poll `poller` forever and run `handler` on finalized files from a worker thread.
+
+    The work queue is bounded: when it is full, ready files are left for a
+    later poll instead of piling up. `on_idle` runs once the queue has been
+    drained and no file was handled for `idle_delay` seconds (debounced, so a
+    burst of files triggers a single call). A file whose handler raises (a
+    locked database, say) is queued again after `retry_delay` seconds,
+    doubling per failure, and given up on after `max_attempts` tries.
+    """
+    stop = stop_event or threading.Event()
+    work: "queue.Queue[str]" = queue.Queue(maxsize=max(1, queue_size))
+    queued: set = set()
+    handled: set = set()
+    failures: Dict[str, Tuple[int, float]] = {}  # path -> (failed attempts, monotonic time of next try)
+    lock = threading.Lock()
+    state = {"pending_idle": False, "last_done": 0.0}
+
+    def worker() -> None:
+        while not stop.is_set():
+            try:
+                path = work.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                handler(path)
+            except Exception as exc:  # keep the daemon alive on a bad file
+                with lock:
+                    queued.discard(path)
+                    attempts = failures.get(path, (0, 0.0))[0] + 1
+                    if attempts >= max_attempts:
+                        failures.pop(path, None)
+                        handled.add(path)
+                        poller.mark_done(path)
+                        print(f"Failed to ingest {path} ({attempts} attempts, giving up): {exc}")
+                    else:
+                        delay = retry_delay * 2 ** (attempts - 1)
+                        failures[path] = (attempts, time.monotonic() + delay)
+                        print(f"Failed to ingest {path} (attempt {attempts}, retrying in {delay:g}s): {exc}")
+            else:
+                with lock:
+                    queued.discard(path)
+                    failures.pop(path, None)
+                    handled.add(path)
+                    poller.mark_done(path)
+                    state["pending_idle"] = True
+                    state["last_done"] = time.monotonic()
+            finally:
+                work.task_done()
+
+    thread = threading.Thread(target=worker, name="ibt-ingest", daemon=True)
+    thread.start()
+
+    try:
+        while not stop.is_set():
+            for path in poller.poll():
+                with lock:
+                    if path in queued or path in handled:
+                        continue
+                    if path in failures and time.monotonic() < failures[path][1]:
+                        continue
+                    queued.add(path)
+                try:
+                    work.put_nowait(path)
+                except queue.Full:
+                    with lock:
+                        queued.discard(path)
+                    break
+
+            if on_idle is not None:
+                with lock:
+                    fire = (
+                        state["pending_idle"]
+                        and not queued
+                        and time.monotonic() - state["last_done"] >= idle_delay
+                    )
+                    if fire:
+                        state["pending_idle"] = False
+                if fire:
+                    try:
+                        on_idle()
+                    except Exception as exc:
+                        print(f"Idle hook failed: {exc}")
+
+            stop.wait(poll_interval)
+    finally:
+        stop.set()
+        thread.join(timeout=5.0)